@@ -0,0 +1,246 @@
+"""Dry-run plan of a batch: inventory, cost per proposal and wall time per worker count
+
+With check_roses_compliance.py --plan (or check_dapr_multi.py --plan), no checks
+are run. Each PDF is only opened far enough to read its trailer and page count,
+file names are matched to Proposal Master rows (or anonymized PDFs to full PDFs),
+and the report lists:
+
+    files that do not match a proposal number
+    estimated seconds per proposal (fitted to pages, from earlier runs)
+    predicted wall time for 1, 2, 4, 8, ... workers (largest proposals first,
+    as run_manifest.py and shards.py hand them out)
+
+Runs given --history <file> append one row per proposal (pages, seconds) to that
+throughput history file (--plan reads throughput_history.csv by default), so the
+estimates follow the speed of the machine and of the checks that are switched on
+(DAPR, DAPR + format, triage). Runs with a page store (-c) or read-ahead (-k) are
+not added, since reused pages and overlapped reads change the cost per page.
+
+Example (measured throughput of earlier runs):
+
+python batch_plan.py throughput_history.csv
+
+"""
+
+
+import sys, os, re, time, heapq
+import numpy as np
+import pandas as pd
+import argparse
+
+import fitz
+fitz.TOOLS.mupdf_display_errors(False)
+
+
+HISTORY_PATH = 'throughput_history.csv'
+HISTORY_COLUMNS = ['Date', 'Script', 'Mode', 'Prop_Nb', 'Pages', 'Seconds']
+
+### PROPOSALS OF EARLIER RUNS NEEDED FOR A FIT; ONLY THE LATEST ONES ARE USED
+MIN_HISTORY, MAX_HISTORY = 10, 2000
+
+### ASSUMED THROUGHPUT BEFORE ANY RUN HAS BEEN RECORDED (PAGES/SEC, SECONDS PER PROPOSAL)
+DEFAULT_PAGES_PER_SEC, DEFAULT_OVERHEAD = 20.0, 0.2
+
+WORKER_COUNTS = [1, 2, 4, 8, 16, 32]
+
+### NSPIRES PROPOSAL NUMBER IN A FILE NAME (E.G., 23-XRP23_2-0047)
+PROP_NB_PATTERN = re.compile(r'\d{2}-[A-Za-z0-9_]+?-\d{4}')
+
+
+def scan_pdfs(pdf_files, prop_nbs):
+
+    """
+    PURPOSE:    read page count and size of each PDF (trailer and page tree only, no page content)
+
+    INPUTS:     pdf_files = paths to proposal PDFs
+                prop_nbs = proposal number of each PDF
+
+    OUTPUTS:    dfs = DataFrame with Path, Prop_Nb, Pages, Bytes and Error (None if readable)
+    """
+
+    rows = []
+    for pval, prop_nb in zip(pdf_files, prop_nbs):
+        pages, error = 0, None
+        try:
+            with fitz.open(str(pval)) as d:
+                pages = d.page_count
+        except Exception as e:
+            error = str(e).strip().split('\n')[0]
+        rows.append({'Path': str(pval), 'Prop_Nb': prop_nb, 'Pages': pages, 'Bytes': os.path.getsize(pval), 'Error': error})
+
+    return pd.DataFrame(rows, columns=['Path', 'Prop_Nb', 'Pages', 'Bytes', 'Error'])
+
+
+def find_prop_nb(path):
+
+    """
+    PURPOSE:    find the NSPIRES proposal number in a file name
+
+    INPUTS:     path = path to PDF
+
+    OUTPUTS:    prop_nb = proposal number (str; '' if there is none)
+    """
+
+    m = PROP_NB_PATTERN.search(os.path.basename(str(path)))
+
+    return m.group(0).upper() if m else ''
+
+
+def load_history(history_path=HISTORY_PATH, script=None, mode=None):
+
+    """
+    PURPOSE:    load the latest per-proposal run times of earlier runs
+
+    INPUTS:     history_path = throughput history file
+                script, mode [optional] = only keep rows of this script/mode
+
+    OUTPUTS:    dfh = DataFrame with HISTORY_COLUMNS (at most MAX_HISTORY rows; empty if no history)
+    """
+
+    if not os.path.isfile(history_path):
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+
+    dfh = pd.read_csv(history_path, dtype={'Prop_Nb': str})
+    if script is not None:
+        dfh = dfh[dfh['Script'] == script]
+    if mode is not None:
+        dfh = dfh[dfh['Mode'] == mode]
+
+    return dfh.tail(MAX_HISTORY).reset_index(drop=True)
+
+
+def append_history(rows, history_path=HISTORY_PATH):
+
+    """
+    PURPOSE:    append the per-proposal run times of a run to the throughput history
+
+    INPUTS:     rows = list of dictionaries with Script, Mode, Prop_Nb, Pages, Seconds
+                history_path = throughput history file (created if needed)
+    """
+
+    if len(rows) == 0:
+        return
+
+    dfr = pd.DataFrame(rows)
+    dfr['Date'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    dfr[HISTORY_COLUMNS].to_csv(history_path, mode='a', header=not os.path.isfile(history_path), index=False)
+
+
+def fit_cost(dfh):
+
+    """
+    PURPOSE:    fit seconds per proposal = overhead + pages / pages_per_sec to earlier runs
+
+    INPUTS:     dfh = output of load_history
+
+    OUTPUTS:    overhead = seconds per proposal that do not depend on its length
+                pages_per_sec = measured throughput
+                n = number of proposals the fit is based on (0 = defaults used)
+    """
+
+    dfh = dfh[(dfh['Pages'] > 0) & (dfh['Seconds'] > 0)]
+    if len(dfh) < MIN_HISTORY:
+        return DEFAULT_OVERHEAD, DEFAULT_PAGES_PER_SEC, 0
+
+    pages, seconds = dfh['Pages'].values.astype(float), dfh['Seconds'].values.astype(float)
+    rate = pages.sum() / seconds.sum()
+
+    ### LINEAR FIT ONLY IF PAGE COUNTS VARY ENOUGH; OTHERWISE ALL TIME IS PER PAGE
+    overhead = 0.0
+    if np.ptp(pages) >= 5:
+        slope, icpt = np.polyfit(pages, seconds, 1)
+        if (slope > 0) and (icpt >= 0):
+            overhead, rate = icpt, 1 / slope
+
+    return float(overhead), float(rate), len(dfh)
+
+
+def predict_wall_time(costs, n_workers):
+
+    """
+    PURPOSE:    predict wall time of a batch when the largest proposals are handed out first
+
+    INPUTS:     costs = estimated seconds of each proposal
+                n_workers = number of worker processes
+
+    OUTPUTS:    seconds = time until the last worker is done
+    """
+
+    loads = [0.0] * max(int(n_workers), 1)
+    for c in sorted(costs, reverse=True):
+        heapq.heapreplace(loads, loads[0] + c)
+
+    return max(loads)
+
+
+def format_seconds(s):
+    """ h:mm:ss of a number of seconds (seconds if under a minute) """
+    if s < 60:
+        return f"{s:.1f} s"
+    s = int(round(s))
+    return f"{s // 3600}:{s % 3600 // 60:02d}:{s % 60:02d}"
+
+
+def print_plan(dfs, unmatched, cost, worker_counts=WORKER_COUNTS, output=None):
+
+    """
+    PURPOSE:    print inventory, per-proposal cost and predicted wall times of a batch
+
+    INPUTS:     dfs = output of scan_pdfs (proposals to check)
+                unmatched = list of (file, reason) of files that do not match a proposal
+                cost = output of fit_cost
+                worker_counts = worker counts to predict wall time for (only up to the number of proposals)
+                output [optional] = open file to print to (default = screen)
+    """
+
+    overhead, rate, n = cost
+    ok = dfs[dfs['Error'].isnull()]
+    costs = overhead + ok['Pages'].values / rate
+
+    print(f"\n\tPlan: {len(dfs)} PDFs, {int(ok['Pages'].sum())} pages, {dfs['Bytes'].sum() / 2**20:.1f} MB (no checks run)", file=output)
+
+    if len(unmatched) > 0:
+        print(f"\n\t{len(unmatched)} files do not match a proposal number:", file=output)
+        for f, reason in unmatched:
+            print(f"\t\t{os.path.basename(f)}\t{reason}", file=output)
+    bad = dfs[dfs['Error'].notnull()]
+    if len(bad) > 0:
+        print(f"\n\t{len(bad)} files cannot be opened:", file=output)
+        for i, row in bad.iterrows():
+            print(f"\t\t{os.path.basename(row['Path'])}\t{row['Error']}", file=output)
+
+    if n > 0:
+        print(f"\n\tCost model from {n} earlier proposals: {overhead:.2f} s + pages / {rate:.1f} pages/s", file=output)
+    else:
+        print(f"\n\tNo throughput history yet, assuming {overhead:.2f} s + pages / {rate:.1f} pages/s", file=output)
+    if len(costs) == 0:
+        print("", file=output)
+        return
+    print(f"\tEstimated per proposal: median {np.median(costs):.2f} s, max {np.max(costs):.2f} s "
+          f"({ok['Prop_Nb'].values[np.argmax(costs)]}, {int(ok['Pages'].values[np.argmax(costs)])} pages)", file=output)
+
+    print("\n\tWorkers\tWall time\tEfficiency", file=output)
+    serial = np.sum(costs)
+    for w in [x for x in worker_counts if (x == 1) or (x <= len(costs))]:
+        wall = predict_wall_time(costs, w)
+        print(f"\t{w}\t{format_seconds(wall)}\t\t{serial / (w * wall):.0%}", file=output)
+    print("", file=output)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Print the measured throughput of earlier runs by script and mode")
+    parser.add_argument("History_Path", type=str, nargs='?', help=f"throughput history file. Default is {HISTORY_PATH}.", default=HISTORY_PATH)
+    args = parser.parse_args()
+
+    if os.path.isfile(args.History_Path) == False:
+        print(f"\n\tNo throughput history found at {args.History_Path}\n\tQuitting program\n")
+        sys.exit()
+
+    DFH = pd.read_csv(args.History_Path, dtype={'Prop_Nb': str})
+    print(f"\n\tScript\t\t\t\tMode\tProposals\tCost model")
+    for (Script, Mode), DFG in DFH.groupby(['Script', 'Mode']):
+        Overhead, Rate, N = fit_cost(DFG.tail(MAX_HISTORY))
+        Model = f"{Overhead:.2f} s + pages / {Rate:.1f} pages/s" if N > 0 else f"fewer than {MIN_HISTORY} proposals"
+        print(f"\t{Script:<24}\t{Mode}\t{len(DFG)}\t\t{Model}")
+    print("")
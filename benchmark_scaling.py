@@ -0,0 +1,269 @@
+"""Scaling-curve benchmark for the check_roses_compliance.py checks
+
+Times the checks on generated proposal PDFs while sweeping the number of pages,
+the team size and the batch size, fits the empirical scaling exponent of each
+function (slope of log time vs. log size) and compares it with the stored baseline
+of the same sweep (quick and full sweeps have separate baselines, since exponents
+fitted over different size ranges are not comparable). The run fails (exit code 1)
+when an exponent got worse than the baseline by more than the tolerance, which
+catches accidentally superlinear code (e.g., string concatenation or pd.concat
+inside loops, or words x pages text extraction).
+
+Example:
+
+python benchmark_scaling.py                     # quick sweep, compare with the quick baseline in scaling_baseline.json
+python benchmark_scaling.py --full              # full sweep (10-500 pages, 1-14 members, 1-2000 proposals)
+python benchmark_scaling.py --full --update     # store the measured exponents as the new full-sweep baseline
+
+"""
+
+
+import sys, os, io, json, time, tempfile
+import numpy as np
+import pandas as pd
+import argparse
+
+import fitz
+fitz.TOOLS.mupdf_display_errors(False)
+
+from check_roses_compliance import clear_page_cache, get_pages, get_median_font, check_ref_type, check_dapr_words, check_proposal
+
+
+### SWEEP POINTS (QUICK AND FULL)
+### TEAM SIZE STOPS AT 14 BECAUSE THE PROPOSAL MASTER ONLY HAS 14 TEAM MEMBER COLUMNS
+SWEEPS = {'quick': {'pages': [20, 40, 80, 160], 'team': [1, 2, 4, 8, 14], 'batch': [2, 4, 8, 16]},
+          'full':  {'pages': [10, 25, 50, 100, 250, 500], 'team': [1, 2, 4, 8, 14], 'batch': [1, 10, 100, 500, 2000]}}
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scaling_baseline.json')
+
+LOREM = ("The observations will constrain the thermal structure of exoplanet atmospheres [12] "
+         "using new models of cloud formation in hot gas giants (Smith et al. 2020). ")
+
+
+def make_proposal(pdf_path, n_stm, team=()):
+
+    """
+    PURPOSE:    write a synthetic NSPIRES-style proposal PDF
+                (5 cover pages with project summary, budget, STM, references, other)
+
+    INPUTS:     pdf_path = path to write PDF to
+                n_stm = number of STM pages (int)
+                team = team member last names to mention in the STM text
+    """
+
+    doc = fitz.open()
+    for i in range(5):
+        page = doc.new_page()
+        page.insert_text((50, 72), "SECTION VII - Project Summary" if i == 2 else f"Cover page {i}", fontsize=11)
+    for i in range(3):
+        doc.new_page().insert_text((50, 72), "SECTION X - Budget", fontsize=11)
+    for i in range(n_stm):
+        name = team[i % len(team)] if len(team) > 0 else ''
+        lines = [LOREM[:95] + (f" {name} said he" if j == 5 else '') for j in range(40)]
+        doc.new_page().insert_textbox(fitz.Rect(40, 40, 580, 780), '\n'.join(lines), fontsize=12)
+    for i in range(2):
+        doc.new_page().insert_text((50, 72), "References\n[1] Smith et al. 2020", fontsize=11)
+    doc.new_page().insert_text((50, 72), "Data Management Plan", fontsize=11)
+    doc.new_page().insert_text((50, 72), "Budget Narrative", fontsize=11)
+    doc.save(pdf_path)
+
+
+def get_team(n_team, first=0):
+
+    """
+    PURPOSE:    make team member last names (letters only, so word matching sees whole words)
+
+    INPUTS:     n_team = number of team members (int)
+                first = index of the first name (int; proposals of a batch get different names)
+
+    OUTPUTS:    team = team member last names
+    """
+
+    return [f"Member{chr(65 + k // 676 % 26)}{chr(65 + k // 26 % 26)}{chr(65 + k % 26)}" for k in range(first, first + n_team)]
+
+
+def make_proposal_master(pm_path, prop_nbs, teams):
+
+    """
+    PURPOSE:    write a synthetic Proposal Master
+
+    INPUTS:     pm_path = path to write CSV to
+                prop_nbs = proposal numbers
+                teams = team member last names of each proposal (at most 14 each)
+    """
+
+    rows = []
+    for prop_nb, team in zip(prop_nbs, teams):
+        d = {'Response Number': prop_nb, 'PI Last Name': 'Doe, Jane', 'Linked Org': 'Example University',
+             'PI Company Name': 'Example University', 'PI City': 'Springfield, XX'}
+        for k, name in enumerate(team[:14]):
+            d[f'Member {k+1} Name'] = f'{name}, First'
+            d[f'Member {k+1} Organization'] = f'Institute {k+1}'
+        rows.append(d)
+    pd.DataFrame(rows).to_csv(pm_path, index=False)
+
+
+def make_batch(tmp_dir, n, n_team=4, n_stm=15):
+
+    """
+    PURPOSE:    write n distinct synthetic proposals (own proposal number and team each)
+                and one Proposal Master with all of them
+
+    INPUTS:     tmp_dir = directory for generated PDFs
+                n = number of proposals (int)
+                n_team = team members per proposal (int)
+                n_stm = STM pages per proposal (int)
+
+    OUTPUTS:    pdf_paths = paths to the proposal PDFs
+                prop_nbs = proposal numbers
+                pm_path = path to the Proposal Master
+    """
+
+    prop_nbs = [f'00-TEST00-{i + 1:04d}' for i in range(n)]
+    teams = [get_team(n_team, i * n_team) for i in range(n)]
+    pdf_paths = [os.path.join(tmp_dir, f'batch_{x}.pdf') for x in prop_nbs]
+    for pdf_path, team in zip(pdf_paths, teams):
+        make_proposal(pdf_path, n_stm, team)
+    pm_path = os.path.join(tmp_dir, 'pm_batch.csv')
+    make_proposal_master(pm_path, prop_nbs, teams)
+
+    return pdf_paths, prop_nbs, pm_path
+
+
+def time_call(func, repeat=3, doc=None):
+
+    """
+    PURPOSE:    time a function call (best of several repeats)
+
+    INPUTS:     func = function without arguments
+                repeat = number of repeats (int)
+                doc [optional] = fitz Document object whose page cache is cleared before each
+                                 repeat (so cached page text does not hide extraction time)
+
+    OUTPUTS:    t = best time (s)
+    """
+
+    t = np.inf
+    for r in range(repeat):
+        if doc is not None:
+            clear_page_cache(doc)
+        t0 = time.perf_counter()
+        func()
+        t = min(t, time.perf_counter() - t0)
+
+    return t
+
+
+def fit_exponent(sizes, times):
+
+    """
+    PURPOSE:    fit empirical scaling exponent (slope of log time vs. log size)
+
+    INPUTS:     sizes = sweep sizes
+                times = measured times
+
+    OUTPUTS:    k = scaling exponent (float)
+    """
+
+    return float(np.polyfit(np.log(sizes), np.log(np.maximum(times, 1e-6)), 1)[0])
+
+
+def run_sweeps(sweep, tmp_dir, repeat=3):
+
+    """
+    PURPOSE:    time each check over the page, team and batch sweeps
+
+    INPUTS:     sweep = dictionary of sweep points (see SWEEPS)
+                tmp_dir = directory for generated PDFs
+                repeat = number of repeats per point (int)
+
+    OUTPUTS:    results = dictionary of name -> (sizes, times)
+    """
+
+    sink, prop_nb = io.StringIO(), '00-TEST00-0001'
+    results = {}
+
+    ### PAGE COUNT SWEEP
+    pm_path, team = os.path.join(tmp_dir, 'pm_pages.csv'), get_team(4)
+    make_proposal_master(pm_path, [prop_nb], [team])
+    times = {'get_pages': [], 'get_median_font': [], 'check_ref_type': [], 'check_dapr_words(pages)': []}
+    for n in sweep['pages']:
+        pdf_path = os.path.join(tmp_dir, f'pages_{n}.pdf')
+        make_proposal(pdf_path, n, team)
+        doc = fitz.open(pdf_path)
+        stm, ref = [8, 8 + n - 1], [8 + n, 8 + n + 1]
+        times['get_pages'].append(time_call(lambda: get_pages(doc, stm_pl=n, output=sink), repeat, doc))
+        times['get_median_font'].append(time_call(lambda: get_median_font(doc, stm[0], stm[1], output=sink), repeat, doc))
+        times['check_ref_type'].append(time_call(lambda: check_ref_type(doc, stm[0], stm[1], output=sink), repeat, doc))
+        times['check_dapr_words(pages)'].append(time_call(lambda: check_dapr_words(doc, pm_path, prop_nb, stm, ref, sink), repeat, doc))
+    for key, val in times.items():
+        results[key] = (sweep['pages'], val)
+
+    ### TEAM SIZE SWEEP
+    pdf_path = os.path.join(tmp_dir, 'team.pdf')
+    make_proposal(pdf_path, 15, get_team(max(sweep['team'])))
+    doc = fitz.open(pdf_path)
+    val = []
+    for n in sweep['team']:
+        pm_path = os.path.join(tmp_dir, f'pm_team_{n}.csv')
+        make_proposal_master(pm_path, [prop_nb], [get_team(n)])
+        val.append(time_call(lambda: check_dapr_words(doc, pm_path, prop_nb, [8, 22], [23, 24], sink), repeat, doc))
+    results['check_dapr_words(team)'] = (sweep['team'], val)
+
+    ### BATCH SIZE SWEEP (DISTINCT PROPOSALS, SO NOTHING IS SHARED BETWEEN THEM BUT THE PROPOSAL MASTER)
+    pdf_paths, prop_nbs, pm_path = make_batch(tmp_dir, max(sweep['batch']))
+    val = []
+    for n in sweep['batch']:
+        val.append(time_call(lambda: [check_proposal(fitz.open(x), y, pm_path, output=sink) for x, y in zip(pdf_paths[:n], prop_nbs[:n])], 1))
+    results['check_proposal(batch)'] = (sweep['batch'], val)
+
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Fit scaling exponents of the checks and compare them with a stored baseline")
+    parser.add_argument("--full", action="store_true", help="run the full sweep (slow) instead of the quick one")
+    parser.add_argument("-b", "--baseline", type=str, help="path to baseline exponents (JSON)", default=BASELINE_PATH)
+    parser.add_argument("-t", "--tolerance", type=float, help="allowed increase of a scaling exponent. Default is 0.3.", default=0.3)
+    parser.add_argument("-r", "--repeat", type=int, help="repeats per sweep point (best time is used). Default is 3.", default=3)
+    parser.add_argument("--update", action="store_true", help="store the measured exponents as the new baseline of this sweep (quick or full)")
+    args = parser.parse_args()
+
+    Sweep = 'full' if args.full else 'quick'
+    with tempfile.TemporaryDirectory() as Tmp_Dir:
+        Results = run_sweeps(SWEEPS[Sweep], Tmp_Dir, repeat=args.repeat)
+
+    ### ONE BASELINE PER SWEEP
+    Baselines = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            Baselines = json.load(f)
+    Baseline = Baselines.get(Sweep, {})
+    if len(Baseline) == 0:
+        print(f"\n\tNo {Sweep} sweep baseline in {args.baseline} yet (store one with --update)")
+
+    ### FIT AND COMPARE EXPONENTS
+    Exponents, Failed = {}, []
+    print(f"\n\t{'Function (sweep)':<28}{'Exponent':>10}{'Baseline':>10}")
+    for Name, (Sizes, Times) in Results.items():
+        Exponents[Name] = round(fit_exponent(Sizes, Times), 3)
+        Base = Baseline.get(Name)
+        Status = ''
+        if (Base is not None) and (Exponents[Name] > Base + args.tolerance):
+            Status = '  <-- WORSE'
+            Failed.append(Name)
+        print(f"\t{Name:<28}{Exponents[Name]:>10.2f}{'' if Base is None else format(Base, '.2f'):>10}{Status}")
+        print(f"\t\t{', '.join(f'{s}: {t*1000:.0f} ms' for s, t in zip(Sizes, Times))}")
+
+    if args.update:
+        Baselines[Sweep] = Exponents
+        with open(args.baseline, 'w') as f:
+            json.dump(Baselines, f, indent=2)
+        print(f"\n\t{Sweep.capitalize()} sweep baseline written to {args.baseline}\n")
+        sys.exit(0)
+
+    if len(Failed) > 0:
+        print(f"\n\tScaling got worse for: {', '.join(Failed)}\n")
+        sys.exit(1)
+    print("\n\tNo scaling regressions\n")
@@ -1,11 +1,13 @@
 # ============== Import Packages ================
 
-import sys, os, glob, re, pdb
+import sys, os, glob, re, pdb, time
 import numpy as np
 import pandas as pd
 import argparse
 import fitz 
 fitz.TOOLS.mupdf_display_errors(False)
+from roses_rules import load_rules
+from batch_plan import scan_pdfs, find_prop_nb, load_history, append_history, fit_cost, print_plan, HISTORY_PATH
 
 
 # ============== Define Functions ===============
@@ -33,7 +35,7 @@ def get_text(d, pn):
     return t
 
 
-def check_ref_type(doc, ps, pe):
+def check_ref_type(doc, ps, pe, rules=None):
 
     """
     PURPOSE:    check if proposal uses bracketed references rather than "et al." references
@@ -46,6 +48,9 @@ def check_ref_type(doc, ps, pe):
                 n_etal = number  "et al." references used
     """
 
+    rules = load_rules() if rules is None else rules
+    th = rules['thresholds']
+
     ### GRAB TEXT OF STM SECTION
     tp = ''
     for n, nval in enumerate(np.arange(ps, pe)):    
@@ -62,7 +67,7 @@ def check_ref_type(doc, ps, pe):
             n_brac += 1
 
     ### ALSO GET NUMBER OF POSSIBLE PARENTHETICAL REFERENCES
-    ### MATCHES REQUIRE NUMBER WITHIN PARENTHASES < 200 (ASSUMES <200 REFS; HELPS CATCH YEARS IN PARENTHESIS)
+    ### MATCHES REQUIRE NUMBER WITHIN PARENTHASES < max_paren_ref_number (ASSUMES <200 REFS; HELPS CATCH YEARS IN PARENTHESIS)
     ### ValueError CATCHES SPECIAL CHARACTES THAT AREN'T ACTUALLY NUMBERS
     n_para = 0
     para_vals = [x for x in re.findall('\(([^)]+)', tp) if x.isnumeric()]
@@ -71,16 +76,16 @@ def check_ref_type(doc, ps, pe):
             int(val)
         except ValueError:
             continue
-        if int(val) < 200:
+        if int(val) < th['max_paren_ref_number']:
             n_para += 1
 
     ### CHECK FOR NUMBER OF ET AL REFERENCES
     n_etal = len([i.start() for i in re.finditer(r'\bet al\b', tp)])
 
     ### PRINT TO SCREEN
-    if n_brac < 10:
+    if n_brac < th['min_bracket_refs']:
         print("\n\t# [] refs:\t", str(n_brac))
-        if n_para > 20:
+        if n_para > th['min_paren_refs']:
             print("\tUsed () instead of []? # () refs:\t", str(n_para))
     else:
         print("\n\t# [] refs:\t", str(n_brac))
@@ -92,7 +97,7 @@ def check_ref_type(doc, ps, pe):
     return n_brac, n_etal, n_para
         
 
-def get_pages(d, rps, rpe, stm_pl=15):
+def get_pages(d, rps, rpe, stm_pl=15, rules=None):
 
     """
     PURPOSE:    identify sections of proposal (STM, references, other)
@@ -101,6 +106,7 @@ def get_pages(d, rps, rpe, stm_pl=15):
                 rps = start page of references in PDF (int)
                 rpe = end page of references in PDF (int)
                 stm_pl = number of pages in STM section (int; default=15)
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
 
     OUTPUTS:    stm_start = start page of STM section (int)
                 stm_end = end page of STM section (int)
@@ -109,6 +115,10 @@ def get_pages(d, rps, rpe, stm_pl=15):
                 pn = total number of pages (int)
     """
 
+    ### SECTION KEYWORD MATCHERS
+    rules = load_rules() if rules is None else rules
+    sec = rules['sections']
+
     ### GET TOTAL NUMBER OF PAGES IN PDF
     pn = d.page_count
 
@@ -125,18 +135,17 @@ def get_pages(d, rps, rpe, stm_pl=15):
             t2 = t2.lower()
 
             ### FIND START OF STM IF FULL NSPIRES PROPOSAL
-            if ('section x - budget' in t1) & ('section x - budget' not in t2):
+            if sec['nspires_budget'].any_in(t1) & (not sec['nspires_budget'].any_in(t2)):
                 stm_start = val + 1
                 continue
 
             ### FIND STM END AND REFERENCES START
-            if (stm_start != -100) & (('reference' in t2) & ('reference' not in t1)) | (('bibliography' in t2) & ('bibliography' not in t1)):
+            if (stm_start != -100) & sec['references'].new_in(t1, t2):
                 stm_end = val
                 ref_start = val + 1
                 
             ### FIND REF END 
-            w1, w2, w3, w4, w5, w6, w7, w8, w9 = 'redacted', 'summary of work effort', 'budget', 'budget narrative', 'total budget', 'table of work effort', 'data management', 'table of personnel', 'inclusion plan'
-            if (ref_start != -100) & ((w1 in t2) & (w1 not in t1)) | ((w2 in t2) & (w2 not in t1)) | ((w3 in t2) & (w3 not in t1)) | ((w4 in t2) & (w4 not in t1)) | ((w5 in t2) & (w5 not in t1)) | ((w6 in t2) & (w6 not in t1)) | ((w7 in t2) & (w7 not in t1)) | ((w8 in t2) & (w8 not in t1)) | ((w9 in t2) & (w9 not in t1)):
+            if ((ref_start != -100) & sec['redaction_marker'].new_in(t1, t2)) | sec['references_end'].new_in(t1, t2):
                 ref_end = val
                 if (ref_start != -100) & (ref_end > ref_start) & (stm_end - stm_start > stm_pl-5):
                     break
@@ -238,7 +247,7 @@ def get_team_info(team_info_path):
     return names, orgs, cities
 
 
-def check_dapr_words(doc, names, orgs, cities, stm_pages, ref_pages, pdf_full_path):
+def check_dapr_words(doc, names, orgs, cities, stm_pages, ref_pages, pdf_full_path, rules=None):
 
     """
     PURPOSE:    check for DAPR violation words
@@ -252,14 +261,18 @@ def check_dapr_words(doc, names, orgs, cities, stm_pages, ref_pages, pdf_full_pa
                 stm_pages = [start, end] pages of STM section
                 ref_pages = [start, end] pages of references section
                 pdf_full_path = path to full pdf with team member info and project summary
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
 
     OUTPUTS:    dww = DAPR violation words that were found
                 dwcc = number of times they were found
                 dwp = pages of proposal on which they were found
     """
 
+    rules = load_rules() if rules is None else rules
+    pjs_marker = rules['sections']['project_summary']
+
     ### COMBINE AND ADD GENDER PRONOUNS
-    dw_gp = ['she', 'he', 'her', 'hers', 'his', 'him']
+    dw_gp = rules['pronouns']
     dw = dw_gp + orgs + names + cities
     dw = np.unique(dw).tolist()
 
@@ -290,12 +303,12 @@ def check_dapr_words(doc, names, orgs, cities, stm_pages, ref_pages, pdf_full_pa
             ### GET PROJECT SUMMARY FROM FULL NSPIRES PDF
             pjs = 'on pages'
             if (n > doc.page_count - 1):
-                if ("SECTION VII - Project Summary" not in get_text(doc2, nval)):
+                if not pjs_marker.any_in((get_text(doc2, nval)).lower()):
                     continue
-                if ("SECTION VII - Project Summary" in get_text(doc2, nval)):
+                if pjs_marker.any_in((get_text(doc2, nval)).lower()):
                     pjs = 'in NSPIRES Project Summary on page'
                     tp = (get_text(doc2, nval)).lower()
-                    tp = tp[tp.index('section vii - project summary'):]
+                    tp = tp[pjs_marker.first(tp):]
 
             ### INDEX DAPR WORD
             wi = [[i.start(), i.end()] for i in re.finditer(r'\b' + re.escape(ival.lower()) + r'\b', tp)]
@@ -332,17 +345,43 @@ def check_dapr_words(doc, names, orgs, cities, stm_pages, ref_pages, pdf_full_pa
 parser = argparse.ArgumentParser()
 parser.add_argument("PDF_Anon_Path", type=str, help="path to anonymized proposal PDF")
 parser.add_argument("PDF_Full_Path", type=str, help="path to full proposals PDFs with team member info")
+parser.add_argument("-r", "--rules", type=str, help="rules file with section keywords, pronouns and thresholds. Default is roses_rules.json.", default=None)
+parser.add_argument("--plan", action="store_true", help="dry run: list anonymized/full PDF pairs whose proposal numbers do not match and predict run time per worker count without checking anything (see batch_plan.py)")
+parser.add_argument("--history", type=str, help=f"optional throughput history to add the run times of this run to and --plan estimates from. --plan default is {HISTORY_PATH}.", default=None)
 args = parser.parse_args()
 
+### LOAD AND CHECK RULES ONCE
+Rules = load_rules(args.rules)
+print(f"\n\tRules: {Rules['path']} (version {Rules['version']})")
+
 ### GET PROPOSALS (NEED TO CHECK IF ORDER HOLDS)
 anon_pdfs = np.sort(glob.glob(args.PDF_Anon_Path+'/*.pdf'))
 full_pdfs = np.sort(glob.glob(args.PDF_Full_Path+'/*.pdf'))
 
+### DRY RUN: PAGE COUNTS, PAIRS AND COST ESTIMATE ONLY
+### PAIRS ARE MADE IN SORTED ORDER, SO EVERY PAIR SHOULD HAVE THE SAME PROPOSAL NUMBER
+if args.plan:
+    Unmatched = []
+    for i in range(max(len(anon_pdfs), len(full_pdfs))):
+        if i >= len(full_pdfs):
+            Unmatched.append((str(anon_pdfs[i]), "no full proposal left to pair with"))
+        elif i >= len(anon_pdfs):
+            Unmatched.append((str(full_pdfs[i]), "no anonymized proposal left to pair with"))
+        elif find_prop_nb(anon_pdfs[i]) == '':
+            Unmatched.append((str(anon_pdfs[i]), "no proposal number in file name"))
+        elif find_prop_nb(anon_pdfs[i]) != find_prop_nb(full_pdfs[i]):
+            Unmatched.append((str(anon_pdfs[i]), f"paired with {os.path.basename(full_pdfs[i])}"))
+    Cost = fit_cost(load_history(args.history or HISTORY_PATH, 'check_dapr_multi', 'dapr'))
+    print_plan(scan_pdfs(anon_pdfs, [find_prop_nb(x) for x in anon_pdfs]), Unmatched, Cost)
+    sys.exit()
+
 if len(anon_pdfs) != len(full_pdfs):
     print("\n\tNumber of anonymized and full proposals are not equal, exiting program\n")
     exit()
 
+History = []
 for i, val in enumerate(anon_pdfs):
+    T_Prop = time.perf_counter()
 
     ### PRINT PROPOSALS BEING CONSIDERED
     print(f"\n\tChecking anonymized proposal:\t{anon_pdfs[i]}")
@@ -350,16 +389,21 @@ for i, val in enumerate(anon_pdfs):
 
     ### IDENTIFY STM PAGES AND REF PAGES OF PROPOSAL
     Doc = fitz.open(str(anon_pdfs[i]))
-    STM_Pages, Ref_Pages, Tot_Pages = get_pages(Doc, -99, -99)
+    STM_Pages, Ref_Pages, Tot_Pages = get_pages(Doc, -99, -99, rules=Rules)
 
     ### CHECK DAPR REFERENCING COMPLIANCE
-    N_Brac, N_EtAl, N_Para = check_ref_type(Doc, STM_Pages[0], STM_Pages[1])
+    N_Brac, N_EtAl, N_Para = check_ref_type(Doc, STM_Pages[0], STM_Pages[1], rules=Rules)
 
     ### GRAB TEAM INFO
     Names, Orgs, Cities = get_team_info(str(full_pdfs[i]))
 
     ### CHECK DAPR WORDS COMPLIANCE
-    DW, DWC, DWP = check_dapr_words(Doc, Names, Orgs, Cities, STM_Pages, Ref_Pages, str(full_pdfs[i]))
+    DW, DWC, DWP = check_dapr_words(Doc, Names, Orgs, Cities, STM_Pages, Ref_Pages, str(full_pdfs[i]), rules=Rules)
     print("\n\n\t==============")
+    History.append({'Script': 'check_dapr_multi', 'Mode': 'dapr', 'Prop_Nb': find_prop_nb(val), 'Pages': Doc.page_count,
+                    'Seconds': time.perf_counter() - T_Prop})
+
+if args.history:
+    append_history(History, args.history)
 
 
@@ -6,14 +6,21 @@ import pandas as pd
 import argparse
 import fitz 
 fitz.TOOLS.mupdf_display_errors(False)
+from concurrent.futures import ProcessPoolExecutor
+from roses_rules import load_rules
 
 
 # ============== Define Functions ===============
 
+### PAGE TEXT ALREADY EXTRACTED: (document name, page number) -> text
+_text_cache = {}
+
+
 def get_text(d, pn):
              
     """
     PURPOSE:    get the text from a given page of the proposal
+                (extracted once per page, then cached)
 
     INPUTS:     d = fitz Document object
                 pn = page number of text to grab
@@ -21,6 +28,9 @@ def get_text(d, pn):
     OUTPUTS:    t = page text
     """
 
+    if (d.name, int(pn)) in _text_cache:
+        return _text_cache[(d.name, int(pn))]
+
     ### LOAD PAGE
     p = d.load_page(int(pn))
 
@@ -29,11 +39,48 @@ def get_text(d, pn):
 
     ### FIX ENCODING
     t = t.encode('utf-8', 'replace').decode()
+    _text_cache[(d.name, int(pn))] = t
     
     return t
 
 
-def check_ref_type(doc, ps, pe):
+def extract_pages(task):
+
+    """
+    PURPOSE:    extract text of a range of pages with this process's own document handle
+
+    INPUTS:     task = (path to PDF, list of page numbers)
+
+    OUTPUTS:    texts = list of (page number, page text)
+    """
+
+    path, pages = task
+    doc = fitz.open(path)
+
+    return [(pn, get_text(doc, pn)) for pn in pages]
+
+
+def load_text_parallel(path, n_workers):
+
+    """
+    PURPOSE:    extract text of all pages of a (long) PDF in worker processes and
+                add it to the page text cache in page order
+
+    INPUTS:     path = path to PDF
+                n_workers = number of worker processes (int)
+    """
+
+    doc = fitz.open(path)
+
+    ### SEVERAL CONTIGUOUS PAGE RANGES PER WORKER SO SLOW PAGES (E.G., FIGURES) EVEN OUT
+    chunks = [x.tolist() for x in np.array_split(np.arange(doc.page_count), 4 * n_workers) if len(x) > 0]
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        for texts in pool.map(extract_pages, [(path, x) for x in chunks]):
+            for pn, t in texts:
+                _text_cache[(doc.name, pn)] = t
+
+
+def check_ref_type(doc, ps, pe, rules=None):
 
     """
     PURPOSE:    check if proposal uses bracketed references rather than "et al." references
@@ -41,11 +88,15 @@ def check_ref_type(doc, ps, pe):
     INPUTS:     doc = fitz Document object
                 ps = start page of STM section
                 pe = end page of STM section
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
 
     OUTPUTS:    n_brac = number bracketed references used
                 n_etal = number  "et al." references used
     """
 
+    rules = load_rules() if rules is None else rules
+    th = rules['thresholds']
+
     ### GRAB TEXT OF STM SECTION
     tp = ''
     for n, nval in enumerate(np.arange(ps, pe)):    
@@ -62,7 +113,7 @@ def check_ref_type(doc, ps, pe):
             n_brac += 1
 
     ### ALSO GET NUMBER OF POSSIBLE PARENTHETICAL REFERENCES
-    ### MATCHES REQUIRE NUMBER WITHIN PARENTHASES < 200 (ASSUMES <200 REFS; HELPS CATCH YEARS IN PARENTHESIS)
+    ### MATCHES REQUIRE NUMBER WITHIN PARENTHASES < max_paren_ref_number (ASSUMES <200 REFS; HELPS CATCH YEARS IN PARENTHESIS)
     ### ValueError CATCHES SPECIAL CHARACTES THAT AREN'T ACTUALLY NUMBERS
     n_para = 0
     para_vals = [x for x in re.findall('\(([^)]+)', tp) if x.isnumeric()]
@@ -71,16 +122,16 @@ def check_ref_type(doc, ps, pe):
             int(val)
         except ValueError:
             continue
-        if int(val) < 200:
+        if int(val) < th['max_paren_ref_number']:
             n_para += 1
 
     ### CHECK FOR NUMBER OF ET AL REFERENCES
     n_etal = len([i.start() for i in re.finditer(r'\bet al\b', tp)])
 
     ### PRINT TO SCREEN
-    if n_brac < 10:
+    if n_brac < th['min_bracket_refs']:
         print("\n\t# [] refs:\t", str(n_brac))
-        if n_para > 20:
+        if n_para > th['min_paren_refs']:
             print("\tUsed () instead of []? # () refs:\t", str(n_para))
     else:
         print("\n\t# [] refs:\t", str(n_brac))
@@ -92,7 +143,7 @@ def check_ref_type(doc, ps, pe):
     return n_brac, n_etal, n_para
         
 
-def get_pages(d, rps, rpe, stm_pl=15):
+def get_pages(d, rps, rpe, stm_pl=15, rules=None):
 
     """
     PURPOSE:    identify sections of proposal (STM, references, other)
@@ -101,6 +152,7 @@ def get_pages(d, rps, rpe, stm_pl=15):
                 rps = start page of references in PDF (int)
                 rpe = end page of references in PDF (int)
                 stm_pl = number of pages in STM section (int; default=15)
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
 
     OUTPUTS:    stm_start = start page of STM section (int)
                 stm_end = end page of STM section (int)
@@ -109,6 +161,10 @@ def get_pages(d, rps, rpe, stm_pl=15):
                 pn = total number of pages (int)
     """
 
+    ### SECTION KEYWORD MATCHERS
+    rules = load_rules() if rules is None else rules
+    sec = rules['sections']
+
     ### GET TOTAL NUMBER OF PAGES IN PDF
     pn = d.page_count
 
@@ -125,18 +181,17 @@ def get_pages(d, rps, rpe, stm_pl=15):
             t2 = t2.lower()
 
             ### FIND START OF STM IF FULL NSPIRES PROPOSAL
-            if ('section x - budget' in t1) & ('section x - budget' not in t2):
+            if sec['nspires_budget'].any_in(t1) & (not sec['nspires_budget'].any_in(t2)):
                 stm_start = val + 1
                 continue
 
             ### FIND STM END AND REFERENCES START
-            if (stm_start != -100) & (('reference' in t2) & ('reference' not in t1)) | (('bibliography' in t2) & ('bibliography' not in t1)):
+            if (stm_start != -100) & sec['references'].new_in(t1, t2):
                 stm_end = val
                 ref_start = val + 1
                 
             ### FIND REF END 
-            w1, w2, w3, w4, w5, w6, w7, w8, w9 = 'redacted', 'summary of work effort', 'budget', 'budget narrative', 'total budget', 'table of work effort', 'data management', 'table of personnel', 'inclusion plan'
-            if (ref_start != -100) & ((w1 in t2) & (w1 not in t1)) | ((w2 in t2) & (w2 not in t1)) | ((w3 in t2) & (w3 not in t1)) | ((w4 in t2) & (w4 not in t1)) | ((w5 in t2) & (w5 not in t1)) | ((w6 in t2) & (w6 not in t1)) | ((w7 in t2) & (w7 not in t1)) | ((w8 in t2) & (w8 not in t1)) | ((w9 in t2) & (w9 not in t1)):
+            if ((ref_start != -100) & sec['redaction_marker'].new_in(t1, t2)) | sec['references_end'].new_in(t1, t2):
                 ref_end = val
                 if (ref_start != -100) & (ref_end > ref_start) & (stm_end - stm_start > stm_pl-5):
                     break
@@ -238,7 +293,7 @@ def get_team_info(team_info_path):
     return names, orgs, cities
 
 
-def check_dapr_words(doc, names, orgs, cities, stm_pages, ref_pages, team_info_path):
+def check_dapr_words(doc, names, orgs, cities, stm_pages, ref_pages, team_info_path, rules=None):
 
     """
     PURPOSE:    check for DAPR violation words
@@ -253,14 +308,18 @@ def check_dapr_words(doc, names, orgs, cities, stm_pages, ref_pages, team_info_p
                 ref_pages = [start, end] pages of references section
                 team_info_path = path to CSV file with team member info OR
                                  NSPIRES-generated PDF with team member info in front matter
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
 
     OUTPUTS:    dww = DAPR violation words that were found
                 dwcc = number of times they were found
                 dwpp = pages of proposal on which they were found
     """
 
+    rules = load_rules() if rules is None else rules
+    pjs_marker = rules['sections']['project_summary']
+
     ### COMBINE AND ADD GENDER PRONOUNS
-    dw_gp = ['she', 'he', 'her', 'hers', 'his', 'him']
+    dw_gp = rules['pronouns']
     dw = dw_gp + orgs + names + cities
     dw = np.unique(dw).tolist()
 
@@ -293,12 +352,12 @@ def check_dapr_words(doc, names, orgs, cities, stm_pages, ref_pages, team_info_p
 
             ### GET PROJECT SUMMARY IF USING NSPIRES PDF FOR TEAM MEMBER INFO
             if (n > doc.page_count - 1):
-                if ("SECTION VII - Project Summary" not in get_text(doc2, nval)):
+                if not pjs_marker.any_in((get_text(doc2, nval)).lower()):
                     continue
-                if ("SECTION VII - Project Summary" in get_text(doc2, nval)):
+                if pjs_marker.any_in((get_text(doc2, nval)).lower()):
                     pjs = 'in NSPIRES Project Summary on page'
                     tp = (get_text(doc2, nval)).lower()
-                    tp = tp[tp.index('section vii - project summary'):]
+                    tp = tp[pjs_marker.first(tp):]
 
             ### INDEX DAPR WORD
             wi = [[i.start(), i.end()] for i in re.finditer(r'\b' + re.escape(ival.lower()) + r'\b', tp)]
@@ -332,24 +391,37 @@ def check_dapr_words(doc, names, orgs, cities, stm_pages, ref_pages, team_info_p
 
 # ====================== Main Code ========================
 
-### GET PATHS
-parser = argparse.ArgumentParser()
-parser.add_argument("PDF_Anon_Path", type=str, help="path to anonymized proposal PDF")
-parser.add_argument("Team_Info_Path", type=str, help="path to team info (NSPIRES cover pages or .csv file)")
-parser.add_argument('RefPgStart', nargs='?', default=-99, type=int, help="start page of references in PDF; optional")
-parser.add_argument('RefPgEnd', nargs='?', default=-99, type=int, help="end page of references in PDF; optional")
-args = parser.parse_args()
+if __name__ == "__main__":
+
+    ### GET PATHS
+    parser = argparse.ArgumentParser()
+    parser.add_argument("PDF_Anon_Path", type=str, help="path to anonymized proposal PDF")
+    parser.add_argument("Team_Info_Path", type=str, help="path to team info (NSPIRES cover pages or .csv file)")
+    parser.add_argument('RefPgStart', nargs='?', default=-99, type=int, help="start page of references in PDF; optional")
+    parser.add_argument('RefPgEnd', nargs='?', default=-99, type=int, help="end page of references in PDF; optional")
+    parser.add_argument("-r", "--rules", type=str, help="rules file with section keywords, pronouns and thresholds. Default is roses_rules.json.", default=None)
+    parser.add_argument("-n", "--n_workers", type=int, help="extract page text with this many worker processes (for very long PDFs). Default is 1 (off).", default=1)
+    args = parser.parse_args()
+
+    ### LOAD AND CHECK RULES ONCE
+    Rules = load_rules(args.rules)
+    print(f"\n\tRules: {Rules['path']} (version {Rules['version']})")
 
-### IDENTIFY STM PAGES AND REF PAGES OF PROPOSAL
-Doc = fitz.open(args.PDF_Anon_Path)
-STM_Pages, Ref_Pages, Tot_Pages = get_pages(Doc, args.RefPgStart, args.RefPgEnd)
+    ### EXTRACT ALL PAGE TEXT UP FRONT IN PARALLEL IF REQUESTED
+    if args.n_workers > 1:
+        load_text_parallel(args.PDF_Anon_Path, args.n_workers)
+        if args.Team_Info_Path.split('.')[-1] == 'pdf':
+            load_text_parallel(args.Team_Info_Path, args.n_workers)
 
-### CHECK DAPR REFERENCING COMPLIANCE
-N_Brac, N_EtAl, N_Para = check_ref_type(Doc, STM_Pages[0], STM_Pages[1])
+    ### IDENTIFY STM PAGES AND REF PAGES OF PROPOSAL
+    Doc = fitz.open(args.PDF_Anon_Path)
+    STM_Pages, Ref_Pages, Tot_Pages = get_pages(Doc, args.RefPgStart, args.RefPgEnd, rules=Rules)
 
-### GRAB TEAM INFO
-Names, Orgs, Cities = get_team_info(args.Team_Info_Path)
+    ### CHECK DAPR REFERENCING COMPLIANCE
+    N_Brac, N_EtAl, N_Para = check_ref_type(Doc, STM_Pages[0], STM_Pages[1], rules=Rules)
 
-### CHECK DAPR WORDS COMPLIANCE
-DW, DWC, DWP = check_dapr_words(Doc, Names, Orgs, Cities, STM_Pages, Ref_Pages, args.Team_Info_Path)
+    ### GRAB TEAM INFO
+    Names, Orgs, Cities = get_team_info(args.Team_Info_Path)
 
+    ### CHECK DAPR WORDS COMPLIANCE
+    DW, DWC, DWP = check_dapr_words(Doc, Names, Orgs, Cities, STM_Pages, Ref_Pages, args.Team_Info_Path, rules=Rules)
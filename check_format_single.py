@@ -1,6 +1,6 @@
 # ============== Import Packages ================
 
-import sys, os, glob, pdb
+import sys, os, io, glob, pdb, traceback
 import numpy as np
 import pandas as pd
 import argparse
@@ -11,10 +11,11 @@ from collections import Counter
 import datetime
 import unicodedata
 import textwrap
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
 
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
+from font_histograms import get_font_histogram, save_font_histogram, render_font_histogram
+from roses_rules import load_rules
 
 # ============== Define Functions ===============
 
@@ -39,13 +40,37 @@ def get_text(d, pn):
     return t
 
 
-def get_pages(d, flg, pl=15):
+def get_lines(d, pn):
+
+    """
+    PURPOSE:    get the text lines of a page with a box around each line
+                (text and boxes come from one text extraction)
+    INPUTS:     d = fitz Document object
+                pn = page number
+    OUTPUTS:    ln = lines of get_text(d, pn).split('\n')
+                boxes = [x0, y0, x1, y1] of each line (None where the lines do not line up)
+    """
+
+    ### LOAD PAGE AND EXTRACT TEXT PAGE ONCE
+    tp = d.load_page(int(pn)).get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+    ln = tp.extractText().encode('utf-8', 'replace').decode().split('\n')
+
+    ### PAGE TEXT IS THE LINES OF ALL TEXT BLOCKS, EACH FOLLOWED BY A NEWLINE
+    boxes = [list(l['bbox']) for b in tp.extractDICT()['blocks'] for l in b.get('lines', [])] + [None]
+    if len(boxes) != len(ln):
+        boxes = [None] * len(ln)
+
+    return ln, boxes
+
+
+def get_pages(d, flg, pl=15, rules=None):
 
     """
     PURPOSE:   find start and end pages of proposal within NSPIRES-formatted PDF
                [assumes proposal starts after budget, and references at end of proposal]
     INPUTS:    d  = fitz Document object
                pl = page limit of proposal (int; default = 15)
+               rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
     OUTPUTS:   pn = number of pages of proposal (int)
                ps = start page number (int)
                pe = end page number (int)
@@ -55,9 +80,17 @@ def get_pages(d, flg, pl=15):
     ### GET TOTAL NUMBER OF PAGES IN PDF
     pn = d.page_count
 
-    ### WORDS THAT INDICATE EXTRA STUFF BEFORE PROPOSAL STARTS
-    check_words = ["contents", "c o n t e n t s", "budget", "cost", "costs",
-                   "submitted to", "purposely left blank", "restrictive notice"]
+    ### WORDS THAT INDICATE EXTRA STUFF BEFORE PROPOSAL STARTS, AND REFERENCES HEADINGS
+    rules = load_rules() if rules is None else rules
+    check_words, ref_words = rules['sections']['front_matter'], rules['sections']['references_heading']
+    nspires_budget = rules['sections']['nspires_budget']
+
+    ### LOWER-CASE TEXT OF EACH PAGE LOOKED AT (EACH PAGE IS READ ONCE, HOWEVER OFTEN IT IS PROBED)
+    texts = {}
+    def page_text(val):
+        if val not in texts:
+            texts[val] = get_text(d, val).lower()
+        return texts[val]
 
     ### IF NO NSPIRES FRONT MATTER, SET START/END PAGES
     ps = 0
@@ -70,11 +103,11 @@ def get_pages(d, flg, pl=15):
         for i, val in enumerate(np.arange(pn)):
                 
             ### READ IN TEXT FROM THIS PAGE AND NEXT PAGE
-            t1 = get_text(d, val)
-            t2 = get_text(d, val + 1)
+            t1 = page_text(val)
+            t2 = page_text(val + 1)
 
             ### FIND PROPOSAL START USING END OF SECTION X IN NSPIRES
-            if ('SECTION X - Budget' in t1) & ('SECTION X - Budget' not in t2):
+            if nspires_budget.any_in(t1) & (not nspires_budget.any_in(t2)):
 
                 ### SET START PAGE
                 ps = val + 1
@@ -82,10 +115,10 @@ def get_pages(d, flg, pl=15):
                 ### ATTEMPT TO CORRECT FOR (ASSUMED-TO-BE SHORT) COVER PAGES
                 if len(t2) < 500:
                     ps += 1
-                    t2 = get_text(d, val + 2)
+                    t2 = page_text(val + 2)
 
                 ### ATTEMP TO ACCOUNT FOR TOC OR EXTRA SUMMARIES
-                if any([x in t2.lower() for x in check_words]):
+                if check_words.any_in(t2):
                     ps += 1
 
                 ### SET END PAGE ASSUMING AUTHORS USED FULL PAGE LIMIT
@@ -96,28 +129,27 @@ def get_pages(d, flg, pl=15):
                 break 
 
     ### ATTEMPT TO CORRECT FOR TOC > 1 PAGE OR SUMMARIES THAT WEREN'T CAUGHT ABOVE
-    if any([x in get_text(d, ps).lower() for x in check_words]):
+    if check_words.any_in(page_text(ps)):
         ps += 1
         pe += 1
 
     ### CHECK THAT PAGE AFTER END PAGE IS REFERENCES
-    Ref_Words = ['references', 'bibliography', "r e f e r e n c e s", "b i b l i o g r a p h y"]
-    if not any([x in get_text(d, pe + 1).lower() for x in Ref_Words]):
+    if not ref_words.any_in(page_text(pe + 1)):
 
         ### IF NOT, TRY NEXT PAGE (OR TWO) AND UPDATED LAST PAGE NUMBER
-        if any([x in get_text(d, pe + 2).lower() for x in Ref_Words]):
+        if ref_words.any_in(page_text(pe + 2)):
             pe += 1
-        elif any([x in get_text(d, pe + 3).lower() for x in Ref_Words]):
+        elif ref_words.any_in(page_text(pe + 3)):
             pe += 2
 
         ### CHECK THEY DIDN'T GO UNDER THE PAGE LIMIT
-        if any([x in get_text(d, pe).lower() for x in Ref_Words]):
+        if ref_words.any_in(page_text(pe)):
             pe -= 1
-        elif any([x in get_text(d, pe - 1).lower() for x in Ref_Words]):
+        elif ref_words.any_in(page_text(pe - 1)):
             pe -= 2
-        elif any([x in get_text(d, pe - 2).lower() for x in Ref_Words]):
+        elif ref_words.any_in(page_text(pe - 2)):
             pe -= 3
-        elif any([x in get_text(d, pe - 3).lower() for x in Ref_Words]):
+        elif ref_words.any_in(page_text(pe - 3)):
             pe -= 4
 
     ### PRINT TO SCREEN (ACCOUNTING FOR ZERO-INDEXING)
@@ -188,41 +220,51 @@ def get_proposal_info(doc):
     return pi_first, pi_last, pn, 'N/A'
 
 
-def check_compliance(doc, ps, pe):
+def check_compliance(doc, ps, pe, rules=None):
 
     """
     PURPOSE:   check font size and counts-per-inch 
     INPUTS:    doc = fitz Document object
                ps  = start page of proposal (int)
                pe  = end page of proposals (int)
+               rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
     OUTPUTS:   mfs = median font size of proposal (int)
+               cpi, lns = CPI values and text of lines with CPI violations
+               lpi, pgs = LPI values and page numbers of pages with LPI violations
+               hist = font size histogram (counts, bin edges)
+               bxs = [page, x0, y0, x1, y1] of each line with a CPI violation (page is 1-based)
   
     """
 
-    ### GRAB FONT SIZE & CPI PER LINE
+    rules = load_rules() if rules is None else rules
+    th = rules['thresholds']
+
+    ### GRAB FONT SIZE & CPI PER LINE (AND WHERE EACH LINE IS ON THE PAGE)
     for i, val in enumerate(np.arange(ps, pe + 1)):
-        t = get_text(doc, val)
-        ln = t.split('\n')
-        ln = [x for x in ln if len(x) > 50] ## TRY TO ONLY KEEP REAL LINES
+        ln, bx = get_lines(doc, val)
+        keep = [k for k, x in enumerate(ln) if len(x) > th['min_line_chars']] ## TRY TO ONLY KEEP REAL LINES
+        ln, bx = [ln[k] for k in keep], [[int(val) + 1] + bx[k] if bx[k] else None for k in keep]
         if i ==0:
             df = get_fonts(doc, val)
             cpi = [round(len(x)/6.5,2) for x in ln[2:-2]]  ### TRY TO AVOID HEADERS/FOOTERS
-            lns, lpi = ln[2:-2], [round(len(ln)/9, 2)]
+            lns, lpi, bxs = ln[2:-2], [round(len(ln)/9, 2)], bx[2:-2]
         else:
             df = pd.concat([df, get_fonts(doc, val)], ignore_index=True)
             cpi = cpi + [round(len(x)/6.5,2) for x in ln[2:-2]]
             lns = lns + ln[2:-2]
+            bxs = bxs + bx[2:-2]
             lpi.append(round(len(ln)/9, 2))
     cpi, lns, lpi = np.array(cpi), np.array(lns), np.array(lpi)
 
-    ### RETURN IF COULDN'T READ
+    ### RETURN IF COULDN'T READ (E.G., SCANNED PAGES; -99 AS FONT SIZE)
     if len(df) == 0:
-        return 0
+        print("\n\tMedian font size:\tcould not read fonts\n")
+        return -99, np.array([]), np.array([]), np.array([]), [], get_font_histogram([]), []
 
     ### MEDIAN FONT SIZE (PRINT WARNING IF LESS THAN 12 PT)
     ### only use text > 50 characters (excludes random smaller text; see histograms for all)
-    mfs = round(np.median(df[df['Text'].apply(lambda x: len(x) > 50)]["Size"]), 1)  
-    if mfs <= 11.8:
+    mfs = round(np.median(df[df['Text'].apply(lambda x: len(x) > th['min_line_chars'])]["Size"]), 1)  
+    if mfs <= th['font_size_flag']:
         print("\n\tMedian font size:\t", str(mfs), '\n')
     else:
         print("\n\tMedian font size:\t" + str(mfs), '\n')
@@ -232,9 +274,10 @@ def check_compliance(doc, ps, pe):
     # print("\n\tMost common font:\t" + cft)
 
     ### COUNTS PER INCH
-    cpi_max, lpi_max = 16.0, 5.5
+    cpi_max, lpi_max = th['max_cpi'], th['max_lpi']
     ind_cpi, ind_lpi = np.where(cpi > cpi_max), np.where(lpi > lpi_max)
     cpi, lns, lpi, pgs = cpi[ind_cpi], lns[ind_cpi], lpi[ind_lpi], (np.arange(ps, pe+1)+1)[ind_lpi].tolist()
+    bxs = [[round(x, 2) for x in bxs[k]] for k in ind_cpi[0] if bxs[k] is not None]
     if len(lpi) >= 1:
         print(f"\tPages w/LPI > {lpi_max}:\tNumber of pages = {len(lpi)}\n\t\t\t\tLPI values = {lpi}\n\t\t\t\tPage numbers = {pgs}")
     else:
@@ -246,54 +289,141 @@ def check_compliance(doc, ps, pe):
     else:
         print(f"\n\tLines w/CPI > {cpi_max}:\t None\n")
 
-    ### PLOT HISTOGRAM OF FONTS
-    mpl.rc('xtick', labelsize=10)
-    mpl.rc('ytick', labelsize=10)
-    mpl.rc('xtick.major', size=5, pad=7, width=2)
-    mpl.rc('ytick.major', size=5, pad=7, width=2)
-    mpl.rc('xtick.minor', width=2)
-    mpl.rc('ytick.minor', width=2)
-    mpl.rc('axes', linewidth=2)
-    mpl.rc('lines', markersize=5)
-    fig = plt.figure(figsize=(6, 4))
-    ax = fig.add_subplot(111)
-    ax.set_title("Median Font = " + str(mfs) + " pt", size=11)
-    ax.set_xlabel('Font Size', size=10)
-    ax.set_ylabel('Density', size=10)
-    ax.axvspan(11.8, 12.2, alpha=0.5, color='gray')
-    ax.hist(df["Size"], bins=np.arange(5.4, 18, 0.4), density=True)
-    fig.savefig('./font_histogram', bbox_inches='tight', dpi=100)
-    plt.close('all')
-
-    return mfs, cpi, lns, lpi, pgs
+    ### HISTOGRAM OF FONTS (DATA ONLY; SEE font_histograms.py FOR RENDERING)
+    hist = get_font_histogram(df["Size"])
 
+    return mfs, cpi, lns, lpi, pgs, hist, bxs
 
-# ====================== Main Code ========================
 
-### PATH TO FULL ANONYMIZED PROPOSAL
-parser = argparse.ArgumentParser()
-parser.add_argument("PDF_Full_Path", type=str, help="path to full proposal PDF")
-args = parser.parse_args()
+def check_format(pdf_path, hist_dir=None, plot=False, rules=None):
+
+    """
+    PURPOSE:   run all format checks on one proposal PDF (printing results as it goes)
+    INPUTS:    pdf_path = path to full proposal PDF
+               hist_dir = directory to store the font histogram data in (default = None, not stored)
+               plot = also render the font histogram as a PNG (bool; default = False)
+               rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
+    OUTPUTS:   record = dictionary with one value per SUMMARY_COLUMNS entry
+
+    """
+
+    rules = load_rules() if rules is None else rules
+
+    ### IDENTIFY STM PAGES AND REF PAGES OF PROPOSAL
+    doc = fitz.open(pdf_path)
+    pi_first, pi_last, prop_nb, flg = get_proposal_info(doc)
+    print(f'\n\t{prop_nb}\t{pi_last}')
+
+    ### GET PAGES OF S/T/M PROPOSAL
+    page_num, page_start, page_end = get_pages(doc, flg, rules=rules)
+
+    ### PRINT SOME TEXT TO CHECK
+    print("\n\tSample of first page:\t" + textwrap.shorten((get_text(doc, page_start)[300:400]), 60))
+    print("\tSample of mid page:\t"     + textwrap.shorten((get_text(doc, page_start + 8)[300:400]), 60))
+    print("\tSample of last page:\t"    + textwrap.shorten((get_text(doc, page_end)[300:400]), 60))
 
-### IDENTIFY STM PAGES AND REF PAGES OF PROPOSAL
-Doc = fitz.open(args.PDF_Full_Path)
-PI_First, PI_Last, Prop_Nb, Flg = get_proposal_info(Doc)
-print(f'\n\t{Prop_Nb}\t{PI_Last}')
+    ### CHECK FONT/TEXT COMPLIANCE
+    font_size, cpi, cpi_lines, lpi, lpi_pages, font_hist, cpi_boxes = check_compliance(doc, page_start, page_end, rules=rules)
 
-### GET PAGES OF S/T/M PROPOSAL
-try:
-    Page_Num, Page_Start, Page_End = get_pages(Doc, Flg)         
-except RuntimeError:
-    print("\tCould not read PDF")
+    ### STORE / RENDER FONT HISTOGRAM (NAMED BY PROPOSAL, OR BY FILE IF NO NSPIRES FRONT MATTER)
+    hist_name = prop_nb if flg == 'N/A' else os.path.splitext(os.path.basename(pdf_path))[0]
+    if hist_dir:
+        save_font_histogram(hist_dir, hist_name, font_size, *font_hist)
+    if plot:
+        hist = {'prop_nb': hist_name, 'mfs': font_size, 'counts': font_hist[0], 'edges': font_hist[1]}
+        print("\tFont histogram:\t" + render_font_histogram(hist, hist_dir if hist_dir else '.') + "\n")
 
-### PRINT SOME TEXT TO CHECK
-print("\n\tSample of first page:\t" + textwrap.shorten((get_text(Doc, Page_Start)[300:400]), 60))
-print("\tSample of mid page:\t"     + textwrap.shorten((get_text(Doc, Page_Start + 8)[300:400]), 60))
-print("\tSample of last page:\t"    + textwrap.shorten((get_text(Doc, Page_End)[300:400]), 60))  
+    record = {'File': os.path.basename(pdf_path), 'Prop_Nb': prop_nb, 'PI_First': pi_first, 'PI_Last': pi_last,
+              'Total Pages': page_num, 'STM_Pages': [page_start + 1, page_end + 1], 'Font Size': font_size,
+              'N_LPI_Pages': len(lpi_pages), 'LPI_Pages': lpi_pages, 'LPI_Values': lpi.tolist(),
+              'N_CPI_Lines': len(cpi), 'CPI_Boxes': cpi_boxes, 'Rules_Version': rules['version'], 'Error': ''}
 
-### CHECK FONT/TEXT COMPLIANCE
-Font_Size, CPI, CPI_Lines, LPI, LPI_Pages = check_compliance(Doc, Page_Start, Page_End)
+    return record
 
 
-   
+### COLUMNS OF THE BATCH SUMMARY CSV FILE (ONE ROW PER PROPOSAL)
+SUMMARY_COLUMNS = ['File', 'Prop_Nb', 'PI_First', 'PI_Last', 'Total Pages', 'STM_Pages', 'Font Size',
+                   'N_LPI_Pages', 'LPI_Pages', 'LPI_Values', 'N_CPI_Lines', 'CPI_Boxes', 'Rules_Version', 'Error']
+
+
+def run_check_format(task):
+
+    """
+    PURPOSE:   run check_format in a worker process, capturing what it prints
+    INPUTS:    task = (pdf_path, hist_dir, plot, rules_path)
+    OUTPUTS:   record = output of check_format (if the checks failed: File, Error, and -99 as the counts)
+               text = printed output of the checks (str)
+
+    """
+
+    pdf_path, hist_dir, plot, rules_path = task
+    buf = io.StringIO()
+    with redirect_stdout(buf):
+        try:
+            record = check_format(pdf_path, hist_dir=hist_dir, plot=plot, rules=load_rules(rules_path))
+        except (Exception, SystemExit):
+            err = traceback.format_exc(limit=1).strip().split('\n')[-1]
+            print(f"\tCould not check PDF: {err}")
+            record = {'File': os.path.basename(pdf_path), 'Total Pages': -99, 'Font Size': -99,
+                      'N_LPI_Pages': -99, 'N_CPI_Lines': -99, 'Error': err}
+
+    return record, buf.getvalue()
+
+
+def get_pdf_files(pdf_path):
+
+    """
+    PURPOSE:   get PDFs to check from a file, a directory or a glob pattern
+    INPUTS:    pdf_path = path to PDF, directory of PDFs, or glob pattern (e.g., "proposals/*_Full.pdf")
+    OUTPUTS:   pdf_files = sorted list of paths
+
+    """
+
+    if os.path.isdir(pdf_path):
+        pdf_path = os.path.join(pdf_path, '*.pdf')
+
+    return [str(x) for x in np.sort(glob.glob(pdf_path))]
+
+
+# ====================== Main Code ========================
 
+if __name__ == "__main__":
+
+    ### PATH TO FULL ANONYMIZED PROPOSAL (OR DIRECTORY / GLOB OF PROPOSALS)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("PDF_Full_Path", type=str, help="path to full proposal PDF, or a directory or glob pattern (in quotes) of PDFs")
+    parser.add_argument("-H", "--hist_dir", type=str, help="directory to store the font histogram data in (one file per proposal)", default=None)
+    parser.add_argument("--plot", action="store_true", help="also render the font histogram as a PNG (in hist_dir, or current directory)")
+    parser.add_argument("-s", "--summary", type=str, help="summary CSV file for batch mode (one row per proposal). Default is format_checks.csv.", default='format_checks.csv')
+    parser.add_argument("-r", "--rules", type=str, help="rules file with section keywords and thresholds. Default is roses_rules.json.", default=None)
+    parser.add_argument("-n", "--n_workers", type=int, help="number of worker processes in batch mode (default = number of CPUs)", default=None)
+    args = parser.parse_args()
+
+    ### LOAD AND CHECK RULES ONCE
+    Rules = load_rules(args.rules)
+    print(f"\n\tRules: {Rules['path']} (version {Rules['version']})")
+
+    PDF_Files = get_pdf_files(args.PDF_Full_Path)
+    if len(PDF_Files) == 0:
+        print("\nNo files found at PDF_Full_Path\nQuitting program\n")
+        sys.exit()
+
+    ### SINGLE PDF: PRINT AS THE CHECKS RUN
+    if (len(PDF_Files) == 1) and os.path.isfile(args.PDF_Full_Path):
+        try:
+            check_format(PDF_Files[0], hist_dir=args.hist_dir, plot=args.plot, rules=Rules)
+        except RuntimeError:
+            print("\tCould not read PDF")
+        sys.exit()
+
+    ### BATCH: CHECK PDFS IN A PROCESS POOL, PRINT EACH REPORT IN FILE ORDER, WRITE SUMMARY TABLE
+    Records = []
+    Tasks = [(x, args.hist_dir, args.plot, Rules['path']) for x in PDF_Files]
+    with ProcessPoolExecutor(max_workers=args.n_workers) as pool:
+        for Record, Text in pool.map(run_check_format, Tasks):
+            print(Text, end='')
+            Records.append(Record)
+
+    DF = pd.DataFrame(Records, columns=SUMMARY_COLUMNS)
+    DF.to_csv(args.summary, index=False)
+    print(f"\n\t{len(DF)} proposals ({np.sum(DF['Error'] != '')} failed); summary written to {args.summary}\n")
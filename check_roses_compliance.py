@@ -7,7 +7,7 @@ python check_roses_compliance.py proposals/ _Redacted proposals.csv
 """
 
 
-import sys, os, glob, re, pdb
+import sys, os, glob, re, pdb, pickle, hashlib, time, textwrap
 import numpy as np
 import pandas as pd
 import argparse
@@ -15,11 +15,72 @@ import argparse
 import fitz 
 fitz.TOOLS.mupdf_display_errors(False)
 
+from word_index import load_index, save_index, index_proposal
+from institution_aliases import load_aliases, compile_aliases, find_aliases, get_canonical, normalize_tokens, get_token_spans
+from pdf_prefetch import prefetch_pdfs, open_pdf
+from event_log import EventLog, TextSink, JSONLSink, report
+from shards import parse_shard, select_shard, get_shard_csv, write_skipped
+from roses_rules import load_rules
+from metrics import Metrics, Reporter, timed
+from outlier_profile import OutlierProfiler
+from text_layer import normalize_text, raw_span, find_word
+from results_db import open_db, add_run
+from page_store import load_store, save_store, fill_page_cache, store_pages, get_violations, diff_violations
+from batch_plan import scan_pdfs, load_history, append_history, fit_cost, print_plan, HISTORY_PATH
+from near_duplicates import add_proposal, get_pair_table, load_index as load_dup_index, save_index as save_dup_index, MIN_SIMILARITY
+
+
+### PAGES WITH FEWER NON-WHITESPACE CHARACTERS THAN THIS HAVE NO USABLE TEXT LAYER;
+### THEY ARE IMAGE-ONLY (SCANNED/FLATTENED) IF IMAGES COVER AT LEAST MIN_IMAGE_FRAC OF THE PAGE
+MIN_TEXT_CHARS = 50
+MIN_IMAGE_FRAC = 0.5
+
+
+### SECTION SEARCH: PAGES AFTER THE COVER PAGES THAT MAY START THE NSPIRES BUDGET SECTION,
+### AND PAGES PAST THE PAGE LIMIT SEARCHED FOR THE REFERENCES BEFORE ALL PAGES ARE SEARCHED
+BUDGET_WINDOW = 10
+SECTION_WINDOW = 10
+
+
+### PAGE TEXT CACHE HITS AND MISSES OF THIS PROCESS (FOR THROUGHPUT METRICS)
+PAGE_CACHE_STATS = {'hits': 0, 'misses': 0}
+
+
+def get_page_cache(d):
+
+    """
+    PURPOSE:    get cache of per-page results of a document (page text, page classes)
+                (kept on the Document object, so it is dropped along with the document)
+
+    INPUTS:     d = fitz Document object
+
+    OUTPUTS:    cache = dictionary
+    """
+
+    cache = getattr(d, 'page_cache', None)
+    if cache is None:
+        cache = d.page_cache = {}
+
+    return cache
+
+
+def clear_page_cache(d):
+
+    """
+    PURPOSE:    drop cached per-page results of a document (e.g., for timing)
+
+    INPUTS:     d = fitz Document object
+    """
+
+    d.page_cache = {}
+
 
 def get_text(d, pn):
              
     """
     PURPOSE:    get the text from a given page of the proposal
+                (extracted once per page and document, then cached; the extracted
+                text page is kept too, so hit positions can be turned into boxes)
 
     INPUTS:     d = fitz Document object
                 pn = page number of text to grab
@@ -27,28 +88,248 @@ def get_text(d, pn):
     OUTPUTS:    t = page text
     """
 
-    ### LOAD PAGE
+    cache = get_page_cache(d)
+    if ('text', int(pn)) in cache:
+        PAGE_CACHE_STATS['hits'] += 1
+        return cache[('text', int(pn))]
+    PAGE_CACHE_STATS['misses'] += 1
+
+    ### LOAD PAGE AND EXTRACT TEXT PAGE (SAME FLAGS AS page.get_text(): KEEP LIGATURES, WHITESPACE)
     p = d.load_page(int(pn))
+    cache[('textpage', int(pn))] = p.get_textpage(flags=fitz.TEXTFLAGS_TEXT)
 
     ### GET RAW TEXT
-    t = p.get_text("text")
+    t = cache[('textpage', int(pn))].extractText()
 
     ### FIX ENCODING
     t = t.encode('utf-8', 'replace').decode()
+    cache[('text', int(pn))] = t
     
     return t
 
 
+def get_norm_text(d, pn):
+
+    """
+    PURPOSE:    get the normalized text of a page (NFKC, casefold, de-hyphenated, one space
+                per whitespace run) that all keyword and word matchers read, with the map
+                back to get_text positions (normalized once per page and document, then cached)
+
+    INPUTS:     d = fitz Document object
+                pn = page number
+
+    OUTPUTS:    s = normalized page text
+                offsets = get_text(d, pn) position of each character of s (see text_layer.py)
+    """
+
+    cache = get_page_cache(d)
+    if ('norm', int(pn)) not in cache:
+        cache[('norm', int(pn))] = normalize_text(get_text(d, pn))
+
+    return cache[('norm', int(pn))]
+
+
+def norm_word(w):
+
+    """
+    PURPOSE:    normalize a search word the same way as the page text
+
+    INPUTS:     w = word or phrase
+
+    OUTPUTS:    w = normalized word (str)
+    """
+
+    return normalize_text(str(w))[0].strip()
+
+
+def get_spans(d, pn):
+
+    """
+    PURPOSE:    get the text spans of a page with their positions in the page text
+                (from the text page kept by get_text, so the page is not read again
+                unless its text came from the page store)
+
+    INPUTS:     d = fitz Document object
+                pn = page number
+
+    OUTPUTS:    spans = list of (start, end, bbox, line) with start/end offsets in get_text(d, pn)
+                        (empty if the offsets do not line up with the page text)
+    """
+
+    cache = get_page_cache(d)
+    if ('spans', int(pn)) in cache:
+        return cache[('spans', int(pn))]
+
+    ### PAGE TEXT IS THE LINES OF ALL TEXT BLOCKS, EACH FOLLOWED BY A NEWLINE
+    spans, k = [], 0
+    for i, l in enumerate(get_text_lines(d, pn)):
+        for s in l['spans']:
+            spans.append((k, k + len(s['text']), s['bbox'], i))
+            k += len(s['text'])
+        k += 1
+    if k != len(get_text(d, pn)):
+        spans = []
+    cache[('spans', int(pn))] = spans
+
+    return spans
+
+
+def get_text_lines(d, pn):
+
+    """
+    PURPOSE:    get the text lines of a page with their spans and boxes, in page text order
+                (from the text page kept by get_text, so the page is not read again
+                unless its text came from the page store)
+
+    INPUTS:     d = fitz Document object
+                pn = page number
+
+    OUTPUTS:    lines = list of line dictionaries of all text blocks ('bbox', and 'spans' with
+                        'text' and 'bbox'; kept in the page store with the page text)
+    """
+
+    cache = get_page_cache(d)
+    if ('lines', int(pn)) in cache:
+        return cache[('lines', int(pn))]
+
+    get_text(d, pn)
+    tp = cache.get(('textpage', int(pn)))
+    if tp is None:
+        ### TEXT CAME FROM THE PAGE STORE BUT THE LINES DID NOT: PAGE IS READ AGAIN
+        tp = cache[('textpage', int(pn))] = d.load_page(int(pn)).get_textpage(flags=fitz.TEXTFLAGS_TEXT)
+        cache.setdefault('pages_reread', set()).add(int(pn))
+    cache[('lines', int(pn))] = [{'bbox': l['bbox'], 'spans': [{'text': x['text'], 'bbox': x['bbox']} for x in l['spans']]}
+                                 for b in tp.extractDICT()['blocks'] for l in b.get('lines', [])]
+
+    return cache[('lines', int(pn))]
+
+
+def get_hit_boxes(d, pn, offsets):
+
+    """
+    PURPOSE:    get the boxes around text hits on a page (one box per hit and line;
+                positions within a span are interpolated from the span width)
+
+    INPUTS:     d = fitz Document object
+                pn = page number
+                offsets = list of [start, end] offsets of hits in get_text(d, pn)
+
+    OUTPUTS:    boxes = list of [x0, y0, x1, y1] (page coordinates, points)
+    """
+
+    boxes = []
+    for a, b in offsets:
+        rect, line = None, None
+        for s0, s1, bbox, i in get_spans(d, pn):
+            if (s1 <= a) or (s0 >= b):
+                continue
+            w = (bbox[2] - bbox[0]) / max(s1 - s0, 1)
+            r = fitz.Rect(bbox[0] + w * (max(a, s0) - s0), bbox[1], bbox[0] + w * (min(b, s1) - s0), bbox[3])
+            ### NEW BOX WHEN THE HIT CONTINUES ON THE NEXT LINE
+            if (rect is not None) and (i != line):
+                boxes.append([round(x, 2) for x in rect])
+                rect = None
+            rect, line = (r if rect is None else rect | r), i
+        if rect is not None:
+            boxes.append([round(x, 2) for x in rect])
+
+    return boxes
+
+
+def classify_page(d, pn):
+
+    """
+    PURPOSE:    classify a page as 'text', 'image' (image-only, e.g. scanned or flattened)
+                or 'blank' from the page text the checks extract anyway; only pages with
+                little text are loaded again to measure their image coverage (cached)
+
+    INPUTS:     d = fitz Document object
+                pn = page number
+
+    OUTPUTS:    c = page class (str)
+    """
+
+    ### ALREADY CLASSIFIED (E.G., UNCHANGED PAGE FROM THE PAGE STORE)
+    cache = get_page_cache(d)
+    if ('class', int(pn)) in cache:
+        return cache[('class', int(pn))]
+
+    ### ENOUGH TEXT = TEXT PAGE
+    if len(''.join(get_text(d, pn).split())) >= MIN_TEXT_CHARS:
+        cache[('class', int(pn))] = 'text'
+        return 'text'
+
+    ### OTHERWISE CHECK FRACTION OF PAGE COVERED BY IMAGES
+    page = d.load_page(int(pn))
+    img_area = sum(abs(fitz.Rect(x['bbox']) & page.rect) for x in page.get_image_info())
+    cache[('class', int(pn))] = 'image' if img_area >= MIN_IMAGE_FRAC * abs(page.rect) else 'blank'
+
+    return cache[('class', int(pn))]
+
+
+def classify_pages(d, ps=0, pe=None):
+
+    """
+    PURPOSE:    classify the pages between two pages (only those; see classify_page)
+
+    INPUTS:     d = fitz Document object
+                ps = start page (default = first page)
+                pe = end page (not included; default = page count)
+
+    OUTPUTS:    classes = array with one class per page from ps to pe-1
+    """
+
+    pe = d.page_count if pe is None else min(pe, d.page_count)
+
+    return np.array([classify_page(d, x) for x in range(max(ps, 0), pe)], dtype=object)
+
+
+def get_text_pages(d, ps, pe):
+
+    """
+    PURPOSE:    get pages between two pages that have a text layer
+
+    INPUTS:     d = fitz Document object
+                ps = start page
+                pe = end page (not included)
+
+    OUTPUTS:    pages = page numbers of text pages
+    """
+
+    return [x for x in np.arange(ps, pe) if (0 <= x < d.page_count) and (classify_page(d, x) == 'text')]
+
+
+def get_stm_text(d, ps, pe):
+
+    """
+    PURPOSE:    get the normalized text of the STM section (text pages only)
+
+    INPUTS:     d = fitz Document object
+                ps = start page of STM section
+                pe = end page of STM section (not included, as in check_ref_type)
+
+    OUTPUTS:    t = page texts joined by spaces
+    """
+
+    return ' '.join([get_norm_text(d, x)[0] for x in get_text_pages(d, ps, pe)])
+
+
 def get_fonts(doc, pn):
 
     """
-    PURPOSE:   get font sizes used in the proposal
+    PURPOSE:   get font sizes used in the proposal (read once per page and document, then cached)
     INPUTS:    doc = fitz Document object
                pn  = page number to grab fonts (int)
     OUTPUTS:   df  = dictionary with font sizes, types, colors, and associated text
 
     """
 
+    cache = get_page_cache(doc)
+    if ('fonts', int(pn)) in cache:
+        PAGE_CACHE_STATS['hits'] += 1
+        return cache[('fonts', int(pn))]
+    PAGE_CACHE_STATS['misses'] += 1
+
     ### LOAD PAGE
     page = doc.load_page(int(pn))
 
@@ -69,49 +350,111 @@ def get_fonts(doc, pn):
 
     d = {'Page': np.repeat(pn, len(fn)), 'Font': fn, 'Size': fs, 'Color': fc, 'Text': ft}
     df = pd.DataFrame (d, columns = ['Page', 'Font', 'Size', 'Color', 'Text'])
+    cache[('fonts', int(pn))] = df
 
     return df
 
 
-def get_median_font(doc, ps, pe, output=None):
+def get_median_font(doc, ps, pe, output=None, rules=None):
     """
     PURPOSE:    check if median font used is valid
 
     INPUTS:     doc = fitz Document object
                 ps = start page of STM section
                 pe = end page of STM section
-                output [optional] = if provided, print statements will be written to this file
+                output [optional] = if provided, results will be reported to this file or EventLog
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
 
-    OUTPUTS:    n_brac = number bracketed references used
-                n_etal = number  "et al." references used
+    OUTPUTS:    mfs = median font size (-99 if no fonts could be read, e.g. scanned pages)
     """
 
-    ### GRAB FONT SIZE & CPI
-    cpi = []
-    for i, val in enumerate(np.arange(ps, pe)):
+    rules = load_rules() if rules is None else rules
+    th = rules['thresholds']
+
+    ### GRAB FONT SIZE & CPI (TEXT PAGES ONLY)
+    cpi, dfs = [], []
+    for i, val in enumerate(get_text_pages(doc, ps, pe)):
         cpi.append(len(get_text(doc, val)) / 44 / 6.5)
-        if i ==0:
-            df = get_fonts(doc, val)
-        else:
-            df = pd.concat([df, get_fonts(doc, val)], ignore_index=True)
+        dfs.append(get_fonts(doc, val))
     cpi = np.array(cpi)
-       
+
+    ### only use text longer than min_line_chars (excludes random smaller text)
+    ### NO SUCH TEXT = FONTS COULD NOT BE READ (E.G., SCANNED STM SECTION)
+    df = pd.concat(dfs, ignore_index=True) if len(dfs) > 0 else pd.DataFrame(columns=['Text', 'Size'])
+    df = df[df['Text'].apply(lambda x: len(x) > th['min_line_chars'])]
     if len(df) == 0:
-        return 0
+        report(output, 'font_result', "\n\tMed. font size: could not read fonts (no text layer?)", level='warning',
+               median_font=-99, violation=None)
+        return -99
        
     ### MEDIAN FONT SIZE (PRINT WARNING IF LESS THAN 12 PT)
-    ### only use text > 50 characters (excludes random smaller text)
-    mfs = round(np.median(df[df['Text'].apply(lambda x: len(x) > 50)]["Size"]), 1)
-    if mfs <= 11.8:
-        print("\n\tMed. font size: ", file=output)
+    mfs = round(np.median(df["Size"]), 1)
+    if mfs <= th['font_size_flag']:
+        report(output, 'font_result', "\n\tMed. font size: ", median_font=mfs, violation=True)
     else:
-        print("\n\tMed. font size: " + str(mfs), file=output)
+        report(output, 'font_result', "\n\tMed. font size: " + str(mfs), median_font=mfs, violation=False)
 
     return mfs
 
 
 
-def check_ref_type(doc, ps, pe, output=None):
+def check_line_density(doc, ps, pe, output=None, rules=None):
+
+    """
+    PURPOSE:    check lines per inch (LPI) of each page and characters per inch (CPI) of each line
+                of the STM section, as check_format_single.py does (text pages only; reuses the
+                page text and text page already read for the other checks)
+
+    INPUTS:     doc = fitz Document object
+                ps = start page of STM section
+                pe = end page of STM section (included)
+                output [optional] = if provided, results will be reported to this file or EventLog
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
+
+    OUTPUTS:    results = dictionary with one value per FORMAT_COLUMNS entry
+    """
+
+    rules = load_rules() if rules is None else rules
+    th = rules['thresholds']
+
+    ### LPI PER PAGE AND CPI PER LINE (ONLY LINES LONGER THAN min_line_chars; SKIP HEADERS/FOOTERS)
+    lpi, pgs, cpi, lns = [], [], [], []
+    for pn in get_text_pages(doc, ps, pe + 1):
+        ln = get_text(doc, pn).split('\n')
+        keep = [k for k, x in enumerate(ln) if len(x) > th['min_line_chars']]
+        lpi.append(round(len(keep) / 9, 2))
+        pgs.append(int(pn) + 1)
+        for k in keep[2:-2]:
+            cpi.append(round(len(ln[k]) / 6.5, 2))
+            lns.append((int(pn), k, ln[k]))
+
+    ### VIOLATIONS (BOXES OF CPI LINES FROM THE TEXT PAGE)
+    lpi_bad = [(p, x) for p, x in zip(pgs, lpi) if x > th['max_lpi']]
+    cpi_bad = [l for l, x in zip(lns, cpi) if x > th['max_cpi']]
+    boxes = []
+    for pn, k, t in cpi_bad:
+        lines = get_text_lines(doc, pn)
+        if len(lines) + 1 == len(get_text(doc, pn).split('\n')):
+            boxes.append([pn + 1] + [round(x, 2) for x in lines[k]['bbox']])
+
+    text = f"\n\tPages w/LPI > {th['max_lpi']}:\t"
+    if len(lpi_bad) > 0:
+        text += f"Number of pages = {len(lpi_bad)}\n\t\t\t\tLPI values = {[x[1] for x in lpi_bad]}\n\t\t\t\tPage numbers = {[x[0] for x in lpi_bad]}"
+    else:
+        text += "None"
+    text += f"\n\tLines w/CPI > {th['max_cpi']}:\t"
+    if len(cpi_bad) > 0:
+        text += f"Number of lines = {len(cpi_bad)}\n" + '\n'.join(['\t\t\t\t' + textwrap.shorten(x[2], 60) for x in cpi_bad])
+    else:
+        text += "None"
+    report(output, 'format_result', text, lpi_pages=[x[0] for x in lpi_bad], lpi_values=[x[1] for x in lpi_bad],
+           n_cpi_lines=len(cpi_bad), cpi_boxes=boxes, violation=(len(lpi_bad) + len(cpi_bad) > 0))
+
+    return {'N_LPI_Pages': len(lpi_bad), 'LPI_Pages': [x[0] for x in lpi_bad], 'LPI_Values': [x[1] for x in lpi_bad],
+            'N_CPI_Lines': len(cpi_bad), 'CPI_Boxes': boxes}
+
+
+def check_ref_type(doc, ps, pe, output=None, rules=None):
 
     """
     PURPOSE:    check if proposal uses bracketed references rather than "et al." references
@@ -119,17 +462,18 @@ def check_ref_type(doc, ps, pe, output=None):
     INPUTS:     doc = fitz Document object
                 ps = start page of STM section
                 pe = end page of STM section
-                output [optional] = if provided, print statements will be written to this file
+                output [optional] = if provided, results will be reported to this file or EventLog
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
 
     OUTPUTS:    n_brac = number bracketed references used
                 n_etal = number  "et al." references used
     """
 
-    ### GRAB TEXT OF STM SECTION
-    tp = ''
-    for n, nval in enumerate(np.arange(ps, pe)):    
-        tp = tp + ' ' + get_text(doc, nval)
-    tp = tp.lower()
+    rules = load_rules() if rules is None else rules
+    th = rules['thresholds']
+
+    ### GRAB TEXT OF STM SECTION (TEXT PAGES ONLY)
+    tp = ' ' + get_stm_text(doc, ps, pe)
 
     ### GET NUMBER OF BRACKETED REFERENCES
     n_brac = 0
@@ -139,7 +483,7 @@ def check_ref_type(doc, ps, pe, output=None):
             n_brac += 1
 
     ### ALSO GET NUMBER OF POSSIBLE PARENTHETICAL REFERENCES
-    ### MATCHES REQUIRE NUMBER WITHIN PARENTHASES < 200 (ASSUMES <200 REFS; HELPS CATCH YEARS IN PARENTHESIS)
+    ### MATCHES REQUIRE NUMBER WITHIN PARENTHASES < max_paren_ref_number (ASSUMES <200 REFS; HELPS CATCH YEARS IN PARENTHESIS)
     ### ValueError CATCHES SPECIAL CHARACTES THAT AREN'T ACTUALLY NUMBERS
     n_para = 0
     para_vals = [x for x in re.findall('\(([^)]+)', tp) if x.isnumeric()]
@@ -148,34 +492,66 @@ def check_ref_type(doc, ps, pe, output=None):
             int(val)
         except ValueError:
             continue
-        if int(val) < 200:
+        if int(val) < th['max_paren_ref_number']:
             n_para += 1
 
     ### CHECK FOR NUMBER OF ET AL REFERENCES
     n_etal = len([i.start() for i in re.finditer(r'\bet al\b', tp)])
 
     ### PRINT TO SCREEN
-    if n_brac < 10:
-        print("\n\t# [] refs:\t", str(n_brac), file=output)
-        if n_para > 20:
-            print("\tUsed () instead of []? # () refs:\t", str(n_para), file=output)
-    else:
-        print("\n\t# [] refs:\t", str(n_brac), file=output)
-    if n_etal > 10:
-        print("\t# et al. refs:\t", str(n_etal), '\n', file=output)
-    else:
-        print("\t# et al. refs:\t", str(n_etal), '\n', file=output)
+    text = "\n\t# [] refs:\t " + str(n_brac)
+    if (n_brac < th['min_bracket_refs']) & (n_para > th['min_paren_refs']):
+        text += "\n\tUsed () instead of []? # () refs:\t " + str(n_para)
+    text += "\n\t# et al. refs:\t " + str(n_etal) + " \n"
+    report(output, 'reference_counts', text, n_brac=n_brac, n_etal=n_etal, n_para=n_para)
 
     return n_brac, n_etal, n_para
 
 
-def get_pages(d, stm_pl=15, output=None):
+def find_stm_start(d, sec, seen=None):
+
+    """
+    PURPOSE:    find the start of the STM section: the page after the NSPIRES budget section
+                (no budget page soon after the cover pages, e.g. anonymized PDF: the first page)
+
+    INPUTS:     d = fitz Document object
+                sec = section keyword matchers (rules['sections'])
+                seen [optional] = set to add the numbers of the pages read to
+
+    OUTPUTS:    stm_start = start page of STM section (int)
+    """
+
+    seen = set() if seen is None else seen
+    def head(val):
+        seen.add(int(val))
+        return get_norm_text(d, val)[0][0:500]
+
+    ### READ FORWARD FROM THE COVER PAGES THROUGH THE BUDGET PAGES
+    pn, val, in_budget = d.page_count, 5, False
+    while val < pn - 1:
+        if sec['nspires_budget'].any_in(head(val)):
+            in_budget = True
+            if not sec['nspires_budget'].any_in(head(val + 1)):
+                return val + 1
+        elif (not in_budget) and (val >= 5 + BUDGET_WINDOW):
+            break
+        val += 1
+
+    return 0
+
+
+def get_pages(d, stm_pl=15, output=None, rules=None):
 
     """
     PURPOSE:    identify sections of proposal (STM, references, other)
+                (first searches a window from stm_pl-4 to stm_pl+SECTION_WINDOW pages after
+                the STM start; all pages are searched only if the references start and end
+                are not found there)
 
     INPUTS:     d = fitz Document object
                 stm_pl = number of pages in STM section (int; default=15)
+                output [optional] = if provided, results will be reported to this file or EventLog
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
 
     OUTPUTS:    stm_start = start page of STM section (int)
                 stm_end = end page of STM section (int)
@@ -184,49 +560,72 @@ def get_pages(d, stm_pl=15, output=None):
                 pn = total number of pages (int)
     """
 
+    ### SECTION KEYWORD MATCHERS
+    rules = load_rules() if rules is None else rules
+    sec = rules['sections']
+
     ### GET TOTAL NUMBER OF PAGES IN PDF
     pn = d.page_count
 
+    ### TOP OF A PAGE (SECTION CHANGES ARE ONLY LOOKED FOR THERE); KEEP TRACK OF PAGES READ
+    seen = set()
+    def head(val):
+        seen.add(int(val))
+        return get_norm_text(d, val)[0][0:500]
 
-    ### LOOP THROUGH PDF PAGES
-    stm_start, stm_end, ref_start, ref_end, ref_end_bu = 0, -100, -100, -100, -100
-    for i, val in enumerate(np.arange(5, pn-1)):
+    def scan(vals, stm_start):
 
-        ### READ IN TEXT FROM THIS PAGE AND NEXT PAGE
-        t1 = get_text(d, val).replace('\n', '').replace('\t', ' ').replace('   ', ' ').replace('  ', ' ')[0:500]
-        t2 = get_text(d, val + 1).replace('\n', '').replace('\t', ' ').replace('   ', ' ').replace('  ', ' ')[0:500]
-        t1 = t1.lower()
-        t2 = t2.lower()
+        """ loop through pages vals (each with the next page); done = True once the references end is found """
 
-        ### FIND START OF STM IF FULL NSPIRES PROPOSAL
-        if ('section x - budget' in t1) & ('section x - budget' not in t2):
-            stm_start = val + 1
-            continue
+        stm_end, ref_start, ref_end = -100, -100, -100
+        for val in vals:
 
-        ### FIND STM END AND REFERENCES START
-        if (stm_start != -100) & (('reference' in t2) & ('reference' not in t1)) | (('bibliography' in t2) & ('bibliography' not in t1)) | (('citations' in t2) & ('citations' not in t1)):
-            stm_end = val
-            ref_start = val + 1
-
-        ### FIND REF END
-        w1, w2, w3, w4, w5, w6, w7, w8, w9 = 'redacted', 'summary of work effort', 'budget', 'budget narrative', 'total budget', 'table of work effort', 'data management', 'table of personnel', 'inclusion plan'
-        if (ref_start != -100) & ((w1 in t2) & (w1 not in t1)) | ((w2 in t2) & (w2 not in t1)) | ((w3 in t2) & (w3 not in t1)) | ((w4 in t2) & (w4 not in t1)) | ((w5 in t2) & (w5 not in t1)) | ((w6 in t2) & (w6 not in t1)) | ((w7 in t2) & (w7 not in t1)) | ((w8 in t2) & (w8 not in t1)) | ((w9 in t2) & (w9 not in t1)):
-            ref_end = val
-            if (ref_start != -100) & (ref_end > ref_start) & (stm_end - stm_start > stm_pl-5):
-                break
-        ### FOR WHEN REFERENCES ARE AT VERY END OF DOC
-        if (val == pn - 2) & (ref_start != -100) & ((ref_end == -100) | (ref_end < ref_start)):
-            ref_end = val + 1
+            ### READ IN TEXT FROM THIS PAGE AND NEXT PAGE
+            t1, t2 = head(val), head(val + 1)
+
+            ### FIND START OF STM IF FULL NSPIRES PROPOSAL
+            if sec['nspires_budget'].any_in(t1) & (not sec['nspires_budget'].any_in(t2)):
+                stm_start = val + 1
+                continue
+
+            ### FIND STM END AND REFERENCES START
+            if sec['references'].new_in(t1, t2):
+                stm_end = val
+                ref_start = val + 1
+
+            ### FIND REF END (REDACTION MARKER ONLY COUNTS ONCE REFERENCES STARTED)
+            if ((ref_start != -100) & sec['redaction_marker'].new_in(t1, t2)) | sec['references_end'].new_in(t1, t2):
+                ref_end = val
+                if (ref_start != -100) & (ref_end > ref_start) & (stm_end - stm_start > stm_pl-5):
+                    return stm_start, stm_end, ref_start, ref_end, True
+            ### FOR WHEN REFERENCES ARE AT VERY END OF DOC
+            if (val == pn - 2) & (ref_start != -100) & ((ref_end == -100) | (ref_end < ref_start)):
+                ref_end = val + 1
+
+        return stm_start, stm_end, ref_start, ref_end, False
+
+    ### FIND STM START: LAST NSPIRES BUDGET PAGE COMES RIGHT BEFORE THE STM SECTION
+    stm_start = find_stm_start(d, sec, seen)
+
+    ### SKIP THE STM PAGES: A REFERENCES START BEFORE STM START + STM_PL - 4 DOES NOT END THE SEARCH
+    ### (STM WOULD BE TOO SHORT) AND IS REPLACED BY ANY LATER ONE, SO THE SEARCH CAN START THERE;
+    ### THE REFERENCES ARE EXPECTED SOON AFTER THE PAGE LIMIT, SO THE SEARCH ENDS SECTION_WINDOW PAGES PAST IT
+    window = range(max(5, stm_start + stm_pl - 4), min(stm_start + stm_pl + SECTION_WINDOW, pn - 1))
+    stm_start, stm_end, ref_start, ref_end, done = scan(window, stm_start)
+
+    ### NO REFERENCES END AFTER A FULL-LENGTH STM IN THE WINDOW: LOOP THROUGH ALL PAGES AFTER THE COVER PAGES
+    if not done:
+        stm_start, stm_end, ref_start, ref_end, done = scan(range(5, pn - 1), 0)
+
+    report(output, 'section_search', f"\n\tSection search read {len(seen)} of {pn} pages", pages_examined=len(seen))
 
     ### FIX SOME THINGS BASED ON COMMON SENSE
     tcs = False
     tcr = False
     pFlag = ''
     if ref_end < ref_start:
-        ### USE SIMPLE "BUDGET" FLAG IF WE HAVE TO
-        ref_end = ref_end_bu
-        if ref_end < ref_start:
-            ref_end = -100
+        ### REF END BEFORE REF START IS NOT USABLE
+        ref_end = -100
     if stm_end - stm_start <= 5:
         ### IF STM SECTION REALLY SHORT, ASSUME PTOT PAGES
         ptot = 15
@@ -250,13 +649,139 @@ def get_pages(d, stm_pl=15, output=None):
 
     ### OTHERWISE, RETURN PAGE GUESSES
     else:
-        print(f"\n\tPage Guesses:\n", file=output)
-        print(f"\t\tSTM = {stm_start+1, stm_end+1}", file=output)
-        print(f"\t\tRef = {ref_start+1, ref_end+1}", file=output)
+        report(output, 'section_guess', f"\n\tPage Guesses:\n\n\t\tSTM = {stm_start+1, stm_end+1}\n\t\tRef = {ref_start+1, ref_end+1}",
+               stm=[int(stm_start+1), int(stm_end+1)], ref=[int(ref_start+1), int(ref_end+1)], flag=pFlag)
         return [stm_start, stm_end], [ref_start, ref_end], pn, pFlag
 
-def check_dapr_words(doc, ps_file, pn, stm_pages, ref_pages, output):
-       
+def get_prop_nb(pval, pdf_suffix):
+
+    """
+    PURPOSE:    determine the proposal number from a proposal PDF file name
+
+    INPUTS:     pval = path to proposal PDF
+                pdf_suffix = suffix of proposal PDF (what is before .pdf but after proposal number)
+
+    OUTPUTS:    prop_nb = proposal number (str)
+    """
+
+    prop_nb = os.path.split(pval)[-1].split(pdf_suffix)[0]
+    if (pdf_suffix!='_Script'):
+      if ('_' in prop_nb) and ('_2' not in prop_nb):
+          prop_nb = os.path.split(pval)[-1].split('_')[0]
+      elif "-DAPR" in prop_nb:
+          prop_nb = os.path.split(pval)[-1].split(pdf_suffix)[0].split('-DAPR')[0]
+
+    return prop_nb
+
+
+### PARSED PROPOSAL MASTERS ALREADY LOADED BY THIS PROCESS: path -> ((mtime, size), dfp, colnames)
+_pm_cache = {}
+PM_SNAPSHOT_SUFFIX, PM_SNAPSHOT_VERSION = '.snapshot.pkl', 1
+
+
+def get_file_hash(path):
+
+    """
+    PURPOSE:    get SHA-1 hash of a file's contents
+
+    INPUTS:     path = path to file
+
+    OUTPUTS:    h = hex digest (str)
+    """
+
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2**20), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def load_proposal_master(ps_file, snapshot=True):
+
+    """
+    PURPOSE:    load Proposal Master file from NSPIRES and figure out its column names
+                the parsed result is kept in memory and in a snapshot file next to the
+                Proposal Master (ps_file + '.snapshot.pkl'), which is only rebuilt when
+                the Proposal Master changes (mtime/size, then contents hash)
+
+    INPUTS:     ps_file = path to Proposal Master (csv or Excel)
+                snapshot = use and write the snapshot file (bool; default=True)
+
+    OUTPUTS:    dfp = Proposal Master (DataFrame)
+                colnames = column names for proposal number, PI name, linked org, PI company and PI city
+    """
+
+    ### ALREADY LOADED IN THIS PROCESS AND UNCHANGED
+    st = os.stat(ps_file)
+    stamp, key = (st.st_mtime_ns, st.st_size), os.path.abspath(ps_file)
+    if (key in _pm_cache) and (_pm_cache[key][0] == stamp):
+        return _pm_cache[key][1], _pm_cache[key][2]
+
+    ### TRY SNAPSHOT: SAME MTIME/SIZE, OR SAME CONTENTS HASH (E.G., FILE TOUCHED OR COPIED)
+    snap_file, sha1 = ps_file + PM_SNAPSHOT_SUFFIX, None
+    if snapshot and os.path.isfile(snap_file):
+        try:
+            with open(snap_file, 'rb') as f:
+                snap = pickle.load(f)
+            if snap['version'] == PM_SNAPSHOT_VERSION:
+                if snap['stamp'] != stamp:
+                    sha1 = get_file_hash(ps_file)
+                if (snap['stamp'] == stamp) or (snap['sha1'] == sha1):
+                    _pm_cache[key] = (stamp, snap['dfp'], snap['colnames'])
+                    if snap['stamp'] != stamp:
+                        write_pm_snapshot(snap_file, stamp, sha1, snap['dfp'], snap['colnames'])
+                    return snap['dfp'], snap['colnames']
+        except Exception:
+            ### UNREADABLE SNAPSHOT (E.G., DIFFERENT PANDAS VERSION): REBUILD IT
+            pass
+
+    ### PARSE PROPOSAL MASTER AND STORE SNAPSHOT
+    dfp, colnames = read_proposal_master(ps_file)
+    _pm_cache[key] = (stamp, dfp, colnames)
+    if snapshot:
+        write_pm_snapshot(snap_file, stamp, sha1 if sha1 else get_file_hash(ps_file), dfp, colnames)
+
+    return dfp, colnames
+
+
+def write_pm_snapshot(snap_file, stamp, sha1, dfp, colnames):
+
+    """
+    PURPOSE:    write parsed Proposal Master snapshot
+                (skipped quietly if the directory is not writable)
+
+    INPUTS:     snap_file = path to snapshot file
+                stamp = (mtime, size) of Proposal Master
+                sha1 = contents hash of Proposal Master
+                dfp, colnames = output of read_proposal_master
+    """
+
+    snap = {'version': PM_SNAPSHOT_VERSION, 'stamp': stamp, 'sha1': sha1, 'dfp': dfp, 'colnames': colnames}
+    tmp = snap_file + f'.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            pickle.dump(snap, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snap_file)
+    except OSError:
+        ### DO NOT LEAVE A PARTIAL FILE BEHIND (E.G., DISK FULL)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def read_proposal_master(ps_file):
+
+    """
+    PURPOSE:    parse Proposal Master file from NSPIRES and figure out its column names
+
+    INPUTS:     ps_file = path to Proposal Master (csv or Excel)
+
+    OUTPUTS:    dfp = Proposal Master (DataFrame)
+                colnames = column names for proposal number, PI name, linked org, PI company and PI city
+    """
+
     ### LOAD PROPOSAL MASTER FILE FROM NSPIRES
     ### TRY-EXCEPT IS TO HANDLE BOTH CSV AND EXCEL FILES
     try:
@@ -285,7 +810,22 @@ def check_dapr_words(doc, ps_file, pn, stm_pages, ref_pages, output):
             print("\tQuitting program\n")
             sys.exit()
 
+    return dfp, colnames
+
+
+def get_team_info(dfp, colnames, pn):
+
+    """
+    PURPOSE:    grab team member information (names, organizations, PI city) for one proposal
+
+    INPUTS:     dfp = Proposal Master (DataFrame)
+                colnames = column names from load_proposal_master
+                pn = proposal number
 
+    OUTPUTS:    pi_name = last names of PI and team members
+                pi_orgs = organizations of PI and team members
+                pi_city = city of PI
+    """
 
     ### CHECK IF MISMATCH BETWEEN PROPOSAL NUMBER PARSED FROM PDF FILE AND WHAT IS USED IN PROPOSAL MASTER
     if len (dfp[dfp[colnames[0]] == pn]) == 0:
@@ -355,41 +895,119 @@ def check_dapr_words(doc, ps_file, pn, stm_pages, ref_pages, output):
     if 'THE' in pi_orgs:
       pi_orgs.remove('THE')
 
+    return pi_name, pi_orgs, pi_city
+
+
+def get_dapr_pages(doc, stm_pages, ref_pages, rules=None):
+
+    """
+    PURPOSE:    get pages searched for DAPR words
+                (STM onward plus the NSPIRES project summary page, excluding references)
+
+    INPUTS:     doc = fitz Document object
+                stm_pages = [start, end] pages of STM section
+                ref_pages = [start, end] pages of references section
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
+
+    OUTPUTS:    pg_arr = pages to search, in search order
+                pjs_pages = pages with the NSPIRES project summary
+    """
+
+    rules = load_rules() if rules is None else rules
+
+    ### ADD COVER PAGE TO SEARCH TO INCLUDE PROJECT SUMMARY
+    pg_arr = np.sort(np.append(np.arange(stm_pages[0], doc.page_count), np.arange(0, 5)))
+
+    ### LOOP THROUGH PAGES
+    pages, pjs_pages = [], []
+    for n, nval in enumerate(pg_arr):
+
+        ### SKIP REFERENCES
+        if (nval >= np.min(ref_pages)) & (nval <= np.max(ref_pages)) & (np.min(ref_pages) > 5):
+            continue
+
+        ### SKIP IF FRONT-MATTER BUT NOT PROJECT SUMMARY
+        ### SAVE PAGE OF PROJECT SUMMARY IF FOUND
+        if nval < 4:
+            if not rules['sections']['project_summary'].any_in(get_norm_text(doc, nval)[0]):
+                continue
+            pjs_pages.append(nval)
+        pages.append(nval)
+
+    return pages, pjs_pages
+
+
+def get_team_words(ps_file, pn, aliases=None):
+
+    """
+    PURPOSE:    get team info of a proposal and the organization words to search for
+
+    INPUTS:     ps_file = path to Proposal Master
+                pn = proposal number
+                aliases [optional] = compiled institution aliases (see institution_aliases.py)
+
+    OUTPUTS:    pi_name, pi_orgs, pi_city = output of get_team_info
+                org_words = organizations searched for as words
+                canonicals = canonical institutions searched for through the alias trie
+    """
+
+    ### GET TEAM INFO FROM PROPOSAL MASTER
+    dfp, colnames = load_proposal_master(ps_file)
+    pi_name, pi_orgs, pi_city = get_team_info(dfp, colnames, pn)
+
+    ### EXPAND ORGS THROUGH INSTITUTION ALIASES (IF PROVIDED)
+    ### ORGS THAT ARE THEMSELVES ALIASES ARE ONLY SEARCHED FOR THROUGH THE ALIAS TRIE
+    canonicals, org_words = [], pi_orgs
+    if aliases is not None:
+        org_words = []
+        for org in pi_orgs:
+            org_canonicals, exact = get_canonical(aliases, org)
+            canonicals += [x for x in org_canonicals if x not in canonicals]
+            if not exact:
+                org_words.append(org)
+
+    return pi_name, pi_orgs, pi_city, org_words, canonicals
+
+
+def check_dapr_words(doc, ps_file, pn, stm_pages, ref_pages, output, aliases=None, rules=None):
+
+    rules = load_rules() if rules is None else rules
+
+    ### GET TEAM INFO AND ORGANIZATIONS TO SEARCH FOR
+    pi_name, pi_orgs, pi_city, org_words, canonicals = get_team_words(ps_file, pn, aliases)
+
     ### GET ALL DAPR WORDS
-    dw_gp = ['she', 'he', 'her', 'hers', 'his', 'him']
-    dw = dw_gp + pi_orgs + pi_name + pi_city
+    dw_gp = rules['pronouns']
+    dw = dw_gp + org_words + pi_name + pi_city
     dw = np.unique(dw).tolist()
 
     ### GET PAGE NUMBERS WHERE DAPR WORDS APPEAR
     ### IGNORES REFERENCE SECTION, IF KNOWN
-    dwp, dwc, dww, pjsf = [], [], [], -99
+    dwp, dwc, dww, pjsf, page_text, offsets = [], [], [], -99, {}, {}
+    pg_arr, pjs_pages = get_dapr_pages(doc, stm_pages, ref_pages, rules)
+    ### KEPT WITH THE DOCUMENT FOR THE WORD INDEX (--index), WHICH ADDS THE SAME PAGES
+    get_page_cache(doc)['dapr_pages'] = (pg_arr, pjs_pages)
     for i, ival in enumerate(dw):
 
         ### SKIP IF EMPTY
         if pd.isnull(ival):
             continue
 
-        ### ADD COVER PAGE TO SEARCH TO INCLUDE PROJECT SUMMARY
-        pg_arr = np.sort(np.append(np.arange(stm_pages[0], doc.page_count), np.arange(0, 5)))
-
-        ### LOOP THROUGH PAGES
+        ### LOOP THROUGH PAGES (WORD NORMALIZED LIKE THE PAGE TEXT)
+        word = norm_word(ival)
         for n, nval in enumerate(pg_arr):
 
-            ### SKIP REFERENCES
-            if (nval >= np.min(ref_pages)) & (nval <= np.max(ref_pages)) & (np.min(ref_pages) > 5):
-                continue
-
-            ### SKIP IF FRONT-MATTER BUT NOT PROJECT SUMMARY
             ### SAVE PAGE OF PROJECT SUMMARY IF FOUND
-            if (nval < 4) and ("SECTION VII - Project Summary" not in get_text(doc, nval)):
-                continue
-            if (nval < 4) and ("SECTION VII - Project Summary" in get_text(doc, nval)):
+            if nval in pjs_pages:
                 pjs, pjsf = 'NSPIRES Project Summary on page', nval
             else:
                 pjs = ''
-            ### READ IN TEXT AND INDEX DAPR WORD
-            tp = (get_text(doc, nval)).lower()
-            wi = [[i.start(), i.end()] for i in re.finditer(r'\b' + re.escape(ival.lower()) + r'\b', tp)]
+            ### READ IN TEXT (ONCE PER PAGE) AND INDEX DAPR WORD
+            if nval not in page_text:
+                page_text[nval], offsets[nval] = get_norm_text(doc, nval)
+            tp = page_text[nval]
+            wi = find_word(tp, word)
+            raw = [raw_span(offsets[nval], a, b) for a, b in wi]
 
 
             ### ITERATE THROUGH INDEXES
@@ -405,7 +1023,9 @@ def check_dapr_words(doc, ps_file, pn, stm_pages, ref_pages, output):
                             dwp.append(nval)
                             dwc.append(len(wi))
                             dww.append(ival)
-                            print(f'\t"{ival}" found {len(wi)} times {pjs} on page {nval+1}', file=output)
+                            report(output, 'dapr_hit', f'\t"{ival}" found {len(wi)} times {pjs} on page {nval+1}', level='detail',
+                                   word=ival, page=int(nval+1), count=len(wi), offsets=raw, boxes=get_hit_boxes(doc, nval, raw),
+                                   project_summary=(pjs != ''))
 
                 else:
 
@@ -414,17 +1034,241 @@ def check_dapr_words(doc, ps_file, pn, stm_pages, ref_pages, output):
                         dwp.append(nval)
                         dwc.append(len(wi))
                         dww.append(ival)
-                        print(f'\t"{ival}" found {len(wi)} times {pjs} on page {nval+1}', file=output)
+                        report(output, 'dapr_hit', f'\t"{ival}" found {len(wi)} times {pjs} on page {nval+1}', level='detail',
+                               word=ival, page=int(nval+1), count=len(wi), offsets=raw, boxes=get_hit_boxes(doc, nval, raw),
+                               project_summary=(pjs != ''))
+
+    ### SCAN EACH PAGE ONCE FOR ALL ALIASES OF THE TEAM'S INSTITUTIONS
+    ### REPORT HITS UNDER THE CANONICAL INSTITUTION
+    if len(canonicals) > 0:
+        for n, nval in enumerate(np.unique(pg_arr)):
+            if nval not in page_text:
+                page_text[nval], offsets[nval] = get_norm_text(doc, nval)
+            hits = [x for x in find_aliases(aliases, normalize_tokens(page_text[nval])) if x[2] in canonicals]
+            found = [x[2] for x in hits]
+            pjs = 'NSPIRES Project Summary on page' if nval in pjs_pages else ''
+            for ival in canonicals:
+                if ival in found:
+                    dwp.append(nval)
+                    dwc.append(found.count(ival))
+                    dww.append(ival)
+                    ### TOKEN POSITIONS -> NORMALIZED TEXT -> RAW TEXT OFFSETS
+                    spans = get_token_spans(page_text[nval])
+                    wi = [raw_span(offsets[nval], spans[x[0]][0], spans[x[1]-1][1]) for x in hits if x[2] == ival] if spans is not None else []
+                    report(output, 'dapr_hit', f'\t"{ival}" found {found.count(ival)} times {pjs} on page {nval+1}', level='detail',
+                           word=ival, page=int(nval+1), count=found.count(ival), alias=True, offsets=wi,
+                           boxes=get_hit_boxes(doc, nval, wi), project_summary=(pjs != ''))
 
     ### PRINT WARNING IF COULD NOT FIND PROJECT SUMMARY
     if pjsf == -99:
-        print("\n\tCould not locate Project Summary")
+        report(output, 'warning', "\n\tCould not locate Project Summary", level='warning')
 
     return dww, dwc, dwp, pi_name, pi_orgs
 
 
 
 
+### COLUMNS OF THE OUTPUT CSV FILE (ONE ROW PER PROPOSAL)
+RESULT_COLUMNS = ['Prop_Nb', 'Team Members', 'Font Size', 'N_Brac', 'N_EtAl', 'N_Para',
+                  'STM_Pages', 'Ref Pages', 'Flag Pages', 'DAPR_Words', 'DAPR_Word_Count', 'DAPR_Word_Pages',
+                  'Image_Page_Frac', 'Rules_Version']
+
+### EXTRA COLUMNS WITH THE FORMAT CHECKS (-f; SAME AS IN check_format_single.py)
+FORMAT_COLUMNS = ['N_LPI_Pages', 'LPI_Pages', 'LPI_Values', 'N_CPI_Lines', 'CPI_Boxes']
+
+
+def check_proposal(doc, prop_nb, ps_file, stm_pl=15, output=None, aliases=None, rules=None, metrics=None, format_checks=False):
+
+    """
+    PURPOSE:    run all checks on one proposal
+
+    INPUTS:     doc = fitz Document object
+                prop_nb = proposal number
+                ps_file = path to Proposal Master
+                stm_pl = number of pages in STM section (int; default=15)
+                output [optional] = if provided, results will be reported to this file or EventLog
+                aliases [optional] = compiled institution aliases (see institution_aliases.py)
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
+                metrics [optional] = Metrics object to time each stage in (see metrics.py)
+                format_checks = also check LPI/CPI of the STM section in the same pass (bool; default=False)
+
+    OUTPUTS:    record = dictionary with one value per RESULT_COLUMNS entry (plus FORMAT_COLUMNS
+                         with format_checks; None if the proposal is incomplete)
+    """
+
+    rules = load_rules() if rules is None else rules
+    report(output, 'proposal', f'\n\n\n\t{prop_nb}', prop_nb=prop_nb)
+
+    ### GET PAGES OF PROPOSAL
+    with timed(metrics, 'get_pages'):
+        STM_Pages, Ref_Pages, Tot_Pages, pFlag = get_pages(doc, stm_pl=stm_pl, output=output, rules=rules)
+    if Tot_Pages == 0:
+        report(output, 'warning', f'\n\tProposal incomplete, skipping', level='warning')
+        return None
+
+    ### PRINT TO SCREEN (ACCOUNTING FOR ZERO-INDEXING)
+    report(output, 'page_count', "\n\tTotal pages = {},  Start page = {},   End page = {}".format(Tot_Pages, STM_Pages[0]+1, STM_Pages[1]+1),
+           total_pages=Tot_Pages)
+
+    ### CLASSIFY STM PAGES (THE PAGES THE FONT AND REFERENCE CHECKS READ; THEY SKIP ALL BUT TEXT PAGES)
+    ### FLAG IMAGE-ONLY (SCANNED/FLATTENED) PAGES FOR A MANUAL LOOK
+    with timed(metrics, 'classify_pages'):
+        Classes = classify_pages(doc, STM_Pages[0], STM_Pages[1] + 1)
+    N_Image = int(np.sum(Classes == 'image'))
+    Image_Frac = round(N_Image / max(len(Classes), 1), 3)
+    if N_Image > 0:
+        report(output, 'image_pages', "\n\tImage-only STM pages = {} of {} ({:.0%}); check manually".format(N_Image, len(Classes), Image_Frac),
+               level='warning', n_image=N_Image, image_frac=Image_Frac, pages=(np.where(Classes == 'image')[0] + STM_Pages[0] + 1).tolist())
+
+    ### CHECK FONT SIZE COMPLIANCE 
+    with timed(metrics, 'median_font'):
+        Font_Size = get_median_font(doc, STM_Pages[0], STM_Pages[1], output = output, rules = rules)
+
+    ### CHECK LINES/CHARACTERS PER INCH FROM THE SAME PAGES
+    if format_checks:
+        with timed(metrics, 'line_density'):
+            Format = check_line_density(doc, STM_Pages[0], STM_Pages[1], output = output, rules = rules)
+
+    ### CHECK DAPR REFERENCING COMPLIANCE
+    with timed(metrics, 'ref_type'):
+        N_Brac, N_EtAl, N_Para = check_ref_type(doc, STM_Pages[0], STM_Pages[1], output = output, rules = rules)
+
+    ### CHECK DAPR WORDS (AND GRAB TEAM MEMBER NAMES)
+    with timed(metrics, 'dapr_words'):
+        DW, DWC, DWP, TMN, TMC = check_dapr_words(doc, ps_file, prop_nb, STM_Pages, Ref_Pages, output = output, aliases = aliases, rules = rules)
+
+    ### RECORD STUFF
+    record = {'Prop_Nb': prop_nb, 'Team Members': TMN, 'Font Size': Font_Size,
+              'N_Brac': N_Brac, 'N_EtAl': N_EtAl, 'N_Para': N_Para,
+              'STM_Pages': (np.array(STM_Pages) + 1).tolist(), 'Ref Pages': (np.array(Ref_Pages) + 1).tolist(),
+              'Flag Pages': pFlag, 'DAPR_Words': DW, 'DAPR_Word_Count': DWC, 'DAPR_Word_Pages': (np.array(DWP) + 1).tolist(),
+              'Image_Page_Frac': Image_Frac, 'Rules_Version': rules['version']}
+    if format_checks:
+        record.update(Format)
+
+    return record
+
+
+### COLUMNS OF THE TRIAGE CSV FILE (ONE ROW PER PROPOSAL)
+TRIAGE_COLUMNS = ['Prop_Nb', 'Flagged', 'Stage', 'Word', 'Page', 'Font Size', 'Pages_Read', 'Rules_Version']
+
+
+def triage_proposal(doc, prop_nb, ps_file, stm_pl=15, output=None, aliases=None, rules=None):
+
+    """
+    PURPOSE:    quick first-pass screen of one proposal: run the cheapest checks first
+                and stop at the first team member name or institution found
+                (1. PDF metadata, 2. NSPIRES project summary, 3. STM pages from the STM
+                start until the references, 4. median font size of a few STM pages)
+
+    INPUTS:     doc = fitz Document object
+                prop_nb = proposal number
+                ps_file = path to Proposal Master
+                stm_pl = number of pages in STM section (int; default=15)
+                output [optional] = if provided, results will be reported to this file or EventLog
+                aliases [optional] = compiled institution aliases (see institution_aliases.py)
+                rules [optional] = compiled rules (see roses_rules.py; default = roses_rules.json)
+
+    OUTPUTS:    record = dictionary with one value per TRIAGE_COLUMNS entry
+    """
+
+    rules = load_rules() if rules is None else rules
+    sec, th = rules['sections'], rules['thresholds']
+    report(output, 'proposal', f'\n\n\n\t{prop_nb}', prop_nb=prop_nb)
+
+    ### TEAM NAMES AND INSTITUTIONS ONLY (PRONOUNS AND CITIES ARE LEFT TO THE FULL CHECK)
+    pi_name, pi_orgs, pi_city, org_words, canonicals = get_team_words(ps_file, prop_nb, aliases)
+    words = [norm_word(x) for x in np.unique(pi_name + org_words).tolist() if not pd.isnull(x)]
+    pattern = re.compile('|'.join([r'\b' + re.escape(x) + r'\b' for x in words])) if len(words) > 0 else None
+    record = {'Prop_Nb': prop_nb, 'Flagged': False, 'Stage': '', 'Word': '', 'Page': -99, 'Font Size': -99, 'Pages_Read': 0,
+              'Rules_Version': rules['version']}
+
+    def find_hit(t):
+        m = pattern.search(t) if pattern is not None else None
+        if m is not None:
+            return m.group(0)
+        if len(canonicals) > 0:
+            found = [x[2] for x in find_aliases(aliases, normalize_tokens(t)) if x[2] in canonicals]
+            if len(found) > 0:
+                return found[0]
+        return None
+
+    ### PAGES WHOSE TEXT WAS READ
+    read = set()
+
+    def flag(stage, word, page):
+        record.update({'Flagged': True, 'Stage': stage, 'Word': word, 'Page': page, 'Pages_Read': len(read)})
+        report(output, 'triage', f'\tTriage: "{word}" found in {stage}' + (f' on page {page}' if page > 0 else ''),
+               flagged=True, stage=stage, word=word, page=page, pages_read=record['Pages_Read'])
+        return record
+
+    ### 1. PDF METADATA (NO PAGES READ)
+    hit = find_hit(normalize_text(' \n '.join([str(x) for x in (doc.metadata or {}).values() if x]))[0])
+    if hit is not None:
+        return flag('metadata', hit, -99)
+
+    ### 2. NSPIRES PROJECT SUMMARY
+    for pn in range(min(5, doc.page_count)):
+        t = get_norm_text(doc, pn)[0]
+        read.add(pn)
+        if sec['project_summary'].any_in(t):
+            hit = find_hit(t)
+            if hit is not None:
+                return flag('project summary', hit, pn + 1)
+
+    ### 3. STM PAGES FROM THE STM START (AFTER COVER AND NSPIRES BUDGET PAGES; STOP AT REFERENCES OR PAGE LIMIT)
+    ### (REFERENCES START AS IN get_pages: A NEW KEYWORD AT THE TOP OF THE PAGE, ONLY ONCE THE STM IS LONG ENOUGH)
+    stm, prev = [], ''
+    stm_start = find_stm_start(doc, sec, read)
+    for pn in range(stm_start, min(stm_start + stm_pl, doc.page_count)):
+        t = get_norm_text(doc, pn)[0]
+        read.add(pn)
+        head = t[0:500]
+        if (len(stm) > stm_pl - 5) & sec['references'].new_in(prev, head):
+            break
+        stm.append(pn)
+        prev = head
+        hit = find_hit(t)
+        if hit is not None:
+            return flag('STM', hit, pn + 1)
+
+    ### 4. FONT SIZE OF A FEW STM PAGES (FIRST, MIDDLE, LAST)
+    if len(stm) > 0:
+        sample = np.unique([stm[0], stm[len(stm) // 2], stm[-1]])
+        df = pd.concat([get_fonts(doc, x) for x in sample], ignore_index=True)
+        df = df[df['Text'].apply(lambda x: len(x) > th['min_line_chars'])]
+        if len(df) > 0:
+            record['Font Size'] = round(np.median(df['Size']), 1)
+            if record['Font Size'] <= th['font_size_flag']:
+                return flag('font sample', f"{record['Font Size']} pt", int(sample[0]) + 1)
+
+    record['Pages_Read'] = len(read)
+    report(output, 'triage', f"\tTriage: nothing found ({record['Pages_Read']} pages read)",
+           flagged=False, pages_read=record['Pages_Read'])
+
+    return record
+
+
+def write_results(records, csv_path='dapr_checks.csv', columns=RESULT_COLUMNS):
+
+    """
+    PURPOSE:    write results of all proposals to a CSV file
+
+    INPUTS:     records = list of outputs of check_proposal (or triage_proposal)
+                csv_path = path to CSV file (default='dapr_checks.csv')
+                columns = columns to write (default=RESULT_COLUMNS)
+
+    OUTPUTS:    df = DataFrame that was written
+    """
+
+    df = pd.DataFrame([x for x in records if x is not None], columns=columns)
+    df.to_csv(csv_path, index=False)
+
+    return df
+
+
+
+
 if __name__ == "__main__":
    ### GET ARGUMENTS
    ### NOTE PDF_SUFFIX USES "REMAINDER" SO IT CAN HANDLE STRINGS STARTING WITH "-"
@@ -451,7 +1295,29 @@ if __name__ == "__main__":
    parser.add_argument("PDF_Suffix", type=str, help="suffix of anonymized proposal PDF (what is before .pdf but after proposal number)", nargs=argparse.REMAINDER)
    parser.add_argument("PM_Path", type=str, help="path to Proposal Master report as Excel or .csv file)")
    parser.add_argument("-o", "--output", type=str, help="optional output file to write stdout to", default=None)
+   parser.add_argument("-j", "--jsonl", type=str, help="optional file to write results to as JSON Lines events", default=None)
+   parser.add_argument("-l", "--log_level", type=str, choices=['detail', 'info', 'warning'], help="'info' leaves out the individual DAPR word hits. Default is 'detail'.", default='detail')
    parser.add_argument("-p", "--page_limit", type=int, help="page limit for the STM section. Default is set to 15.", default=15)
+   parser.add_argument("-a", "--aliases", type=str, help="optional CSV file of institution aliases (see institution_aliases.csv)", default=None)
+   parser.add_argument("-k", "--prefetch", type=int, help="number of PDFs to read ahead in the background (e.g., for network shares). Default is 0 (off).", default=0)
+   parser.add_argument("--prefetch_mb", type=int, help="maximum MB of PDFs held in memory by the read-ahead. Default is 256.", default=256)
+   parser.add_argument("-i", "--index", type=str, help="optional path to a word index to add the proposals to (see word_index.py)", default=None)
+   parser.add_argument("-r", "--rules", type=str, help="rules file with section keywords, pronouns and thresholds. Default is roses_rules.json.", default=None)
+   parser.add_argument("-f", "--format", action="store_true", help="also run the LPI/CPI format checks of check_format_single.py in the same pass (one report and CSV row per proposal)")
+   parser.add_argument("-t", "--triage", action="store_true", help="quick first-pass screen: stop each proposal at the first team name/institution found and write dapr_triage.csv")
+   parser.add_argument("--only", type=str, help="only check the proposals flagged in this triage CSV file (e.g., dapr_triage.csv)", default=None)
+   parser.add_argument("-m", "--metrics", type=str, help="optional file to write live throughput metrics to (Prometheus text format)", default=None)
+   parser.add_argument("--interval", type=float, help="seconds between metrics file updates and progress lines on stderr. Default is 30.", default=30)
+   parser.add_argument("-q", "--quiet", action="store_true", help="no progress/ETA lines on stderr")
+   parser.add_argument("--profile_outliers", type=str, help="optional folder for profiles of proposals slower than the rolling percentile (see outlier_profile.py)", default=None)
+   parser.add_argument("--outlier_pct", type=float, help="percentile of earlier proposal run times that marks an outlier. Default is 95.", default=95)
+   parser.add_argument("-c", "--page_store", type=str, help="optional page store for incremental re-checks: unchanged pages of resubmitted proposals are not read again and fixed/new violations are reported (see page_store.py)", default=None)
+   parser.add_argument("--db", type=str, help="optional SQLite results database to add this run to (see results_db.py)", default=None)
+   parser.add_argument("-s", "--shard", type=str, help="only check shard i of N (e.g., 2/4) to split one solicitation across machines; merge results with shards.py", default=None)
+   parser.add_argument("--near_dups", type=str, help="optional near-duplicate index: report proposals whose STM text is nearly the same as another proposal of this or an earlier run (see near_duplicates.py)", default=None)
+   parser.add_argument("--min_sim", type=float, help=f"lowest estimated STM text similarity reported with --near_dups. Default is {MIN_SIMILARITY}.", default=MIN_SIMILARITY)
+   parser.add_argument("--plan", action="store_true", help="dry run: list files without a Proposal Master row and predict run time per worker count without checking anything (see batch_plan.py)")
+   parser.add_argument("--history", type=str, help=f"optional throughput history to add the run times of this run to (not with -c or -k, which change the cost per page) and --plan estimates from. --plan default is {HISTORY_PATH}.", default=None)
    args = parser.parse_args()
    STM_PL = args.page_limit
 
@@ -468,71 +1334,201 @@ if __name__ == "__main__":
        print("\nNo files found in folder set by PDF_Path\nCheck directory path in PDF_Path and PDF suffix in PDF_Files\nQuitting program\n")
        sys.exit()
 
+   ### KEEP ONLY PROPOSALS FLAGGED BY A TRIAGE RUN
+   if args.only:
+       DF_Only = pd.read_csv(args.only, dtype={'Prop_Nb': str})
+       Only = DF_Only['Prop_Nb'][DF_Only['Flagged']].tolist() if 'Flagged' in DF_Only.columns else DF_Only['Prop_Nb'].tolist()
+       PDF_Files = [x for x in PDF_Files if get_prop_nb(str(x), args.PDF_Suffix[0]) in Only]
+       print(f"\n\t{len(PDF_Files)} proposals flagged in {args.only}")
+
+   ### KEEP ONLY THIS MACHINE'S SHARD (SAME ASSIGNMENT ON EVERY MACHINE)
+   CSV_Path = 'dapr_triage.csv' if args.triage else 'dapr_checks.csv'
+   if args.shard:
+       Shard, N_Shards = parse_shard(args.shard)
+       PDF_Files = select_shard(PDF_Files, [get_prop_nb(str(x), args.PDF_Suffix[0]) for x in PDF_Files], Shard, N_Shards)
+       CSV_Path = get_shard_csv(CSV_Path, Shard, N_Shards)
+       print(f"\n\tShard {Shard} of {N_Shards}: {len(PDF_Files)} proposals")
+
    ### GET PROPOSAL MASTER
    if os.path.isfile(args.PM_Path) == False:
        print("\nNo Proposal Master file found in path set by PS_File\nCheck path for Proposal Master\nQuitting program\n")
        sys.exit()
 
-   ### ARRAYS TO FILL
-   Prop_Nb_All, TMN_All, Font_Size_All, N_Brac_All, N_EtAl_All, N_Para_All, N_NonNumericRefs_All = [], [], [], [], [], [],[]
-   STM_Pages_All, Ref_Pages_All, pFlag_All = [], [], []
-   DW_All, DWC_All, DWP_All = [], [], []
+   ### DRY RUN: PAGE COUNTS, PROPOSAL MASTER MATCHES AND COST ESTIMATE ONLY
+   Mode = 'triage' if args.triage else ('format' if args.format else 'dapr')
+   if args.plan:
+       DFP, Colnames = load_proposal_master(args.PM_Path)
+       PM_Nbs = set(DFP[Colnames[0]].astype(str).str.strip())
+       Prop_Nbs = [get_prop_nb(str(x), args.PDF_Suffix[0]) for x in PDF_Files]
+       Unmatched = [(str(x), f"{y} not in Proposal Master") for x, y in zip(PDF_Files, Prop_Nbs) if y not in PM_Nbs]
+       Cost = fit_cost(load_history(args.history or HISTORY_PATH, 'check_roses_compliance', Mode))
+       print_plan(scan_pdfs(PDF_Files, Prop_Nbs), Unmatched, Cost, output=output)
+       sys.exit()
 
-   ### LOOP THROUGH ALL PROPOSALS
-   for p, pval in enumerate(PDF_Files):
+   ### RESULTS TO FILL (AND RUN TIMES FOR THE THROUGHPUT HISTORY, AND PROPOSALS SKIPPED AS INCOMPLETE)
+   Records, History, Skipped = [], [], []
 
-       # Determine the proposal number
-       Prop_Nb = os.path.split(pval)[-1].split(args.PDF_Suffix[0])[0]
-       if (args.PDF_Suffix[0]!='_Script'):
-         if ('_' in Prop_Nb) and ('_2' not in Prop_Nb):
-             Prop_Nb = os.path.split(pval)[-1].split('_')[0]
-         elif "-DAPR" in Prop_Nb:
-             Prop_Nb = os.path.split(pval)[-1].split(args.PDF_Suffix[0])[0].split('-DAPR')[0]
+   ### SET UP EVENT LOG (REPORT TO OUTPUT FILE OR SCREEN, PLUS OPTIONAL JSON LINES)
+   ### EVENTS ARE BUFFERED AND WRITTEN ONCE PER PROPOSAL
+   Sinks = [TextSink(output)]
+   if args.jsonl:
+       Sinks.append(JSONLSink(open(args.jsonl, 'w')))
+   Log = EventLog(Sinks, level=args.log_level)
 
-       print(f'\n\n\n\t{Prop_Nb}', file=output)
+   ### LOAD AND CHECK RULES ONCE
+   Rules = load_rules(args.rules)
+   report(Log, 'rules', f"\n\tRules: {Rules['path']} (version {Rules['version']})", rules_path=Rules['path'], rules_version=Rules['version'])
 
+   ### COMPILE INSTITUTION ALIASES ONCE
+   Aliases = compile_aliases(load_aliases(args.aliases)) if args.aliases else None
 
-       ### GET PAGES OF PROPOSAL
-       pval = str(pval)
-       Doc = fitz.open(pval)
-       STM_Pages, Ref_Pages, Tot_Pages, pFlag = get_pages(Doc, stm_pl=STM_PL)
-       ### PRINT TO SCREEN (ACCOUNTING FOR ZERO-INDEXING)
-       print("\n\tTotal pages = {},  Start page = {},   End page = {}".format(Tot_Pages, STM_Pages[0]+1, STM_Pages[1]+1), file=output)
+   ### PAGE STORE OF EARLIER RUNS (PER-PAGE RESULTS AND LAST RESULTS OF EACH PROPOSAL)
+   if args.page_store:
+       Store, Recheck = load_store(args.page_store), []
 
-       
-       if Tot_Pages == 0:
-           print(f'\n\tProposal incomplete, skipping', file=output)
-           continue
+   ### WORD INDEX TO ADD PROPOSALS TO
+   if args.index:
+       Index = load_index(args.index)
 
-       ### CHECK FONT SIZE COMPLIANCE 
-       Font_Size = get_median_font(Doc, STM_Pages[0], STM_Pages[1], output = output)
+   ### NEAR-DUPLICATE INDEX OF THIS AND EARLIER RUNS
+   if args.near_dups:
+       Dup_Index, Dup_Pairs = load_dup_index(args.near_dups), []
 
-       ### CHECK DAPR REFERENCING COMPLIANCE
-       N_Brac, N_EtAl, N_Para = check_ref_type(Doc, STM_Pages[0], STM_Pages[1], output = output)
+   ### READ PDFS AHEAD IN THE BACKGROUND IF REQUESTED
+   Prefetch_Stats = {}
+   if args.prefetch > 0:
+       PDF_Iter = prefetch_pdfs([str(x) for x in PDF_Files], n_ahead=args.prefetch, max_bytes=args.prefetch_mb * 2**20, stats=Prefetch_Stats)
+   else:
+       PDF_Iter = ((str(x), None, None) for x in PDF_Files)
 
-       ### CHECK DAPR WORDS (AND GRAB TEAM MEMBER NAMES)
-       DW, DWC, DWP, TMN, TMC = check_dapr_words(Doc, args.PM_Path, Prop_Nb, STM_Pages, Ref_Pages, output = output)
+   ### THROUGHPUT METRICS (FILE AND/OR PROGRESS LINE ON STDERR EVERY INTERVAL SECONDS)
+   Run_Metrics = Metrics()
+   Run_Metrics.set('proposals_expected', len(PDF_Files))
+   Run_Reporter = None
+   if args.metrics or not args.quiet:
+       Run_Reporter = Reporter(Run_Metrics, args.metrics, args.interval, None if args.quiet else sys.stderr).start()
 
-       ### RECORD STUFF
-       Prop_Nb_All.append(Prop_Nb)
-       Font_Size_All.append(Font_Size)
-       N_Brac_All.append(N_Brac)
-       N_EtAl_All.append(N_EtAl)
-       N_Para_All.append(N_Para)
-       STM_Pages_All.append((np.array(STM_Pages) + 1).tolist())
-       Ref_Pages_All.append((np.array(Ref_Pages) + 1).tolist())
-       pFlag_All.append(pFlag)
-       DW_All.append(DW)
-       DWC_All.append(DWC)
-       DWP_All.append((np.array(DWP) + 1).tolist())
-       TMN_All.append(TMN)
+   ### PROFILE PROPOSALS SLOWER THAN THE ROLLING PERCENTILE
+   Outliers = OutlierProfiler(args.profile_outliers, pct=args.outlier_pct) if args.profile_outliers else None
 
+   ### LOOP THROUGH ALL PROPOSALS
+   for p, (pval, PDF_Bytes, PDF_Error) in enumerate(PDF_Iter):
 
-   # Write out the results
-   d = {'Prop_Nb': Prop_Nb_All, 'Team Members': TMN_All, 'Font Size': Font_Size_All,
-        'N_Brac': N_Brac_All, 'N_EtAl':N_EtAl_All, 'N_Para':N_Para_All,
-        'STM_Pages': STM_Pages_All, 'Ref Pages': Ref_Pages_All, 'Flag Pages': pFlag_All,
-        'DAPR_Words': DW_All, 'DAPR_Word_Count': DWC_All, 'DAPR_Word_Pages': DWP_All}
+       # Determine the proposal number
+       Prop_Nb = get_prop_nb(pval, args.PDF_Suffix[0])
+       T_Prop, Cache_Stats = time.perf_counter(), dict(PAGE_CACHE_STATS)
+
+       ### RUN ALL CHECKS (A PROPOSAL THAT RAISES IS REPORTED AND COUNTED AS FAILED; THE RUN GOES ON)
+       Log.set_context(prop_nb=Prop_Nb)
+       try:
+           Doc = open_pdf(pval, PDF_Bytes, PDF_Error)
+           if args.page_store:
+               Reused, Changed = fill_page_cache(Store, Doc, get_page_cache(Doc))
+           if args.triage:
+               with timed(Run_Metrics, 'triage'):
+                   Record = triage_proposal(Doc, Prop_Nb, args.PM_Path, stm_pl=STM_PL, output=Log, aliases=Aliases, rules=Rules)
+           else:
+               Record = check_proposal(Doc, Prop_Nb, args.PM_Path, stm_pl=STM_PL, output=Log, aliases=Aliases, rules=Rules, metrics=Run_Metrics,
+                                       format_checks=args.format)
+       except Exception as e:
+           Error = type(e).__name__ + ': ' + str(e).strip().split('\n')[0]
+           report(Log, 'error', f"\n\tCheck failed: {Error}", level='warning', error=Error)
+           Log.flush()
+           print(f"\t{Prop_Nb}: check failed ({Error})", file=sys.stderr)
+           Run_Metrics.inc('proposals_failed_total')
+           continue
 
-   df = pd.DataFrame(data=d)
-   df.to_csv('dapr_checks.csv', index=False)
+       ### STORE PAGE RESULTS; COMPARE VIOLATIONS WITH THE EARLIER VERSION OF THE PROPOSAL
+       if args.page_store and (Record is not None) and not args.triage:
+           Hashes, Violations = store_pages(Store, Doc, get_page_cache(Doc)), get_violations(Record, Rules)
+           Prev = Store['proposals'].get(Prop_Nb)
+           if Prev is not None:
+               Prev_Hashes = set(Prev['hashes'])
+               Diff_Pages = [i + 1 for i, x in enumerate(Hashes) if x not in Prev_Hashes]
+               Fixed, Added = diff_violations(Prev['violations'], Violations)
+               N_Read = len(Changed) + len(get_page_cache(Doc).get('pages_reread', ()))
+               Text = f"\n\tRe-check: {len(Diff_Pages)} of {len(Hashes)} pages changed {Diff_Pages}, {N_Read} pages read again"
+               Text += ''.join(['\n\t\tFixed: ' + x for x in Fixed]) + ''.join(['\n\t\tNew: ' + x for x in Added])
+               report(Log, 'recheck', Text, changed_pages=Diff_Pages, pages_read=N_Read, fixed=Fixed, new=Added)
+               Recheck.append({'Prop_Nb': Prop_Nb, 'Changed_Pages': Diff_Pages, 'Pages_Read': N_Read, 'Pages_Reused': len(Reused),
+                               'Fixed': Fixed, 'New': Added})
+           Store['proposals'][Prop_Nb] = {'hashes': Hashes, 'record': Record, 'violations': Violations}
+       Log.flush()
+
+       ### UPDATE METRICS
+       T_Prop = time.perf_counter() - T_Prop
+       Run_Metrics.observe('proposal_seconds', T_Prop)
+       Run_Metrics.inc('proposals_skipped_total' if Record is None else 'proposals_total')
+       Run_Metrics.inc('pages_total', Doc.page_count)
+       Run_Metrics.inc('page_cache_hits_total', PAGE_CACHE_STATS['hits'] - Cache_Stats['hits'])
+       Run_Metrics.inc('page_cache_misses_total', PAGE_CACHE_STATS['misses'] - Cache_Stats['misses'])
+       Run_Metrics.set('prefetch_queue_depth', Prefetch_Stats.get('queued', 0))
+       Run_Metrics.set('prefetch_bytes', Prefetch_Stats.get('bytes', 0))
+
+       ### CHECK AN OUTLIER AGAIN UNDER THE PROFILER (EMPTY PAGE CACHE, REPORT NOT KEPT)
+       if (Outliers is not None) and (Record is not None):
+           Threshold = Outliers.threshold()
+           if Outliers.is_outlier(T_Prop):
+               clear_page_cache(Doc)
+               Kwargs = dict(stm_pl=STM_PL, output=EventLog(level=args.log_level), aliases=Aliases, rules=Rules)
+               if not args.triage:
+                   Kwargs['format_checks'] = args.format
+               Paths, _ = Outliers.profile(Prop_Nb, triage_proposal if args.triage else check_proposal, Doc, Prop_Nb, args.PM_Path, **Kwargs)
+               Run_Metrics.inc('proposals_profiled_total')
+               print(f"\t{Prop_Nb}: {T_Prop:.1f} s (p{args.outlier_pct:g} {Threshold:.1f} s), profile written to {Paths[0]}", file=sys.stderr)
+
+       if Record is None:
+           Skipped.append((Prop_Nb, 'incomplete'))
+           continue
+       Records.append(Record)
+       History.append({'Script': 'check_roses_compliance', 'Mode': Mode, 'Prop_Nb': Prop_Nb, 'Pages': Doc.page_count, 'Seconds': T_Prop})
+       if args.triage:
+           continue
+
+       ### ADD DAPR SEARCH PAGES TO WORD INDEX
+       if args.index:
+           ### (SAME PAGES AND NORMALIZED TEXT check_dapr_words SEARCHED, BOTH STILL IN THE PAGE CACHE)
+           DW_Pages, PJS_Pages = get_page_cache(Doc)['dapr_pages']
+           index_proposal(Index, Prop_Nb, {x: get_norm_text(Doc, x)[0] for x in np.unique(DW_Pages)}, PJS_Pages)
+
+       ### COMPARE STM TEXT (ALREADY READ FOR THE REFERENCE COUNTS) WITH ALL INDEXED PROPOSALS
+       if args.near_dups:
+           Pairs = add_proposal(Dup_Index, Prop_Nb, get_stm_text(Doc, Record['STM_Pages'][0] - 1, Record['STM_Pages'][1] - 1),
+                                min_sim=args.min_sim, source=os.path.abspath(args.PDF_Path))
+           if Pairs:
+               Text = ''.join([f"\n\tNear-duplicate STM text: {x} (estimated similarity {y:.2f})" for x, y in Pairs])
+               report(Log, 'near_duplicate', Text, level='warning', pairs=[{'prop_nb': x, 'similarity': round(y, 3)} for x, y in Pairs])
+               Log.flush()
+               Dup_Pairs += [(Prop_Nb, x, y) for x, y in Pairs]
+
+   ### FINAL METRICS AND PROGRESS LINE
+   if Run_Reporter is not None:
+       Run_Reporter.stop()
+
+   # Write out the results
+   write_results(Records, CSV_Path, TRIAGE_COLUMNS if args.triage else RESULT_COLUMNS + (FORMAT_COLUMNS if args.format else []))
+   if args.shard:
+       write_skipped(Skipped, CSV_Path)
+
+   if args.index:
+       save_index(Index, args.index)
+
+   ### PAGE STORE AND READ-AHEAD RUNS ARE NOT TYPICAL OF THE COST PER PAGE, SO THEY ARE NOT ADDED
+   if args.history and not (args.page_store or args.prefetch):
+       append_history(History, args.history)
+
+   if args.near_dups:
+       save_dup_index(Dup_Index, args.near_dups)
+       get_pair_table(Dup_Pairs).to_csv(os.path.splitext(CSV_Path)[0] + '_near_duplicates.csv', index=False)
+       print(f"\n\t{len(Dup_Pairs)} near-duplicate pairs written to {os.path.splitext(CSV_Path)[0] + '_near_duplicates.csv'}\n")
+
+   ### ADD RUN TO RESULTS DATABASE
+   if args.db and not args.triage:
+       Con = open_db(args.db)
+       add_run(Con, Records, os.path.abspath(args.PDF_Path), font_size_flag=Rules['thresholds']['font_size_flag'], rules_version=Rules['version'])
+       Con.close()
+
+   if args.page_store:
+       save_store(Store, args.page_store)
+       if len(Recheck) > 0:
+           pd.DataFrame(Recheck).to_csv(os.path.splitext(CSV_Path)[0] + '_recheck.csv', index=False)
@@ -0,0 +1,204 @@
+"""Cross-proposal name screening: every proposal against every team in the Proposal Master
+
+Builds one matcher over all team member names and organizations in the Proposal
+Master (each tagged by the proposal(s) it belongs to), scans the DAPR search pages
+of each proposal once, and writes a sparse proposal x proposal hit table: one row
+per (proposal, named proposal) pair, with the words found and their pages. Useful
+for conflict-of-interest checks and for finding duplicate teams.
+
+Example:
+
+python cross_screen.py proposals/ _Redacted proposals.csv
+python cross_screen.py -n 8 -o cross_screen.csv proposals/ _Redacted proposals.csv
+
+"""
+
+
+import sys, os, glob, io, traceback
+import numpy as np
+import pandas as pd
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+fitz.TOOLS.mupdf_display_errors(False)
+
+from check_roses_compliance import get_text, get_pages, get_prop_nb, get_dapr_pages, load_proposal_master, get_team_info
+from word_index import get_tokens
+
+
+### PHRASES SHORTER THAN THIS (CHARACTERS) ARE TOO AMBIGUOUS TO SCREEN FOR
+MIN_PHRASE_LEN = 3
+
+
+def build_team_matcher(dfp, colnames):
+
+    """
+    PURPOSE:    build one matcher over all team member names and organizations
+                in the Proposal Master, tagged by owning proposal
+
+    INPUTS:     dfp = Proposal Master (DataFrame)
+                colnames = column names from load_proposal_master
+
+    OUTPUTS:    matcher = dictionary with
+                    'phrases' = token tuple -> (phrase, list of owning proposal numbers)
+                    'prefixes' = set of all token tuple prefixes (stops scans early)
+    """
+
+    phrases, prefixes = {}, set()
+    for prop_nb in dfp[colnames[0]].dropna().unique():
+
+        pi_name, pi_orgs, pi_city = get_team_info(dfp, colnames, prop_nb)
+
+        for ival in pi_name + pi_orgs:
+            if pd.isnull(ival) or (len(str(ival).strip()) < MIN_PHRASE_LEN):
+                continue
+            key = tuple(get_tokens(str(ival)))
+            if len(key) == 0:
+                continue
+            owners = phrases.setdefault(key, (str(ival).strip(), []))[1]
+            if prop_nb not in owners:
+                owners.append(prop_nb)
+            for k in range(1, len(key) + 1):
+                prefixes.add(key[:k])
+
+    return {'phrases': phrases, 'prefixes': prefixes}
+
+
+def match_tokens(matcher, tokens):
+
+    """
+    PURPOSE:    find all matcher phrases in a list of tokens (single pass over the tokens)
+
+    INPUTS:     matcher = output of build_team_matcher
+                tokens = list of tokens
+
+    OUTPUTS:    found = dictionary of token tuple -> number of times found
+    """
+
+    phrases, prefixes = matcher['phrases'], matcher['prefixes']
+
+    found = {}
+    for k in range(len(tokens)):
+        n = 1
+        while (k + n <= len(tokens)) and (tuple(tokens[k:k+n]) in prefixes):
+            key = tuple(tokens[k:k+n])
+            if key in phrases:
+                found[key] = found.get(key, 0) + 1
+            n += 1
+
+    return found
+
+
+### MATCHER SHARED BY ALL WORKER PROCESSES (SET ONCE PER WORKER BY _init_worker)
+_matcher = None
+
+def _init_worker(matcher):
+    global _matcher
+    _matcher = matcher
+
+
+def screen_proposal(pval, prop_nb, stm_pl=15, include_self=False):
+
+    """
+    PURPOSE:    scan the DAPR search pages of one proposal once for all teams' names and organizations
+
+    INPUTS:     pval = path to proposal PDF
+                prop_nb = proposal number
+                stm_pl = number of pages in STM section (int; default=15)
+                include_self = also report the proposal's own team (bool; default=False)
+
+    OUTPUTS:    hits = list of (proposal number, named proposal number, word, count, page)
+                error = None or error message (a proposal that cannot be read or screened
+                        has no hits; the other proposals are still screened)
+    """
+
+    hits = []
+    try:
+        doc = fitz.open(pval)
+        stm_pages, ref_pages, tot_pages, pflag = get_pages(doc, stm_pl=stm_pl, output=io.StringIO())
+        if tot_pages == 0:
+            return [], None
+
+        pages, pjs_pages = get_dapr_pages(doc, stm_pages, ref_pages)
+        for nval in np.unique(pages):
+            found = match_tokens(_matcher, get_tokens(get_text(doc, nval)))
+            for key, c in found.items():
+                phrase, owners = _matcher['phrases'][key]
+                for owner in owners:
+                    if (owner != prop_nb) | include_self:
+                        hits.append((prop_nb, owner, phrase, c, int(nval)))
+    except Exception:
+        return [], traceback.format_exc(limit=1).strip().split('\n')[-1]
+
+    return hits, None
+
+
+def get_hit_table(hits):
+
+    """
+    PURPOSE:    collect hits into a sparse proposal x proposal table
+
+    INPUTS:     hits = list of (proposal number, named proposal number, word, count, page)
+
+    OUTPUTS:    df = DataFrame with one row per (proposal, named proposal) pair
+    """
+
+    cols = ['Prop_Nb', 'Named_Prop_Nb', 'Word', 'Count', 'Page']
+    dfh = pd.DataFrame(hits, columns=cols).sort_values(['Prop_Nb', 'Named_Prop_Nb', 'Page', 'Word'])
+
+    rows = []
+    for (prop_nb, named), g in dfh.groupby(['Prop_Nb', 'Named_Prop_Nb'], sort=True):
+        rows.append({'Prop_Nb': prop_nb, 'Named_Prop_Nb': named, 'N_Hits': int(g['Count'].sum()),
+                     'Words': g['Word'].tolist(), 'Word_Count': g['Count'].tolist(),
+                     'Word_Pages': (g['Page'] + 1).tolist()})
+
+    return pd.DataFrame(rows, columns=['Prop_Nb', 'Named_Prop_Nb', 'N_Hits', 'Words', 'Word_Count', 'Word_Pages'])
+
+
+if __name__ == "__main__":
+   ### GET ARGUMENTS
+   ### NOTE PDF_SUFFIX USES "REMAINDER" SO IT CAN HANDLE STRINGS STARTING WITH "-"
+
+   parser = argparse.ArgumentParser(description="Screen every proposal for names and organizations of every team in the Proposal Master")
+   parser.add_argument("PDF_Path", type=str, help="path to anonymized proposal PDFs")
+   parser.add_argument("PDF_Suffix", type=str, help="suffix of anonymized proposal PDF (what is before .pdf but after proposal number)", nargs=argparse.REMAINDER)
+   parser.add_argument("PM_Path", type=str, help="path to Proposal Master report as Excel or .csv file)")
+   parser.add_argument("-o", "--output", type=str, help="csv file to write the hit table to", default='cross_screen.csv')
+   parser.add_argument("-p", "--page_limit", type=int, help="page limit for the STM section. Default is set to 15.", default=15)
+   parser.add_argument("-n", "--n_workers", type=int, help="number of worker processes (default = number of CPUs)", default=None)
+   parser.add_argument("--include_self", action="store_true", help="also report each proposal's own team")
+   args = parser.parse_args()
+
+   ### GET LIST OF PDF FILES
+   PDF_Files = np.sort(glob.glob(os.path.join(args.PDF_Path, '*' + args.PDF_Suffix[0] + '.pdf')))
+   if len(PDF_Files) == 0:
+       print("\nNo files found in folder set by PDF_Path\nCheck directory path in PDF_Path and PDF suffix in PDF_Files\nQuitting program\n")
+       sys.exit()
+
+   ### GET PROPOSAL MASTER
+   if os.path.isfile(args.PM_Path) == False:
+       print("\nNo Proposal Master file found in path set by PS_File\nCheck path for Proposal Master\nQuitting program\n")
+       sys.exit()
+
+   ### BUILD ONE MATCHER OVER ALL TEAMS
+   DFP, Colnames = load_proposal_master(args.PM_Path)
+   Matcher = build_team_matcher(DFP, Colnames)
+   print(f"\n\tScreening {len(PDF_Files)} proposals for {len(Matcher['phrases'])} names and organizations")
+
+   ### SCAN EACH PROPOSAL ONCE
+   Prop_Nbs = [get_prop_nb(str(x), args.PDF_Suffix[0]) for x in PDF_Files]
+   Hits = []
+   with ProcessPoolExecutor(max_workers=args.n_workers, initializer=_init_worker, initargs=(Matcher,)) as pool:
+       for p, (hval, Error) in enumerate(pool.map(screen_proposal, [str(x) for x in PDF_Files], Prop_Nbs,
+                                                  [args.page_limit] * len(PDF_Files), [args.include_self] * len(PDF_Files))):
+           if Error is not None:
+               print(f"\t{Prop_Nbs[p]}\tcould not screen: {Error}")
+               continue
+           print(f"\t{Prop_Nbs[p]}\t{len(set(x[1] for x in hval))} other teams named")
+           Hits += hval
+
+   ### WRITE OUT SPARSE HIT TABLE
+   df = get_hit_table(Hits)
+   df.to_csv(args.output, index=False)
+   print(f"\n\t{len(df)} proposal pairs with hits written to {args.output}\n")
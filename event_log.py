@@ -0,0 +1,126 @@
+"""Buffered, structured event log for the compliance checks
+
+The checks report typed events (section guesses, font results, reference counts,
+DAPR hits with page and offsets, warnings) instead of printing line by line. Events
+are buffered per proposal and written to one or more sinks when the proposal is
+done: TextSink reproduces the usual human-readable report, JSONLSink writes one
+JSON object per line for machine parsing. Events below the log level are dropped,
+e.g. level 'info' drops the per-hit detail in bulk runs.
+
+"""
+
+
+import json
+import numpy as np
+
+
+### LOG LEVELS: 'detail' = EVERY DAPR HIT, 'info' = PER-PROPOSAL RESULTS, 'warning' = PROBLEMS ONLY
+LEVELS = {'detail': 10, 'info': 20, 'warning': 30}
+
+
+class EventLog:
+
+    """
+    PURPOSE:    buffer events of one proposal at a time and write them to sinks
+
+    INPUTS:     sinks = list of sinks (TextSink, JSONLSink)
+                level = lowest level to keep ('detail', 'info' or 'warning'; default='detail')
+    """
+
+    def __init__(self, sinks=(), level='detail'):
+        self.sinks = list(sinks)
+        self.level = LEVELS[level]
+        self.events = []
+        self.context = {}
+
+    def emit(self, event, text, level='info', **fields):
+        """ add one event (text = human-readable line(s), fields = structured data) """
+        if LEVELS[level] < self.level:
+            return
+        self.events.append(dict(self.context, event=event, level=level, text=text, **fields))
+
+    def set_context(self, **fields):
+        """ fields added to every following event (e.g., prop_nb) """
+        self.context = fields
+
+    def take(self):
+        """ return buffered events and clear the buffer (e.g., to send them from a worker process) """
+        events, self.events = self.events, []
+        return events
+
+    def extend(self, events):
+        """ add events buffered elsewhere (e.g., by a worker process) """
+        self.events += [x for x in events if LEVELS[x['level']] >= self.level]
+
+    def flush(self):
+        """ write buffered events to all sinks """
+        events = self.take()
+        for sink in self.sinks:
+            sink.write_events(events)
+
+
+class TextSink:
+
+    """
+    PURPOSE:    write events as the human-readable report
+
+    INPUTS:     f = open file (None = stdout)
+    """
+
+    def __init__(self, f=None):
+        self.f = f
+
+    def write_events(self, events):
+        for ev in events:
+            print(ev['text'], file=self.f)
+        if self.f is not None:
+            self.f.flush()
+
+
+def _to_json(x):
+    """ convert numpy values for json.dumps """
+    if isinstance(x, np.ndarray):
+        return x.tolist()
+    if isinstance(x, np.generic):
+        return x.item()
+    return str(x)
+
+
+class JSONLSink:
+
+    """
+    PURPOSE:    write events as JSON Lines (one JSON object per event)
+
+    INPUTS:     f = open file
+                include_text = also write the human-readable text (bool; default=False)
+    """
+
+    def __init__(self, f, include_text=False):
+        self.f = f
+        self.include_text = include_text
+
+    def write_events(self, events):
+        for ev in events:
+            if not self.include_text:
+                ev = {k: v for k, v in ev.items() if k != 'text'}
+            self.f.write(json.dumps(ev, default=_to_json) + '\n')
+        self.f.flush()
+
+
+def report(output, event, text, level='info', **fields):
+
+    """
+    PURPOSE:    report one result either as an event (if output is an EventLog)
+                or as a printed line (if output is a file or None, as before)
+
+    INPUTS:     output = EventLog, open file, or None (stdout)
+                event = event type (str)
+                text = human-readable line(s)
+                level = 'detail', 'info' or 'warning'
+                fields = structured data of the event
+    """
+
+    if isinstance(output, EventLog):
+        output.emit(event, text, level=level, **fields)
+    else:
+        print(text, file=output)
@@ -0,0 +1,165 @@
+"""Write highlighted copies of proposal PDFs from recorded violation positions
+
+The checks record where each violation is on the page while they read the text:
+
+    check_roses_compliance.py -j results.jsonl   "dapr_hit" events with "boxes" (DAPR words), and with -f
+                                                 "format_result" events with "cpi_boxes" (lines w/CPI > max)
+    check_roses_compliance.py -f                 CPI_Boxes column of dapr_checks.csv (one row per Prop_Nb)
+    check_format_single.py <folder>              CPI_Boxes column of the summary CSV (one row per File)
+
+This script only reads those recorded boxes (no text is searched again) and writes
+a copy of each PDF with a highlight annotation per violation, so the violations
+can be clicked through in any PDF viewer. PDFs are annotated in a process pool.
+
+Example:
+
+python export_annotations.py results.jsonl proposals/ --pdf_suffix _Redacted -o annotated/
+python export_annotations.py format_checks.csv proposals/ -o annotated/
+python export_annotations.py dapr_checks.csv proposals/ --pdf_suffix _Redacted -o annotated/
+
+"""
+
+
+import sys, os, glob, json, ast, traceback
+import numpy as np
+import pandas as pd
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+fitz.TOOLS.mupdf_display_errors(False)
+
+
+### HIGHLIGHT COLORS (RGB 0-1)
+COLORS = {'dapr': (1, 0.55, 0.55), 'cpi': (1, 0.9, 0.3)}
+
+
+def get_event_marks(jsonl_path):
+
+    """
+    PURPOSE:    get recorded DAPR hit and CPI line boxes from a JSON Lines event file
+
+    INPUTS:     jsonl_path = events written by check_roses_compliance.py -j
+
+    OUTPUTS:    marks = dictionary of proposal number -> list of (page, box, label, kind)
+                        (page is 0-based)
+    """
+
+    marks = {}
+    with open(jsonl_path) as f:
+        for line in f:
+            ev = json.loads(line)
+            if ev.get('event') == 'dapr_hit':
+                for box in ev.get('boxes', []):
+                    marks.setdefault(ev['prop_nb'], []).append((ev['page'] - 1, box, f"DAPR: \"{ev['word']}\"", 'dapr'))
+            elif ev.get('event') == 'format_result':
+                for x in ev.get('cpi_boxes', []):
+                    marks.setdefault(ev['prop_nb'], []).append((x[0] - 1, x[1:], 'Line with CPI above limit', 'cpi'))
+
+    return marks
+
+
+def get_cpi_marks(csv_path):
+
+    """
+    PURPOSE:    get recorded CPI line boxes from a check_format_single.py summary CSV
+                or a check_roses_compliance.py -f results CSV
+
+    INPUTS:     csv_path = CSV file with CPI_Boxes column, and File or Prop_Nb column
+
+    OUTPUTS:    marks = dictionary of PDF file name (or proposal number) -> list of (page, box, label, kind)
+                        (page is 0-based)
+                key = 'File' or 'Prop_Nb' (what the marks are keyed by)
+    """
+
+    df = pd.read_csv(csv_path, dtype={'File': str, 'Prop_Nb': str})
+    if 'CPI_Boxes' not in df.columns:
+        print(f"\n\tNo CPI_Boxes column in {csv_path} (re-run check_format_single.py or check_roses_compliance.py -f)\n\tQuitting program\n")
+        sys.exit()
+    key = 'File' if 'File' in df.columns else 'Prop_Nb'
+    if key not in df.columns:
+        print(f"\n\tNo File or Prop_Nb column in {csv_path}\n\tQuitting program\n")
+        sys.exit()
+
+    marks = {}
+    for i, row in df.iterrows():
+        if pd.isnull(row['CPI_Boxes']):
+            continue
+        for x in ast.literal_eval(row['CPI_Boxes']):
+            marks.setdefault(row[key], []).append((x[0] - 1, x[1:], 'Line with CPI above limit', 'cpi'))
+
+    return marks, key
+
+
+def annotate_pdf(task):
+
+    """
+    PURPOSE:    write a copy of one PDF with a highlight annotation per mark
+
+    INPUTS:     task = (pdf_path, out_path, marks) with marks from get_event_marks or get_cpi_marks
+
+    OUTPUTS:    pdf_path = input PDF
+                n_marks = number of annotations written
+                error = None or error message
+    """
+
+    pdf_path, out_path, marks = task
+    try:
+        doc = fitz.open(pdf_path)
+        pages = {}
+        for pn, box, label, kind in marks:
+            if not (0 <= pn < doc.page_count):
+                continue
+            ### KEEP PAGE OBJECTS ALIVE UNTIL SAVED (ANNOTATIONS ARE BOUND TO THEM)
+            if pn not in pages:
+                pages[pn] = doc.load_page(pn)
+            annot = pages[pn].add_highlight_annot(fitz.Rect(box))
+            annot.set_colors(stroke=COLORS[kind])
+            annot.set_info(title='ROSES compliance check', content=label)
+            annot.update()
+        doc.save(out_path, garbage=1, deflate=True)
+        return pdf_path, len(marks), None
+    except Exception:
+        return pdf_path, 0, traceback.format_exc(limit=1).strip().split('\n')[-1]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Write highlighted copies of PDFs from the violation boxes recorded by the checks")
+    parser.add_argument("Results_Path", type=str, help="JSON Lines events (-j) or results CSV (-f) of check_roses_compliance.py, or summary CSV of check_format_single.py")
+    parser.add_argument("PDF_Path", type=str, help="folder with the checked PDFs")
+    parser.add_argument("--pdf_suffix", type=str, help="suffix of the PDFs for check_roses_compliance.py results (e.g., _Redacted)", default='')
+    parser.add_argument("-o", "--out_dir", type=str, help="folder for the annotated PDFs. Default is annotated.", default='annotated')
+    parser.add_argument("-n", "--n_workers", type=int, help="number of worker processes (default = number of CPUs)", default=None)
+    args = parser.parse_args()
+
+    if os.path.isfile(args.Results_Path) == False:
+        print(f"\n\tNo results found at {args.Results_Path}\n\tQuitting program\n")
+        sys.exit()
+
+    ### MATCH RECORDED MARKS TO PDFS (BY PROPOSAL NUMBER OR FILE NAME)
+    if args.Results_Path.endswith('.csv'):
+        Marks, Key = get_cpi_marks(args.Results_Path)
+    else:
+        Marks, Key = get_event_marks(args.Results_Path), 'Prop_Nb'
+    if Key == 'File':
+        PDF_Files = {x: os.path.join(args.PDF_Path, x) for x in Marks}
+    else:
+        ### IMPORTED HERE SO check_format_single.py CSV MODE DOES NOT NEED THE CHECKING SCRIPT'S DEPENDENCIES
+        from check_roses_compliance import get_prop_nb
+        PDF_Files = {get_prop_nb(str(x), args.pdf_suffix): str(x) for x in np.sort(glob.glob(os.path.join(args.PDF_Path, '*' + args.pdf_suffix + '.pdf')))}
+
+    Missing = [x for x in Marks if (x not in PDF_Files) or not os.path.isfile(PDF_Files[x])]
+    if len(Missing) > 0:
+        print(f"\n\tNo PDF found in {args.PDF_Path} for: {Missing}")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    Tasks = [(PDF_Files[x], os.path.join(args.out_dir, os.path.splitext(os.path.basename(PDF_Files[x]))[0] + '_annotated.pdf'), Marks[x])
+             for x in sorted(Marks) if x not in Missing]
+
+    ### ANNOTATE IN A PROCESS POOL
+    print(f"\n\t{len(Tasks)} PDFs with violations to annotate\n")
+    with ProcessPoolExecutor(max_workers=args.n_workers) as pool:
+        for PDF, N_Marks, Error in pool.map(annotate_pdf, Tasks):
+            print(f"\t{os.path.basename(PDF)}\t" + (f"FAILED: {Error}" if Error else f"{N_Marks} highlights"))
+    print(f"\n\tAnnotated PDFs written to {args.out_dir}\n")
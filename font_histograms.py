@@ -0,0 +1,188 @@
+"""Font-size histograms for proposals: compute, store, and render in batch
+
+The format checks only compute histogram data (np.histogram over the standard
+font-size bins) and store it as one .npz file per proposal. Figures are drawn
+later, on request, from the stored data: either one uniquely named PNG per
+proposal (rendered in a background process pool) or one multi-page summary PDF.
+
+Example:
+
+python font_histograms.py font_hists/ -o figures/
+python font_histograms.py font_hists/ --pdf font_histograms.pdf
+
+"""
+
+
+import sys, os, glob
+import numpy as np
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+
+### FONT SIZE BINS (PT) AND THE ~12 PT BAND SHOWN ON EVERY FIGURE
+FONT_BINS = np.arange(5.4, 18, 0.4)
+FONT_BAND = (11.8, 12.2)
+
+### PLOT STYLE; APPLIED WITH rc_context SO GLOBAL mpl.rc STATE IS NEVER CHANGED
+PLOT_STYLE = {'xtick.labelsize': 10, 'ytick.labelsize': 10,
+              'xtick.major.size': 5, 'xtick.major.pad': 7, 'xtick.major.width': 2,
+              'ytick.major.size': 5, 'ytick.major.pad': 7, 'ytick.major.width': 2,
+              'xtick.minor.width': 2, 'ytick.minor.width': 2,
+              'axes.linewidth': 2, 'lines.markersize': 5}
+
+
+def get_font_histogram(sizes):
+
+    """
+    PURPOSE:   compute font size histogram (density) over the standard bins
+    INPUTS:    sizes = font sizes of all text spans (array-like)
+    OUTPUTS:   counts = histogram densities (array)
+               edges = bin edges (array)
+    """
+
+    sizes = np.asarray(sizes, dtype=float)
+
+    ### AVOID 0/0 DENSITIES WHEN NOTHING COULD BE READ
+    if len(sizes) == 0:
+        return np.zeros(len(FONT_BINS) - 1), FONT_BINS.copy()
+
+    counts, edges = np.histogram(sizes, bins=FONT_BINS, density=True)
+
+    return counts, edges
+
+
+def save_font_histogram(hist_dir, prop_nb, mfs, counts, edges):
+
+    """
+    PURPOSE:   store histogram data for one proposal
+               (one file per proposal, so parallel runs never overwrite each other)
+    INPUTS:    hist_dir = directory to store histograms in
+               prop_nb = proposal number (str)
+               mfs = median font size (float)
+               counts, edges = output of get_font_histogram
+    OUTPUTS:   fname = path of the stored histogram
+    """
+
+    os.makedirs(hist_dir, exist_ok=True)
+    fname = os.path.join(hist_dir, f'{prop_nb}_font_hist.npz')
+
+    ### WRITE TO TEMPORARY FILE FIRST SO READERS NEVER SEE A PARTIAL FILE
+    ftmp = fname + f'.{os.getpid()}.tmp'
+    with open(ftmp, 'wb') as f:
+        np.savez(f, prop_nb=prop_nb, mfs=mfs, counts=counts, edges=edges)
+    os.replace(ftmp, fname)
+
+    return fname
+
+
+def load_font_histograms(hist_dir):
+
+    """
+    PURPOSE:   load all stored histograms from a directory
+    INPUTS:    hist_dir = directory with stored histograms
+    OUTPUTS:   hists = list of dictionaries (prop_nb, mfs, counts, edges), sorted by proposal number
+    """
+
+    hists = []
+    for fname in np.sort(glob.glob(os.path.join(hist_dir, '*_font_hist.npz'))):
+        with np.load(fname) as h:
+            hists.append({'prop_nb': str(h['prop_nb']), 'mfs': float(h['mfs']),
+                          'counts': h['counts'], 'edges': h['edges']})
+
+    return hists
+
+
+def plot_font_histogram(h):
+
+    """
+    PURPOSE:   draw one stored histogram
+               (uses Figure directly, not pyplot, so it is safe in worker processes)
+    INPUTS:    h = histogram dictionary (prop_nb, mfs, counts, edges)
+    OUTPUTS:   fig = matplotlib Figure
+    """
+
+    import matplotlib as mpl
+    from matplotlib.figure import Figure
+
+    with mpl.rc_context(PLOT_STYLE):
+        fig = Figure(figsize=(6, 4))
+        ax = fig.add_subplot(111)
+        ax.set_title(str(h['prop_nb']) + ":  Median Font = " + str(h['mfs']) + " pt", size=11)
+        ax.set_xlabel('Font Size', size=10)
+        ax.set_ylabel('Density', size=10)
+        ax.axvspan(FONT_BAND[0], FONT_BAND[1], alpha=0.5, color='gray')
+        ax.bar(h['edges'][:-1], h['counts'], width=np.diff(h['edges']), align='edge')
+
+    return fig
+
+
+def render_font_histogram(h, out_dir):
+
+    """
+    PURPOSE:   render one stored histogram to a uniquely named PNG
+    INPUTS:    h = histogram dictionary (prop_nb, mfs, counts, edges)
+               out_dir = directory to write figure to
+    OUTPUTS:   fname = path of the figure
+    """
+
+    fname = os.path.join(out_dir, f"font_histogram_{h['prop_nb']}.png")
+    plot_font_histogram(h).savefig(fname, bbox_inches='tight', dpi=100)
+
+    return fname
+
+
+def render_font_histograms(hists, out_dir, n_workers=None):
+
+    """
+    PURPOSE:   render many stored histograms in a background process pool
+    INPUTS:    hists = list of histogram dictionaries
+               out_dir = directory to write figures to
+               n_workers = number of worker processes (default = number of CPUs)
+    OUTPUTS:   fnames = paths of the figures (same order as hists)
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        fnames = list(pool.map(render_font_histogram, hists, [out_dir] * len(hists)))
+
+    return fnames
+
+
+def render_font_histogram_pdf(hists, pdf_path):
+
+    """
+    PURPOSE:   render many stored histograms into one multi-page summary PDF
+    INPUTS:    hists = list of histogram dictionaries
+               pdf_path = path of the summary PDF
+    OUTPUTS:   pdf_path = path of the summary PDF
+    """
+
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    with PdfPages(pdf_path) as pdf:
+        for h in hists:
+            pdf.savefig(plot_font_histogram(h), bbox_inches='tight')
+
+    return pdf_path
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Render stored font-size histograms")
+    parser.add_argument("Hist_Dir", type=str, help="directory with stored font histograms (*_font_hist.npz)")
+    parser.add_argument("-o", "--out_dir", type=str, help="directory to write one PNG per proposal to", default=None)
+    parser.add_argument("--pdf", type=str, help="path of a multi-page summary PDF to write instead", default=None)
+    parser.add_argument("-n", "--n_workers", type=int, help="number of worker processes for PNG rendering", default=None)
+    args = parser.parse_args()
+
+    Hists = load_font_histograms(args.Hist_Dir)
+    if len(Hists) == 0:
+        print("\nNo stored histograms found in Hist_Dir\nQuitting program\n")
+        sys.exit()
+
+    if args.pdf:
+        print(f"\n\tWrote {len(Hists)} histograms to {render_font_histogram_pdf(Hists, args.pdf)}\n")
+    else:
+        Out_Dir = args.out_dir if args.out_dir else args.Hist_Dir
+        Fnames = render_font_histograms(Hists, Out_Dir, n_workers=args.n_workers)
+        print(f"\n\tWrote {len(Fnames)} histograms to {Out_Dir}\n")
@@ -0,0 +1,163 @@
+"""Institution alias dictionary compiled into a token trie
+
+Proposals often name institutions by abbreviation, short name, campus or city
+("GSFC", "Goddard", "JPL", "Caltech") rather than by the organization string in
+the Proposal Master. The alias dictionary maps each canonical institution to its
+variants. It is loaded and compiled once into a trie keyed by normalized tokens,
+so each page is scanned once no matter how many aliases there are, and hits are
+reported under the canonical institution.
+
+The alias file is a CSV file with columns "Institution" and "Alias" (one row per
+alias; the canonical name is always an alias of itself). An example is provided
+in institution_aliases.csv.
+
+"""
+
+
+import re, unicodedata
+import pandas as pd
+
+
+def normalize_tokens(t):
+
+    """
+    PURPOSE:    split text into normalized tokens (NFKC, case folded, word characters only)
+
+    INPUTS:     t = text
+
+    OUTPUTS:    tokens = list of tokens
+    """
+
+    return re.findall(r'\w+', unicodedata.normalize('NFKC', t).casefold())
+
+
+def get_token_spans(t):
+
+    """
+    PURPOSE:    character positions of the normalize_tokens tokens in the text
+
+    INPUTS:     t = text
+
+    OUTPUTS:    spans = list of (start, end) per token (None if normalizing changes
+                        the length of the text, so positions would not line up)
+    """
+
+    norm = unicodedata.normalize('NFKC', t).casefold()
+    if len(norm) != len(t):
+        return None
+
+    return [m.span() for m in re.finditer(r'\w+', norm)]
+
+
+def load_aliases(alias_path):
+
+    """
+    PURPOSE:    load alias dictionary from CSV file
+
+    INPUTS:     alias_path = path to CSV file with "Institution" and "Alias" columns
+
+    OUTPUTS:    aliases = dictionary of canonical institution -> list of aliases
+    """
+
+    df = pd.read_csv(alias_path, dtype=str)
+
+    aliases = {}
+    for i, val in enumerate(df['Institution']):
+        if pd.isnull(val):
+            continue
+        val = val.strip()
+        aliases.setdefault(val, [val])
+        if not pd.isnull(df['Alias'][i]) and (df['Alias'][i].strip() not in aliases[val]):
+            aliases[val].append(df['Alias'][i].strip())
+
+    return aliases
+
+
+def compile_aliases(aliases):
+
+    """
+    PURPOSE:    compile alias dictionary into a token trie
+
+    INPUTS:     aliases = dictionary of canonical institution -> list of aliases
+
+    OUTPUTS:    trie = nested dictionaries keyed by token; the key None holds the
+                       canonical institution(s) of the alias ending at that node
+    """
+
+    trie = {}
+    for canonical, alist in aliases.items():
+        for alias in alist:
+            tokens = normalize_tokens(alias)
+            if len(tokens) == 0:
+                continue
+            node = trie
+            for tok in tokens:
+                node = node.setdefault(tok, {})
+            if canonical not in node.setdefault(None, []):
+                node[None].append(canonical)
+
+    return trie
+
+
+def find_aliases(trie, tokens):
+
+    """
+    PURPOSE:    find all aliases in a list of tokens (single pass over the tokens;
+                longest alias wins where aliases overlap, e.g. "goddard space flight center"
+                is one hit, not also a "goddard" hit)
+
+    INPUTS:     trie = output of compile_aliases
+                tokens = list of normalized tokens
+
+    OUTPUTS:    found = list of (start token, end token, canonical institution)
+    """
+
+    found, k = [], 0
+    while k < len(tokens):
+
+        ### WALK TRIE FROM THIS TOKEN, REMEMBERING LONGEST ALIAS
+        node, n, longest = trie, k, None
+        while (n < len(tokens)) and (tokens[n] in node):
+            node = node[tokens[n]]
+            n += 1
+            if None in node:
+                longest = (n, node[None])
+
+        if longest is None:
+            k += 1
+        else:
+            found += [(k, longest[0], x) for x in longest[1]]
+            k = longest[0]
+
+    return found
+
+
+def get_canonical(trie, org):
+
+    """
+    PURPOSE:    get canonical institution(s) for an organization name
+                (exact alias match, or multi-word aliases contained in the name)
+
+    INPUTS:     trie = output of compile_aliases
+                org = organization name (e.g., from Proposal Master)
+
+    OUTPUTS:    canonicals = list of canonical institutions (empty if unknown)
+                exact = True if the whole name is an alias (bool)
+    """
+
+    tokens = normalize_tokens(str(org))
+
+    ### WHOLE NAME IS AN ALIAS
+    found = find_aliases(trie, tokens)
+    exact = [x[2] for x in found if (x[0] == 0) & (x[1] == len(tokens))]
+    if len(exact) > 0:
+        return exact, True
+
+    ### OTHERWISE ONLY TRUST MULTI-WORD ALIASES INSIDE THE NAME
+    ### (SINGLE WORDS LIKE "GODDARD" ALSO APPEAR IN OTHER INSTITUTIONS' NAMES)
+    canonicals = []
+    for k, n, canonical in found:
+        if (n - k > 1) and (canonical not in canonicals):
+            canonicals.append(canonical)
+
+    return canonicals, False
@@ -0,0 +1,300 @@
+"""Near-duplicate and recycled-text detection across proposals (MinHash/LSH)
+
+Comparing the STM text of every pair of proposals does not scale to hundreds of
+proposals per cycle, let alone across cycles. Instead, each proposal's STM text
+(the normalized text check_ref_type reads) is cut into overlapping word shingles
+and summarized by a MinHash signature: the fraction of equal signature entries of
+two proposals estimates the Jaccard similarity of their shingle sets.
+
+Signatures are split into bands and stored in a persistent LSH index (buckets of
+proposals whose band is identical). A new proposal is only compared with the
+proposals it shares a bucket with, so adding a proposal costs the same however
+many are indexed. Pairs with similarity above about (1/bands)^(1/rows) almost
+always share a bucket (with the defaults, 32 bands of 4 rows: ~0.42).
+
+check_roses_compliance.py --near_dups <index> adds each checked proposal to the
+index and reports candidate pairs (within the run and with earlier runs, e.g.
+resubmissions from earlier cycles) in the report and in dapr_checks_near_duplicates.csv.
+
+Example (all candidate pairs in an index):
+
+python near_duplicates.py near_dups.pkl --min_sim 0.5 -o near_duplicates.csv
+
+"""
+
+
+import sys, os, zlib, pickle
+import numpy as np
+import pandas as pd
+import argparse
+
+from text_layer import get_words
+
+
+NEAR_DUP_VERSION = 1
+
+### WORDS PER SHINGLE, SIGNATURE LENGTH AND LSH BANDS (ROWS PER BAND = NUM_PERM / BANDS)
+SHINGLE = 5
+NUM_PERM = 128
+BANDS = 32
+
+### PROPOSALS WITH FEWER SHINGLES THAN THIS (E.G., IMAGE-ONLY STM) ARE NOT INDEXED
+MIN_SHINGLES = 50
+
+### PAIRS BELOW THIS ESTIMATED SIMILARITY ARE NOT REPORTED
+MIN_SIMILARITY = 0.5
+
+### SEED OF THE HASH PERMUTATIONS (SAME FOR EVERY RUN SO SIGNATURES STAY COMPARABLE)
+SEED = 2024
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def get_permutations(num_perm=NUM_PERM, seed=SEED):
+
+    """
+    PURPOSE:    get the hash permutations h(x) = (a * x + b) mod p of a MinHash signature
+
+    INPUTS:     num_perm = signature length
+                seed = random seed
+
+    OUTPUTS:    a, b = numpy uint64 arrays (num_perm,)
+    """
+
+    rs = np.random.RandomState(seed)
+    a = rs.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rs.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    return a, b
+
+
+def get_shingles(t, k=SHINGLE):
+
+    """
+    PURPOSE:    hash the overlapping k-word shingles of a text
+
+    INPUTS:     t = normalized text (see text_layer.py)
+                k = words per shingle
+
+    OUTPUTS:    h = unique 32-bit shingle hashes (numpy uint64 array)
+    """
+
+    tokens = get_words(t)
+    h = [zlib.crc32(' '.join(tokens[i:i+k]).encode()) for i in range(len(tokens) - k + 1)]
+
+    return np.unique(np.array(h, dtype=np.uint64))
+
+
+def get_signature(shingles, perms):
+
+    """
+    PURPOSE:    MinHash signature of a set of shingle hashes
+
+    INPUTS:     shingles = output of get_shingles
+                perms = output of get_permutations
+
+    OUTPUTS:    sig = numpy uint32 array (num_perm,)
+    """
+
+    a, b = perms
+    sig = np.full(len(a), _MAX_HASH, dtype=np.uint64)
+
+    ### IN CHUNKS SO LONG TEXTS DO NOT NEED A HUGE (SHINGLES x PERMUTATIONS) ARRAY
+    for i in range(0, len(shingles), 4096):
+        x = shingles[i:i+4096, None]
+        sig = np.minimum(sig, ((a * x + b) % _PRIME & _MAX_HASH).min(axis=0))
+
+    return sig.astype(np.uint32)
+
+
+def estimate_similarity(sig1, sig2):
+
+    """
+    PURPOSE:    estimate the Jaccard similarity of two shingle sets from their signatures
+
+    INPUTS:     sig1, sig2 = outputs of get_signature
+
+    OUTPUTS:    sim = fraction of equal signature entries (float)
+    """
+
+    return float(np.mean(sig1 == sig2))
+
+
+def new_index(num_perm=NUM_PERM, bands=BANDS, shingle=SHINGLE):
+
+    """
+    PURPOSE:    make an empty near-duplicate index
+
+    INPUTS:     num_perm = signature length
+                bands = number of LSH bands (must divide num_perm)
+                shingle = words per shingle
+
+    OUTPUTS:    index = near-duplicate index (dictionary)
+    """
+
+    return {'version': NEAR_DUP_VERSION, 'num_perm': num_perm, 'bands': bands, 'shingle': shingle, 'seed': SEED,
+            'proposals': {}, 'buckets': [{} for i in range(bands)]}
+
+
+def load_index(index_path):
+
+    """
+    PURPOSE:    load near-duplicate index from disk (or make a new one if it does not exist yet)
+
+    INPUTS:     index_path = path to near-duplicate index
+
+    OUTPUTS:    index = near-duplicate index (dictionary)
+    """
+
+    if not os.path.isfile(index_path):
+        return new_index()
+
+    with open(index_path, 'rb') as f:
+        index = pickle.load(f)
+
+    if index.get('version') != NEAR_DUP_VERSION:
+        print(f"\n\tNear-duplicate index {index_path} has an unknown version, starting a new one")
+        return new_index()
+
+    return index
+
+
+def save_index(index, index_path):
+
+    """
+    PURPOSE:    write near-duplicate index to disk
+
+    INPUTS:     index = near-duplicate index (dictionary)
+                index_path = path to near-duplicate index
+    """
+
+    ### WRITE TO TEMPORARY FILE FIRST SO AN INTERRUPTED RUN DOES NOT CORRUPT THE INDEX
+    with open(index_path + '.tmp', 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(index_path + '.tmp', index_path)
+
+
+def _band_keys(index, sig):
+    """ bucket key of each band of a signature """
+    r = index['num_perm'] // index['bands']
+    return [sig[i*r:(i+1)*r].tobytes() for i in range(index['bands'])]
+
+
+def remove_proposal(index, prop_nb):
+
+    """
+    PURPOSE:    remove a proposal from the near-duplicate index (e.g., before adding it again)
+
+    INPUTS:     index = near-duplicate index (dictionary)
+                prop_nb = proposal number
+    """
+
+    if prop_nb not in index['proposals']:
+        return
+
+    for buckets, key in zip(index['buckets'], _band_keys(index, index['proposals'][prop_nb]['sig'])):
+        buckets[key].discard(prop_nb)
+        if len(buckets[key]) == 0:
+            del buckets[key]
+    del index['proposals'][prop_nb]
+
+
+def add_proposal(index, prop_nb, text, min_sim=MIN_SIMILARITY, source=''):
+
+    """
+    PURPOSE:    add a proposal's STM text to the near-duplicate index and find its candidate pairs
+
+    INPUTS:     index = near-duplicate index (dictionary)
+                prop_nb = proposal number
+                text = normalized STM text of the proposal (get_stm_text)
+                min_sim = only return pairs with at least this estimated similarity
+                source [optional] = where the proposal came from (e.g., PDF folder)
+
+    OUTPUTS:    pairs = list of (other proposal number, estimated similarity), most similar first
+                        (None if the text is too short to be indexed)
+    """
+
+    remove_proposal(index, prop_nb)
+
+    shingles = get_shingles(text, index['shingle'])
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    sig = get_signature(shingles, get_permutations(index['num_perm'], index['seed']))
+
+    ### ONLY PROPOSALS SHARING AT LEAST ONE BAND ARE COMPARED
+    candidates = set()
+    for buckets, key in zip(index['buckets'], _band_keys(index, sig)):
+        bucket = buckets.setdefault(key, set())
+        candidates.update(bucket)
+        bucket.add(prop_nb)
+    index['proposals'][prop_nb] = {'sig': sig, 'n_shingles': len(shingles), 'source': source}
+
+    pairs = [(x, estimate_similarity(sig, index['proposals'][x]['sig'])) for x in candidates]
+
+    return sorted([x for x in pairs if x[1] >= min_sim], key=lambda x: (-x[1], x[0]))
+
+
+def get_all_pairs(index, min_sim=MIN_SIMILARITY):
+
+    """
+    PURPOSE:    list all candidate pairs in the near-duplicate index
+
+    INPUTS:     index = near-duplicate index (dictionary)
+                min_sim = only return pairs with at least this estimated similarity
+
+    OUTPUTS:    df = DataFrame with one row per pair, most similar first
+    """
+
+    ### PAIRS SHARING A BUCKET IN ANY BAND
+    pairs = set()
+    for buckets in index['buckets']:
+        for bucket in buckets.values():
+            if len(bucket) > 1:
+                members = sorted(bucket)
+                pairs.update([(x, y) for i, x in enumerate(members) for y in members[i+1:]])
+
+    props = index['proposals']
+    rows = [(x, y, estimate_similarity(props[x]['sig'], props[y]['sig'])) for x, y in pairs]
+
+    return get_pair_table([x for x in rows if x[2] >= min_sim])
+
+
+def get_pair_table(rows):
+
+    """
+    PURPOSE:    collect candidate pairs into a table with the solicitation of each proposal
+
+    INPUTS:     rows = list of (proposal number, other proposal number, estimated similarity)
+
+    OUTPUTS:    df = DataFrame with one row per pair, most similar first
+    """
+
+    from results_db import get_solicitation
+
+    cols = ['Prop_Nb', 'Other_Prop_Nb', 'Est_Similarity', 'Solicitation', 'Other_Solicitation', 'Same_Solicitation']
+    df = pd.DataFrame([(x, y, round(s, 3), get_solicitation(x)[0], get_solicitation(y)[0]) for x, y, s in rows], columns=cols[:-1])
+    df['Same_Solicitation'] = df['Solicitation'] == df['Other_Solicitation']
+
+    return df.sort_values(['Est_Similarity', 'Prop_Nb', 'Other_Prop_Nb'], ascending=[False, True, True]).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="List the candidate near-duplicate proposal pairs in an index")
+    parser.add_argument("Index_Path", type=str, help="near-duplicate index written by check_roses_compliance.py --near_dups")
+    parser.add_argument("--min_sim", type=float, help=f"lowest estimated similarity to list. Default is {MIN_SIMILARITY}.", default=MIN_SIMILARITY)
+    parser.add_argument("-o", "--output", type=str, help="optional CSV file to write the pairs to", default=None)
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.Index_Path):
+        print(f"\n\tNo near-duplicate index found at {args.Index_Path}\n\tQuitting program\n")
+        sys.exit()
+
+    Index = load_index(args.Index_Path)
+    DF = get_all_pairs(Index, args.min_sim)
+    print(f"\n\t{len(Index['proposals'])} proposals indexed, {len(DF)} pairs with estimated similarity >= {args.min_sim}\n")
+    for i, row in DF.iterrows():
+        print(f"\t{row['Prop_Nb']}\t{row['Other_Prop_Nb']}\t{row['Est_Similarity']:.2f}")
+    print("")
+    if args.output:
+        DF.to_csv(args.output, index=False)
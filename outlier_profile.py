@@ -0,0 +1,173 @@
+"""Profile proposals that take much longer than usual
+
+Stage timers (metrics.py) show that a proposal was slow but not why. With
+check_roses_compliance.py --profile_outliers <folder>, each proposal's run time is
+compared with a rolling percentile (default 95th) of the proposals before it. A
+proposal above it is checked once more (with an empty page cache) under cProfile,
+and two files named after the proposal number are written to the folder:
+
+    <prop_nb>.collapsed   collapsed stacks ("a;b;c <microseconds>" per line) for
+                          flamegraph.pl, speedscope or inferno
+    <prop_nb>.pstats      cProfile statistics (python -m pstats <file>, snakeviz, ...)
+
+The collapsed stacks are rebuilt from the cProfile call graph (each function's time
+is split over its callers in proportion to the time spent under each), so one run
+gives both. A flame graph shows whether MuPDF text extraction, regex scanning or
+pandas overhead caused the outlier.
+
+Example (print the top functions of a profile):
+
+python outlier_profile.py profiles/22-XRP22_2-0047.pstats -n 25
+
+"""
+
+
+import sys, os, time, cProfile, pstats
+from collections import deque
+import numpy as np
+import argparse
+
+
+def _frame_name(func):
+    """ short name of a pstats function key (file, line, name) """
+    path, line, name = func
+    if path == '~':
+        return name
+    return f"{os.path.basename(path)}:{name}"
+
+
+def collapse_pstats(stats, min_frac=0.001, max_depth=64):
+
+    """
+    PURPOSE:    rebuild collapsed stacks from a cProfile call graph
+
+    INPUTS:     stats = pstats.Stats object
+                min_frac = leave out call paths with less than this fraction of the total time
+                max_depth = deepest call path to follow
+
+    OUTPUTS:    stacks = dictionary of collapsed stack ("a;b;c") -> seconds of own time
+    """
+
+    ### CALLEES OF EACH FUNCTION WITH THE TIME SPENT UNDER THEM FROM THAT CALLER
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    roots = [f for f, x in stats.stats.items() if len([c for c in x[4] if c != f]) == 0]
+    total = sum([stats.stats[f][3] for f in roots])
+    stacks = {}
+
+    def walk(func, path, t):
+        cc, nc, tt, ct, callers = stats.stats[func]
+        frac = t / ct if ct > 0 else 0
+        key = ';'.join([_frame_name(x) for x in path])
+        stacks[key] = stacks.get(key, 0) + tt * frac
+        if len(path) >= max_depth:
+            return
+        for callee, edge_t in callees.get(func, []):
+            if (callee in path) or (edge_t * frac < min_frac * total):
+                continue
+            walk(callee, path + [callee], edge_t * frac)
+
+    for f in roots:
+        if stats.stats[f][3] >= min_frac * total:
+            walk(f, [f], stats.stats[f][3])
+
+    return stacks
+
+
+def write_collapsed(stacks, path):
+
+    """
+    PURPOSE:    write collapsed stacks, one "a;b;c <microseconds>" line per stack
+
+    INPUTS:     stacks = dictionary of collapsed stack -> seconds
+                path = output file
+    """
+
+    with open(path, 'w') as f:
+        for key in sorted(stacks):
+            us = int(round(stacks[key] * 1e6))
+            if us > 0:
+                f.write(f"{key} {us}\n")
+
+
+class OutlierProfiler:
+
+    """
+    PURPOSE:    flag proposals slower than a rolling percentile of earlier ones
+                and profile them again
+
+    INPUTS:     out_dir = folder for the profile files (created if needed)
+                pct = percentile of earlier run times a proposal must exceed (default=95)
+                window = number of earlier proposals in the rolling window (default=50)
+                min_history = proposals seen before any is flagged (default=10)
+    """
+
+    def __init__(self, out_dir, pct=95, window=50, min_history=10):
+        self.out_dir = out_dir
+        self.pct = pct
+        self.min_history = min_history
+        self.history = deque(maxlen=window)
+        self.profiled = []
+        os.makedirs(out_dir, exist_ok=True)
+
+    def is_outlier(self, seconds):
+        """ True if seconds is above the rolling percentile; seconds then joins the window """
+        flag = (len(self.history) >= self.min_history) and (seconds > np.percentile(list(self.history), self.pct))
+        self.history.append(seconds)
+        return flag
+
+    def threshold(self):
+        """ current rolling percentile (seconds; -1 before min_history proposals) """
+        if len(self.history) < self.min_history:
+            return -1
+        return float(np.percentile(list(self.history), self.pct))
+
+    def profile(self, prop_nb, func, *args, **kwargs):
+
+        """
+        PURPOSE:    run func(*args, **kwargs) once more under cProfile and write <prop_nb>.pstats
+                    and <prop_nb>.collapsed (the caller clears any caches first)
+
+        INPUTS:     prop_nb = proposal number (file name)
+                    func, args, kwargs = the call to profile
+
+        OUTPUTS:    paths = paths of the files written
+                    seconds = run time under the profiler
+        """
+
+        root = os.path.join(self.out_dir, str(prop_nb))
+        paths = [root + '.pstats', root + '.collapsed']
+
+        t0 = time.perf_counter()
+        prof = cProfile.Profile()
+        prof.runcall(func, *args, **kwargs)
+        seconds = time.perf_counter() - t0
+        prof.dump_stats(paths[0])
+        write_collapsed(collapse_pstats(pstats.Stats(prof)), paths[1])
+
+        self.profiled.append(prop_nb)
+
+        return paths, seconds
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Print the top functions of an outlier profile (or convert it to collapsed stacks)")
+    parser.add_argument("Pstats_Path", type=str, help="profile written by check_roses_compliance.py --profile_outliers (<prop_nb>.pstats)")
+    parser.add_argument("-n", "--n_lines", type=int, help="number of functions to print. Default is 20.", default=20)
+    parser.add_argument("-s", "--sort", type=str, choices=['tottime', 'cumulative', 'ncalls'], help="sort order. Default is 'tottime'.", default='tottime')
+    parser.add_argument("-c", "--collapsed", type=str, help="optional file to write collapsed stacks rebuilt from the profile to", default=None)
+    args = parser.parse_args()
+
+    if os.path.isfile(args.Pstats_Path) == False:
+        print(f"\n\tNo profile found at {args.Pstats_Path}\n\tQuitting program\n")
+        sys.exit()
+
+    Stats = pstats.Stats(args.Pstats_Path)
+    Stats.sort_stats(args.sort).print_stats(args.n_lines)
+    if args.collapsed:
+        write_collapsed(collapse_pstats(Stats), args.collapsed)
+        print(f"\tCollapsed stacks written to {args.collapsed}\n")
@@ -0,0 +1,286 @@
+"""Per-page results store for incremental re-checks of resubmitted proposals
+
+When a corrected PDF is resubmitted, usually only a page or two change. With
+check_roses_compliance.py --page_store <file>, every page's extraction results
+(page text, normalized text, font spans, text lines with their boxes, text/image/blank
+class) are stored under a hash of the page's content (page size and rotation, and
+every object the page uses: content streams, fonts, images, Form XObjects and
+annotation appearances). On the next run, pages with a known hash are served from the store and only
+changed pages are extracted again; document-level results (section guesses, median
+font, reference counts, DAPR hits) are then recomputed from the page results, so a
+corrected Proposal Master or rules file is still applied to unchanged pages.
+
+The store also keeps each proposal's last results, so a re-check reports which
+violations were fixed and which are new.
+
+Example (list the proposals in a store):
+
+python page_store.py page_store.pkl
+
+"""
+
+
+import sys, os, re, pickle, hashlib
+import numpy as np
+import argparse
+
+
+PAGE_STORE_VERSION = 4
+
+### PER-PAGE ENTRIES OF THE PAGE CACHE THAT ARE STORED (KEY = (KIND, PAGE NUMBER))
+STORED_KINDS = ['text', 'norm', 'fonts', 'lines', 'class']
+
+
+def new_store():
+
+    """
+    PURPOSE:    make an empty page store
+
+    OUTPUTS:    store = page store (dictionary)
+    """
+
+    return {'version': PAGE_STORE_VERSION, 'pages': {}, 'proposals': {}}
+
+
+def load_store(store_path):
+
+    """
+    PURPOSE:    load page store from disk (or make a new one if it does not exist yet)
+
+    INPUTS:     store_path = path to page store
+
+    OUTPUTS:    store = page store (dictionary)
+    """
+
+    if not os.path.isfile(store_path):
+        return new_store()
+
+    try:
+        with open(store_path, 'rb') as f:
+            store = pickle.load(f)
+    except Exception:
+        print(f"\n\tPage store {store_path} could not be read, starting a new one")
+        return new_store()
+
+    if store.get('version') != PAGE_STORE_VERSION:
+        print(f"\n\tPage store {store_path} has an unknown version, starting a new one")
+        return new_store()
+
+    return store
+
+
+def save_store(store, store_path):
+
+    """
+    PURPOSE:    write page store to disk, keeping only pages of the latest version of each proposal
+
+    INPUTS:     store = page store (dictionary)
+                store_path = path to page store
+    """
+
+    keep = set([h for x in store['proposals'].values() for h in x['hashes']])
+    store['pages'] = {h: v for h, v in store['pages'].items() if h in keep}
+
+    with open(store_path + '.tmp', 'wb') as f:
+        pickle.dump(store, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(store_path + '.tmp', store_path)
+
+
+### OBJECT REFERENCES IN A PDF OBJECT DEFINITION, AND BACK-REFERENCES THAT ARE NOT FOLLOWED
+### (PAGE TREE PARENT, PAGE OF AN ANNOTATION; OTHER PAGES ARE NEVER PART OF A PAGE'S HASH)
+_REF = re.compile(r'(\d+) 0 R')
+_BACK_REFS = ['Parent', 'P']
+
+
+def _object_digest(d, xref, memo):
+
+    """
+    PURPOSE:    hash of one PDF object (definition with sorted keys and references blanked,
+                plus raw stream), and the objects it references (computed once per object and document)
+
+    INPUTS:     d = fitz Document object
+                xref = object number
+                memo = dictionary of xref -> (digest, referenced xrefs)
+
+    OUTPUTS:    digest = bytes
+                refs = referenced object numbers, in order of appearance
+                is_page = True if the object is a page
+    """
+
+    if xref not in memo:
+        ### DICTIONARIES IN KEY ORDER (COPYING A PAGE TO ANOTHER PDF MAY REORDER THEM)
+        keys = sorted([k for k in d.xref_get_keys(xref) if k not in _BACK_REFS])
+        if len(keys) > 0:
+            obj = ''.join([f"/{k} {d.xref_get_key(xref, k)[1]}" for k in keys])
+        else:
+            obj = d.xref_object(xref, compressed=True)
+        h = hashlib.sha1(_REF.sub('R', obj).encode())
+        if d.xref_is_stream(xref):
+            h.update(d.xref_stream_raw(xref) or b'')
+        is_page = ('Type' in keys) and (d.xref_get_key(xref, 'Type')[1] == '/Page')
+        memo[xref] = (h.digest(), [int(x) for x in _REF.findall(obj)], is_page)
+
+    return memo[xref]
+
+
+def page_hash(d, pn, memo=None):
+
+    """
+    PURPOSE:    hash of everything a page's extraction results depend on: page size and
+                rotation, and every object the page reaches (content streams, resources,
+                fonts, images, Form XObjects and their resources, annotation appearances)
+                (object numbers are left out, so the same page in a re-saved PDF hashes the same)
+
+    INPUTS:     d = fitz Document object
+                pn = page number
+                memo [optional] = dictionary of object hashes shared by the pages of d
+
+    OUTPUTS:    h = hex digest (str)
+    """
+
+    memo = {} if memo is None else memo
+    page = d.load_page(int(pn))
+    h = hashlib.sha1()
+    h.update(repr((tuple(page.rect), page.rotation)).encode())
+
+    ### DEPTH-FIRST OVER THE REFERENCED OBJECTS (EACH ONCE; OTHER PAGES ARE NOT FOLLOWED)
+    stack, seen, n_xref = [page.xref], set(), d.xref_length()
+    while len(stack) > 0:
+        xref = stack.pop()
+        if xref in seen:
+            continue
+        seen.add(xref)
+        digest, refs, is_page = _object_digest(d, xref, memo)
+        if is_page and (xref != page.xref):
+            continue
+        h.update(digest)
+        stack += [x for x in reversed(refs) if (x not in seen) and (0 < x < n_xref)]
+
+    return h.hexdigest()
+
+
+def get_page_hashes(d, cache):
+
+    """
+    PURPOSE:    content hashes of all pages of a document (computed once per document)
+
+    INPUTS:     d = fitz Document object
+                cache = page cache of the document (see get_page_cache)
+
+    OUTPUTS:    hashes = list with one hash per page
+    """
+
+    if 'hashes' not in cache:
+        memo = {}
+        cache['hashes'] = [page_hash(d, pn, memo) for pn in range(d.page_count)]
+
+    return cache['hashes']
+
+
+def fill_page_cache(store, d, cache):
+
+    """
+    PURPOSE:    put stored results of unchanged pages into a document's page cache
+
+    INPUTS:     store = page store
+                d = fitz Document object
+                cache = page cache of the document (see get_page_cache)
+
+    OUTPUTS:    reused = page numbers served from the store
+                changed = page numbers that have to be extracted
+    """
+
+    reused, changed = [], []
+    for pn, h in enumerate(get_page_hashes(d, cache)):
+        if h not in store['pages']:
+            changed.append(pn)
+            continue
+        for kind, val in store['pages'][h].items():
+            cache[(kind, pn)] = val
+        reused.append(pn)
+
+    return reused, changed
+
+
+def store_pages(store, d, cache):
+
+    """
+    PURPOSE:    add the page results of a checked document to the store
+
+    INPUTS:     store = page store
+                d = fitz Document object
+                cache = page cache of the document (see get_page_cache)
+
+    OUTPUTS:    hashes = content hash of each page
+    """
+
+    hashes = get_page_hashes(d, cache)
+    for pn, h in enumerate(hashes):
+        entry = store['pages'].setdefault(h, {})
+        for kind in STORED_KINDS:
+            if (kind, pn) in cache:
+                entry[kind] = cache[(kind, pn)]
+
+    return hashes
+
+
+def get_violations(record, rules):
+
+    """
+    PURPOSE:    list the violations in a check_proposal record
+
+    INPUTS:     record = output of check_proposal
+                rules = compiled rules (see roses_rules.py)
+
+    OUTPUTS:    violations = dictionary of violation (str) -> description (str)
+                             (DAPR words are listed once per word, with all their pages)
+    """
+
+    th = rules['thresholds']
+    violations = {}
+
+    if (record['Font Size'] != -99) and (record['Font Size'] <= th['font_size_flag']):
+        violations['font size'] = f"median font size {record['Font Size']} pt"
+    if (record['N_Brac'] < th['min_bracket_refs']) and (record['N_Para'] > th['min_paren_refs']):
+        violations['() references'] = f"{record['N_Para']} () references instead of []"
+    if record['Image_Page_Frac'] > 0:
+        violations['image-only pages'] = f"{record['Image_Page_Frac']:.0%} image-only pages"
+    for word in np.unique(record['DAPR_Words']).tolist():
+        pages = [p for w, p in zip(record['DAPR_Words'], record['DAPR_Word_Pages']) if w == word]
+        violations[f'"{word}"'] = f'"{word}" on page(s) {", ".join([str(x) for x in pages])}'
+
+    return violations
+
+
+def diff_violations(old, new):
+
+    """
+    PURPOSE:    compare the violations of two versions of a proposal
+
+    INPUTS:     old, new = outputs of get_violations
+
+    OUTPUTS:    fixed = descriptions of violations only in old
+                added = descriptions of violations only in new
+    """
+
+    fixed = [old[k] for k in old if k not in new]
+    added = [new[k] for k in new if k not in old]
+
+    return fixed, added
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="List the proposals and pages in a page store")
+    parser.add_argument("Store_Path", type=str, help="page store written by check_roses_compliance.py --page_store")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.Store_Path) == False:
+        print(f"\n\tNo page store found at {args.Store_Path}\n\tQuitting program\n")
+        sys.exit()
+
+    Store = load_store(args.Store_Path)
+    print(f"\n\t{len(Store['proposals'])} proposals, {len(Store['pages'])} distinct pages\n")
+    for Prop_Nb, Val in sorted(Store['proposals'].items()):
+        print(f"\t{Prop_Nb}\t{len(Val['hashes'])} pages\t{len(Val['violations'])} violations")
+    print("")
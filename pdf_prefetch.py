@@ -0,0 +1,193 @@
+"""Read-ahead stage for proposal PDFs on slow (network) file systems
+
+A background thread reads the next few PDFs into memory while the current one is
+being checked, so file I/O overlaps with parsing. The read-ahead is bounded both
+by the number of files and by a byte budget. Documents are then opened from
+memory with fitz.open(stream=...).
+
+ThrottledReader is a stand-in for a slow file system (fixed latency plus limited
+bandwidth) to try this out locally:
+
+python pdf_prefetch.py proposals/ --latency 0.2 --mbps 10
+
+"""
+
+
+import sys, os, glob, time, queue, threading
+import numpy as np
+import argparse
+
+import fitz
+fitz.TOOLS.mupdf_display_errors(False)
+
+
+def read_file(path):
+
+    """
+    PURPOSE:    read a whole file into memory
+
+    INPUTS:     path = path to file
+
+    OUTPUTS:    data = file contents (bytes)
+    """
+
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class ThrottledReader:
+
+    """
+    PURPOSE:    stand-in for a slow file system: reads files with a fixed latency
+                per file plus limited bandwidth (for local testing)
+
+    INPUTS:     latency = seconds to wait before each read (float)
+                mbps = read bandwidth in MB/s (float; None = unlimited)
+    """
+
+    def __init__(self, latency=0.1, mbps=None):
+        self.latency = latency
+        self.mbps = mbps
+
+    def __call__(self, path):
+        data = read_file(path)
+        delay = self.latency
+        if self.mbps:
+            delay += len(data) / (self.mbps * 2**20)
+        time.sleep(delay)
+        return data
+
+
+def prefetch_pdfs(paths, n_ahead=4, max_bytes=256 * 2**20, read=read_file, stats=None):
+
+    """
+    PURPOSE:    read PDFs ahead in a background thread and hand them out in order
+
+    INPUTS:     paths = paths to PDFs (read in this order)
+                n_ahead = maximum number of files read ahead (int; default=4)
+                max_bytes = maximum number of bytes held in memory (int; default=256 MB)
+                            (a single file larger than this is still read, on its own)
+                read = function that reads one file into bytes (default=read_file)
+                stats [optional] = dictionary updated with 'queued' (files waiting)
+                                   and 'bytes' (bytes held) as the read-ahead runs
+
+    OUTPUTS:    generator of (path, data, err) in the order of paths
+                (err = exception raised reading the file, else None; pass all three
+                to open_pdf, which raises it, so a bad file fails where opening it would)
+    """
+
+    q = queue.Queue(maxsize=n_ahead)
+    cond = threading.Condition()
+    state = {'bytes': 0, 'stop': False}
+    if stats is None:
+        stats = {}
+    stats.update({'queued': 0, 'bytes': 0})
+
+    def reader():
+        try:
+            for path in paths:
+
+                ### WAIT FOR BYTE BUDGET (FILE SIZE IS A CHEAP METADATA CALL; A MISSING FILE IS REPORTED BY READ BELOW)
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    size = 0
+                with cond:
+                    while (state['bytes'] > 0) and (state['bytes'] + size > max_bytes) and not state['stop']:
+                        cond.wait()
+                    if state['stop']:
+                        return
+                    state['bytes'] += size
+                    stats['bytes'] = state['bytes']
+
+                ### READ FILE; ANY ERROR IS HANDED TO THE CONSUMER
+                try:
+                    item = (path, read(path), None, size)
+                except Exception as e:
+                    item = (path, None, e, size)
+                q.put(item)
+                stats['queued'] = q.qsize()
+        finally:
+            ### ALWAYS SIGNAL THE END SO THE CONSUMER NEVER WAITS FOREVER
+            q.put(None)
+
+    t = threading.Thread(target=reader, daemon=True)
+    t.start()
+
+    try:
+        while True:
+            item = q.get()
+            stats['queued'] = q.qsize()
+            if item is None:
+                break
+            path, data, err, size = item
+            try:
+                yield path, data, err
+            finally:
+                ### RELEASE BYTE BUDGET ONCE THE CONSUMER IS DONE WITH THIS FILE
+                with cond:
+                    state['bytes'] -= size
+                    stats['bytes'] = state['bytes']
+                    cond.notify_all()
+    finally:
+        ### STOP READER (E.G., IF CONSUMER STOPPED EARLY) AND UNBLOCK IT
+        with cond:
+            state['stop'] = True
+            cond.notify_all()
+        while t.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def open_pdf(path, data=None, err=None):
+
+    """
+    PURPOSE:    open a PDF from memory if it was prefetched, otherwise from disk
+
+    INPUTS:     path = path to PDF
+                data [optional] = PDF contents (bytes)
+                err [optional] = error raised while prefetching the PDF (raised here)
+
+    OUTPUTS:    doc = fitz Document object
+    """
+
+    if err is not None:
+        raise err
+
+    if data is None:
+        return fitz.open(path)
+
+    return fitz.open(stream=data, filetype='pdf')
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compare serial and prefetched reading of PDFs through a throttled stand-in file system")
+    parser.add_argument("PDF_Path", type=str, help="directory with PDFs")
+    parser.add_argument("--latency", type=float, help="seconds of latency per file read", default=0.1)
+    parser.add_argument("--mbps", type=float, help="read bandwidth in MB/s", default=None)
+    parser.add_argument("-k", "--n_ahead", type=int, help="number of files to read ahead", default=4)
+    args = parser.parse_args()
+
+    PDF_Files = [str(x) for x in np.sort(glob.glob(os.path.join(args.PDF_Path, '*.pdf')))]
+    if len(PDF_Files) == 0:
+        print("\nNo files found in folder set by PDF_Path\nQuitting program\n")
+        sys.exit()
+    Reader = ThrottledReader(latency=args.latency, mbps=args.mbps)
+
+    def work(doc):
+        return sum(len(doc.load_page(i).get_text("text")) for i in range(doc.page_count))
+
+    T0 = time.perf_counter()
+    for pval in PDF_Files:
+        work(open_pdf(pval, Reader(pval)))
+    T_Serial = time.perf_counter() - T0
+
+    T0 = time.perf_counter()
+    for pval, data, err in prefetch_pdfs(PDF_Files, n_ahead=args.n_ahead, read=Reader):
+        work(open_pdf(pval, data, err))
+    T_Prefetch = time.perf_counter() - T0
+
+    print(f"\n\t{len(PDF_Files)} PDFs:\tserial = {T_Serial:.2f} s,   prefetched = {T_Prefetch:.2f} s\n")
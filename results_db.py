@@ -0,0 +1,239 @@
+"""SQLite warehouse of DAPR check results across solicitations and cycles
+
+check_roses_compliance.py --db <file> adds each run's results to a local SQLite
+database, and old dapr_checks.csv files can be imported. The results are split
+into normalized tables:
+
+    runs        one row per run or imported CSV (solicitation, date, rules version, source)
+    proposals   one row per proposal and run (program, cycle, team, reference counts)
+    sections    STM and references page ranges, and whether the guess fell back (pFlag)
+    font_stats  median font size and whether it was flagged
+    dapr_hits   one row per DAPR word and page
+
+Indexes on solicitation, program/cycle, proposal number and word keep cross-cycle
+queries in milliseconds, e.g.
+
+    SELECT p.cycle, f.median_font FROM font_stats f JOIN proposals p USING (run_id, prop_nb)
+    WHERE p.program = 'ADAP' AND p.cycle BETWEEN 2022 AND 2025
+
+Example:
+
+python results_db.py import results.sqlite 2023_XRP/dapr_checks.csv 2024_ADAP/dapr_checks.csv
+python results_db.py query results.sqlite "SELECT word, COUNT(*) FROM dapr_hits GROUP BY word ORDER BY 2 DESC LIMIT 10"
+
+"""
+
+
+import sys, os, re, ast, json, time, sqlite3
+import numpy as np
+import pandas as pd
+import argparse
+
+
+DB_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY, solicitation TEXT, created TEXT, rules_version TEXT,
+    source TEXT, n_proposals INTEGER);
+CREATE TABLE IF NOT EXISTS proposals (
+    run_id INTEGER REFERENCES runs(run_id), prop_nb TEXT, solicitation TEXT, program TEXT, cycle INTEGER,
+    team_members TEXT, n_brac INTEGER, n_etal INTEGER, n_para INTEGER, image_page_frac REAL,
+    PRIMARY KEY (run_id, prop_nb));
+CREATE TABLE IF NOT EXISTS sections (
+    run_id INTEGER, prop_nb TEXT, section TEXT, start_page INTEGER, end_page INTEGER, fallback INTEGER);
+CREATE TABLE IF NOT EXISTS font_stats (
+    run_id INTEGER, prop_nb TEXT, median_font REAL, flagged INTEGER);
+CREATE TABLE IF NOT EXISTS dapr_hits (
+    run_id INTEGER, prop_nb TEXT, word TEXT, page INTEGER, count INTEGER);
+CREATE INDEX IF NOT EXISTS runs_solicitation ON runs (solicitation);
+CREATE INDEX IF NOT EXISTS proposals_solicitation ON proposals (solicitation);
+CREATE INDEX IF NOT EXISTS proposals_program_cycle ON proposals (program, cycle);
+CREATE INDEX IF NOT EXISTS proposals_prop_nb ON proposals (prop_nb);
+CREATE INDEX IF NOT EXISTS sections_prop ON sections (run_id, prop_nb);
+CREATE INDEX IF NOT EXISTS font_stats_prop ON font_stats (run_id, prop_nb);
+CREATE INDEX IF NOT EXISTS dapr_hits_word ON dapr_hits (word);
+CREATE INDEX IF NOT EXISTS dapr_hits_prop ON dapr_hits (prop_nb);
+"""
+
+### LIST-VALUED COLUMNS OF dapr_checks.csv (WRITTEN AS PYTHON LISTS)
+LIST_COLUMNS = ['Team Members', 'STM_Pages', 'Ref Pages', 'DAPR_Words', 'DAPR_Word_Count', 'DAPR_Word_Pages']
+
+
+def open_db(db_path):
+
+    """
+    PURPOSE:    open (and if needed create) the results database
+
+    INPUTS:     db_path = path to SQLite file
+
+    OUTPUTS:    con = sqlite3 connection
+    """
+
+    con = sqlite3.connect(db_path)
+    con.executescript(SCHEMA)
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0:
+        con.execute(f"PRAGMA user_version = {DB_VERSION}")
+    elif version != DB_VERSION:
+        print(f"\n\tResults database {db_path} has an unknown version ({version})\n\tQuitting program\n")
+        sys.exit()
+
+    return con
+
+
+def get_solicitation(prop_nb):
+
+    """
+    PURPOSE:    get solicitation, program and cycle from an NSPIRES proposal number
+                (e.g., "22-ADAP22-0047" -> "ADAP22", "ADAP", 2022)
+
+    INPUTS:     prop_nb = proposal number (str)
+
+    OUTPUTS:    solicitation, program (str; '' if unknown) and cycle (int; None if unknown)
+    """
+
+    parts = str(prop_nb).split('-')
+    if len(parts) < 3:
+        return '', '', None
+    program = re.match(r'[A-Za-z]*', parts[1]).group(0).upper()
+    cycle = 2000 + int(parts[0]) if parts[0].isdigit() and (len(parts[0]) == 2) else None
+
+    return parts[1], program, cycle
+
+
+def _int(x, default=None):
+    """ int of a CSV/record value (default if missing) """
+    try:
+        return int(x) if not pd.isnull(x) else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _list(x):
+    """ list of a CSV/record value (lists are written as Python lists in dapr_checks.csv) """
+    if isinstance(x, (list, tuple, np.ndarray)):
+        return list(x)
+    if (x is None) or (isinstance(x, float) and np.isnan(x)) or (str(x).strip() == ''):
+        return []
+    try:
+        return list(ast.literal_eval(str(x)))
+    except (ValueError, SyntaxError):
+        return []
+
+
+def add_run(con, records, source, font_size_flag=11.8, rules_version=None, solicitation=None, created=None):
+
+    """
+    PURPOSE:    add the results of one run (or one imported CSV file) to the database
+
+    INPUTS:     con = output of open_db
+                records = list of check_proposal records (or rows of dapr_checks.csv as dictionaries)
+                source = where the results come from (e.g., PDF folder or CSV path)
+                font_size_flag = median font sizes at or below this are flagged (pt)
+                rules_version [optional] = rules version (default = from the records)
+                solicitation [optional] = solicitation of the run (default = from the proposal numbers)
+                created [optional] = date of the run (default = now)
+
+    OUTPUTS:    run_id = id of the run in the database
+    """
+
+    records = [x for x in records if x is not None]
+    sols = [solicitation if solicitation else get_solicitation(x['Prop_Nb'])[0] for x in records]
+    if rules_version is None:
+        rules_version = next((str(x['Rules_Version']) for x in records if not pd.isnull(x.get('Rules_Version'))), None)
+
+    with con:
+        cur = con.execute("INSERT INTO runs (solicitation, created, rules_version, source, n_proposals) VALUES (?, ?, ?, ?, ?)",
+                          (','.join(sorted(set(sols))), created if created else time.strftime('%Y-%m-%d %H:%M:%S'),
+                           rules_version, source, len(records)))
+        run_id = cur.lastrowid
+
+        props, secs, fonts, hits = [], [], [], []
+        for rec, sol in zip(records, sols):
+            pn = str(rec['Prop_Nb'])
+            _, program, cycle = get_solicitation(pn)
+            props.append((run_id, pn, sol, program, cycle, json.dumps([str(x).strip() for x in _list(rec.get('Team Members'))]),
+                          _int(rec.get('N_Brac')), _int(rec.get('N_EtAl')), _int(rec.get('N_Para')),
+                          None if pd.isnull(rec.get('Image_Page_Frac', np.nan)) else float(rec['Image_Page_Frac'])))
+            fallback = int(str(rec.get('Flag Pages', '')) == 'Yes')
+            for section, col in [('stm', 'STM_Pages'), ('ref', 'Ref Pages')]:
+                pages = _list(rec.get(col))
+                if len(pages) == 2:
+                    secs.append((run_id, pn, section, _int(pages[0]), _int(pages[1]), fallback))
+            mfs = rec.get('Font Size')
+            if not pd.isnull(mfs):
+                fonts.append((run_id, pn, float(mfs), int((float(mfs) != -99) and (float(mfs) <= font_size_flag))))
+            for word, count, page in zip(_list(rec.get('DAPR_Words')), _list(rec.get('DAPR_Word_Count')), _list(rec.get('DAPR_Word_Pages'))):
+                hits.append((run_id, pn, str(word), _int(page), _int(count)))
+
+        con.executemany("INSERT OR REPLACE INTO proposals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", props)
+        con.executemany("INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?)", secs)
+        con.executemany("INSERT INTO font_stats VALUES (?, ?, ?, ?)", fonts)
+        con.executemany("INSERT INTO dapr_hits VALUES (?, ?, ?, ?, ?)", hits)
+
+    return run_id
+
+
+def import_csv(con, csv_path, font_size_flag=11.8, solicitation=None):
+
+    """
+    PURPOSE:    import an existing dapr_checks.csv file as one run
+
+    INPUTS:     con = output of open_db
+                csv_path = path to dapr_checks.csv
+                font_size_flag = median font sizes at or below this are flagged (pt)
+                solicitation [optional] = solicitation of the file (default = from the proposal numbers)
+
+    OUTPUTS:    run_id = id of the run in the database
+                n = number of proposals imported
+    """
+
+    df = pd.read_csv(csv_path, dtype={'Prop_Nb': str, 'Flag Pages': str, 'Rules_Version': str})
+    if 'Prop_Nb' not in df.columns:
+        print(f"\n\t{csv_path} has no Prop_Nb column (not a dapr_checks.csv file?)\n\tQuitting program\n")
+        sys.exit()
+
+    created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getmtime(csv_path)))
+    run_id = add_run(con, df.to_dict('records'), os.path.abspath(csv_path), font_size_flag=font_size_flag,
+                     solicitation=solicitation, created=created)
+
+    return run_id, len(df)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="SQLite warehouse of DAPR check results: import dapr_checks.csv files or run a query")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_imp = sub.add_parser('import', help="import dapr_checks.csv files (one run each)")
+    p_imp.add_argument("DB_Path", type=str, help="path to results database (created if needed)")
+    p_imp.add_argument("CSV_Paths", type=str, nargs='+', help="dapr_checks.csv files")
+    p_imp.add_argument("-s", "--solicitation", type=str, help="solicitation of the files (default = from the proposal numbers)", default=None)
+    p_imp.add_argument("-r", "--rules", type=str, help="rules file for the font size flag. Default is roses_rules.json.", default=None)
+    p_qry = sub.add_parser('query', help="run an SQL query and print the result")
+    p_qry.add_argument("DB_Path", type=str, help="path to results database")
+    p_qry.add_argument("SQL", type=str, help="SQL query")
+    p_qry.add_argument("-o", "--output", type=str, help="optional CSV file to write the result to", default=None)
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        from roses_rules import load_rules
+        Flag = load_rules(args.rules)['thresholds']['font_size_flag']
+        Con = open_db(args.DB_Path)
+        print("")
+        for CSV_Path in args.CSV_Paths:
+            Run_ID, N = import_csv(Con, CSV_Path, font_size_flag=Flag, solicitation=args.solicitation)
+            print(f"\t{CSV_Path}:\t{N} proposals (run {Run_ID})")
+        print("")
+
+    else:
+        if os.path.isfile(args.DB_Path) == False:
+            print(f"\n\tNo results database found at {args.DB_Path}\n\tQuitting program\n")
+            sys.exit()
+        Con = open_db(args.DB_Path)
+        T0 = time.perf_counter()
+        DF = pd.read_sql_query(args.SQL, Con)
+        print(DF.to_string(index=False))
+        print(f"\n\t{len(DF)} rows in {1000 * (time.perf_counter() - T0):.1f} ms\n")
+        if args.output:
+            DF.to_csv(args.output, index=False)
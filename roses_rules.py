@@ -0,0 +1,157 @@
+"""Rules file for section detection and violation checks
+
+Section keywords (STM start, references start and end, front matter), DAPR
+pronouns and the format/reference thresholds used by all checking scripts are
+kept in one JSON file (roses_rules.json by default). The file is validated and
+compiled once per process: each keyword list becomes a KeywordMatcher that scans
+a page once for all of its keywords. The rules version is recorded in the outputs.
+
+Example (validate a rules file and print its contents):
+
+python roses_rules.py my_rules.json
+
+"""
+
+
+import sys, os, re, json
+
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'roses_rules.json')
+
+### REQUIRED ENTRIES OF THE RULES FILE
+SECTION_KEYS = ['nspires_budget', 'project_summary', 'references', 'references_end', 'redaction_marker',
+                'front_matter', 'references_heading']
+THRESHOLD_KEYS = ['font_size_flag', 'max_cpi', 'max_lpi', 'min_bracket_refs', 'min_paren_refs',
+                  'max_paren_ref_number', 'min_line_chars']
+
+
+class KeywordMatcher:
+
+    """
+    PURPOSE:    find which of a list of keywords occur in a text with one regex scan
+                (lookahead alternation, longest keyword first, so overlapping keywords are
+                all seen; keywords contained in a found keyword are added from a precomputed
+                substring closure, e.g. "budget narrative" also means "budget")
+
+    INPUTS:     keywords = list of keywords (matched as lower-case substrings)
+    """
+
+    def __init__(self, keywords):
+        self.keywords = sorted(set([x.lower() for x in keywords]), key=lambda x: (-len(x), x))
+        if len(self.keywords) == 0:
+            self.pattern = re.compile(r'(?!)')
+        else:
+            self.pattern = re.compile('(?=(' + '|'.join([re.escape(x) for x in self.keywords]) + '))')
+        self.closure = {x: set([y for y in self.keywords if y in x]) for x in self.keywords}
+
+    def found(self, t):
+        """ set of keywords in (lower-case) text t """
+        out = set()
+        for m in self.pattern.finditer(t):
+            out |= self.closure[m.group(1)]
+        return out
+
+    def any_in(self, t):
+        """ True if any keyword is in (lower-case) text t """
+        return self.pattern.search(t) is not None
+
+    def new_in(self, t1, t2):
+        """ True if some keyword is in t2 but not in t1 (e.g., a section starts on the next page) """
+        return len(self.found(t2) - self.found(t1)) > 0
+
+    def first(self, t):
+        """ position of the first keyword in (lower-case) text t (-1 if none) """
+        m = self.pattern.search(t)
+        return -1 if m is None else m.start()
+
+
+def _quit(path, problem):
+    print(f"\n\tRules file {path}: {problem}\n\tQuitting program\n")
+    sys.exit()
+
+
+def validate_rules(rules, path=''):
+
+    """
+    PURPOSE:    check that a rules dictionary has all required entries with valid values
+                (quits with a message otherwise)
+
+    INPUTS:     rules = rules as read from the JSON file
+                path = path of the rules file (for messages)
+    """
+
+    if not isinstance(rules, dict):
+        _quit(path, "must be a JSON object")
+    if not isinstance(rules.get('version'), str) or (rules['version'].strip() == ''):
+        _quit(path, "'version' must be a non-empty string")
+
+    sections = rules.get('sections')
+    if not isinstance(sections, dict):
+        _quit(path, "'sections' must be an object of keyword lists")
+    for key in SECTION_KEYS:
+        if key not in sections:
+            _quit(path, f"'sections' is missing '{key}'")
+    for key, val in sections.items():
+        if not isinstance(val, list) or not all([isinstance(x, str) and (x.strip() != '') for x in val]):
+            _quit(path, f"'sections.{key}' must be a list of non-empty strings")
+
+    if not isinstance(rules.get('pronouns'), list) or not all([isinstance(x, str) and (x.strip() != '') for x in rules['pronouns']]):
+        _quit(path, "'pronouns' must be a list of non-empty strings")
+
+    thresholds = rules.get('thresholds')
+    if not isinstance(thresholds, dict):
+        _quit(path, "'thresholds' must be an object of numbers")
+    for key in THRESHOLD_KEYS:
+        if key not in thresholds:
+            _quit(path, f"'thresholds' is missing '{key}'")
+    for key, val in thresholds.items():
+        if isinstance(val, bool) or not isinstance(val, (int, float)) or (val < 0):
+            _quit(path, f"'thresholds.{key}' must be a non-negative number")
+
+
+### RULES ALREADY LOADED BY THIS PROCESS: path -> compiled rules
+_rules = {}
+
+def load_rules(path=None):
+
+    """
+    PURPOSE:    load, validate and compile a rules file (once per process and path)
+
+    INPUTS:     path = path to rules JSON file (default = roses_rules.json next to this script)
+
+    OUTPUTS:    rules = dictionary with 'version', 'path', 'sections' (name -> KeywordMatcher),
+                        'pronouns' (list) and 'thresholds' (name -> number)
+    """
+
+    path = os.path.abspath(path if path else DEFAULT_RULES_PATH)
+    if path in _rules:
+        return _rules[path]
+
+    if not os.path.isfile(path):
+        _quit(path, "not found")
+    try:
+        with open(path) as f:
+            raw = json.load(f)
+    except ValueError as e:
+        _quit(path, f"not valid JSON ({e})")
+    validate_rules(raw, path)
+
+    _rules[path] = {'version': raw['version'], 'path': path,
+                    'sections': {k: KeywordMatcher(v) for k, v in raw['sections'].items()},
+                    'pronouns': [x.lower() for x in raw['pronouns']],
+                    'thresholds': dict(raw['thresholds'])}
+
+    return _rules[path]
+
+
+if __name__ == "__main__":
+
+    Path = sys.argv[1] if len(sys.argv) > 1 else None
+    Rules = load_rules(Path)
+    print(f"\n\tRules file {Rules['path']} is valid (version {Rules['version']})\n")
+    for Key, Val in Rules['sections'].items():
+        print(f"\t{Key:<22}{', '.join(Val.keywords)}")
+    print(f"\t{'pronouns':<22}{', '.join(Rules['pronouns'])}")
+    for Key, Val in Rules['thresholds'].items():
+        print(f"\t{Key:<22}{Val}")
+    print("")
@@ -0,0 +1,179 @@
+"""Run check_roses_compliance.py checks for several solicitations with one shared worker pool
+
+The manifest is a CSV file with one row per solicitation and the columns
+
+    PDF_Path, PDF_Suffix, PM_Path, page_limit, output
+
+(plus an optional "aliases" column with an institution alias file). All proposals
+of all solicitations are fed into one process pool, largest documents first, so
+cores do not sit idle during each solicitation's long tail. Each solicitation
+gets its own results CSV file (output) and text report (output with .txt).
+
+Example:
+
+python run_manifest.py manifest.csv -n 16
+
+"""
+
+
+import sys, os, glob, time, traceback
+import numpy as np
+import pandas as pd
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import fitz
+fitz.TOOLS.mupdf_display_errors(False)
+
+from check_roses_compliance import check_proposal, write_results, get_prop_nb
+from institution_aliases import load_aliases, compile_aliases
+from event_log import EventLog, TextSink, JSONLSink
+from roses_rules import load_rules
+
+
+MANIFEST_COLUMNS = ['PDF_Path', 'PDF_Suffix', 'PM_Path', 'page_limit', 'output']
+
+
+def load_manifest(manifest_path):
+
+    """
+    PURPOSE:    load and validate the manifest of solicitations
+
+    INPUTS:     manifest_path = path to manifest CSV file
+
+    OUTPUTS:    dfm = manifest (DataFrame)
+    """
+
+    ### READ SUFFIX AS STRING (E.G., "_Redacted" OR "-DAPR") AND KEEP EMPTY STRINGS
+    dfm = pd.read_csv(manifest_path, dtype={'PDF_Suffix': str}, keep_default_na=False)
+
+    missing = [x for x in MANIFEST_COLUMNS if x not in dfm.columns]
+    if len(missing) > 0:
+        print(f"\n\tManifest is missing columns: {missing}\n\tQuitting program\n")
+        sys.exit()
+
+    for i, row in dfm.iterrows():
+        if not os.path.isdir(row['PDF_Path']):
+            print(f"\n\tManifest row {i+1}: no folder found at PDF_Path {row['PDF_Path']}\n\tQuitting program\n")
+            sys.exit()
+        if not os.path.isfile(row['PM_Path']):
+            print(f"\n\tManifest row {i+1}: no Proposal Master found at PM_Path {row['PM_Path']}\n\tQuitting program\n")
+            sys.exit()
+
+    return dfm
+
+
+def get_tasks(dfm):
+
+    """
+    PURPOSE:    list all proposals of all solicitations, largest documents first
+
+    INPUTS:     dfm = manifest (DataFrame)
+
+    OUTPUTS:    tasks = list of dictionaries (solicitation row, order within solicitation,
+                        path, proposal number, Proposal Master, page limit, aliases, pages)
+    """
+
+    tasks = []
+    for i, row in dfm.iterrows():
+        pdf_files = np.sort(glob.glob(os.path.join(row['PDF_Path'], '*' + row['PDF_Suffix'] + '.pdf')))
+        if len(pdf_files) == 0:
+            print(f"\n\tNo files found for manifest row {i+1} ({row['PDF_Path']}, {row['PDF_Suffix']})")
+        for k, pval in enumerate(pdf_files):
+
+            ### PAGE COUNT ONLY NEEDS THE PDF TRAILER; FALL BACK TO FILE SIZE IF UNREADABLE
+            try:
+                pages = fitz.open(str(pval)).page_count
+            except RuntimeError:
+                pages = 0
+
+            tasks.append({'sol': i, 'order': k, 'path': str(pval), 'prop_nb': get_prop_nb(str(pval), row['PDF_Suffix']),
+                          'pm_path': row['PM_Path'], 'stm_pl': int(row['page_limit']),
+                          'aliases': row.get('aliases', ''), 'pages': pages, 'bytes': os.path.getsize(pval)})
+
+    ### LARGEST DOCUMENTS FIRST (LONGEST TASKS START EARLY, SHORT ONES FILL IN AT THE END)
+    tasks.sort(key=lambda x: (-x['pages'], -x['bytes'], x['sol'], x['order']))
+
+    return tasks
+
+
+### COMPILED ALIAS FILES, ONCE PER WORKER PROCESS
+_aliases = {}
+
+def run_task(task):
+
+    """
+    PURPOSE:    check one proposal in a worker process
+
+    INPUTS:     task = one entry of get_tasks
+
+    OUTPUTS:    task = same task, with 'record' (check_proposal output), 'events' (buffered report),
+                       'error' (None or error message) and 'seconds' added
+    """
+
+    t0 = time.perf_counter()
+    output = EventLog(level=task['log_level'])
+    output.set_context(prop_nb=task['prop_nb'])
+    try:
+        aliases = None
+        if task['aliases']:
+            if task['aliases'] not in _aliases:
+                _aliases[task['aliases']] = compile_aliases(load_aliases(task['aliases']))
+            aliases = _aliases[task['aliases']]
+        doc = fitz.open(task['path'])
+        task['record'] = check_proposal(doc, task['prop_nb'], task['pm_path'], stm_pl=task['stm_pl'],
+                                        output=output, aliases=aliases, rules=load_rules(task['rules']))
+        task['error'] = None
+    except (Exception, SystemExit):
+        ### CHECKS QUIT WITH sys.exit() ON PROPOSAL MASTER PROBLEMS; REPORT THEM INSTEAD
+        task['record'] = None
+        task['error'] = traceback.format_exc(limit=1).strip().split('\n')[-1]
+        output.emit('warning', f"\n\tCould not check proposal: {task['error']}", level='warning', error=task['error'])
+    task['events'] = output.take()
+    task['seconds'] = time.perf_counter() - t0
+
+    return task
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run DAPR/format checks for all solicitations listed in a manifest with one shared worker pool")
+    parser.add_argument("Manifest_Path", type=str, help="path to manifest CSV file (PDF_Path, PDF_Suffix, PM_Path, page_limit, output)")
+    parser.add_argument("-n", "--n_workers", type=int, help="number of worker processes (default = number of CPUs)", default=None)
+    parser.add_argument("-j", "--jsonl", action="store_true", help="also write each solicitation's results as JSON Lines events (output with .jsonl)")
+    parser.add_argument("-r", "--rules", type=str, help="rules file with section keywords, pronouns and thresholds. Default is roses_rules.json.", default=None)
+    parser.add_argument("-l", "--log_level", type=str, choices=['detail', 'info', 'warning'], help="'info' leaves out the individual DAPR word hits. Default is 'detail'.", default='detail')
+    args = parser.parse_args()
+
+    DFM = load_manifest(args.Manifest_Path)
+
+    ### CHECK RULES FILE BEFORE STARTING WORKERS (EACH WORKER LOADS IT ONCE)
+    Rules = load_rules(args.rules)
+    Tasks = get_tasks(DFM)
+    for Task in Tasks:
+        Task['log_level'], Task['rules'] = args.log_level, Rules['path']
+    print(f"\n\t{len(Tasks)} proposals from {len(DFM)} solicitations (rules version {Rules['version']})\n")
+
+    ### ONE GLOBAL POOL FOR ALL PROPOSALS
+    Done = {i: [] for i in range(len(DFM))}
+    with ProcessPoolExecutor(max_workers=args.n_workers) as pool:
+        Futures = [pool.submit(run_task, x) for x in Tasks]
+        for p, fut in enumerate(as_completed(Futures)):
+            Task = fut.result()
+            Done[Task['sol']].append(Task)
+            Status = 'FAILED: ' + Task['error'] if Task['error'] else f"{Task['seconds']:.1f} s"
+            print(f"\t[{p+1}/{len(Tasks)}]\t{Task['prop_nb']}\t{Status}")
+
+    ### WRITE PER-SOLICITATION OUTPUTS (IN FILE ORDER)
+    for i, row in DFM.iterrows():
+        Sol_Tasks = sorted(Done[i], key=lambda x: x['order'])
+        write_results([x['record'] for x in Sol_Tasks], row['output'])
+        Events = [ev for x in Sol_Tasks for ev in x['events']]
+        with open(os.path.splitext(row['output'])[0] + '.txt', 'w') as f:
+            TextSink(f).write_events(Events)
+        if args.jsonl:
+            with open(os.path.splitext(row['output'])[0] + '.jsonl', 'w') as f:
+                JSONLSink(f).write_events(Events)
+        N_Failed = len([x for x in Sol_Tasks if x['error']])
+        print(f"\n\t{row['output']}:\t{len(Sol_Tasks)} proposals ({N_Failed} failed)")
+    print("")
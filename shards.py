@@ -0,0 +1,240 @@
+"""Split one solicitation across several machines and merge the results
+
+check_roses_compliance.py --shard i/N checks only shard i of N (1-based). The
+proposals are assigned to shards deterministically: largest page count first,
+ties broken by a stable hash of the proposal number (not Python's randomized
+hash()), each going to the shard with the fewest pages so far. Every machine that
+sees the same PDF folder computes the same assignment, so shards never overlap
+and stay balanced by page count. Each shard writes dapr_checks_shard<i>of<N>.csv,
+plus dapr_checks_skipped_shard<i>of<N>.csv with the proposals it skipped because
+they are incomplete (e.g., withdrawn).
+
+This script merges the shard CSV files into one file in proposal number order and
+checks that all shards are there, that no proposal was checked twice and
+(optionally, given the PDF folder) that no proposal is missing. Skipped proposals
+are listed but do not count as missing.
+
+Example:
+
+python shards.py dapr_checks_shard*of4.csv -o dapr_checks.csv --pdf_path proposals/ --pdf_suffix _Redacted
+
+"""
+
+
+import sys, os, re, glob, hashlib
+import numpy as np
+import pandas as pd
+import argparse
+
+import fitz
+fitz.TOOLS.mupdf_display_errors(False)
+
+
+def parse_shard(shard):
+
+    """
+    PURPOSE:    parse a shard argument such as "2/4"
+
+    INPUTS:     shard = "i/N" with 1 <= i <= N (str)
+
+    OUTPUTS:    i = shard number (int; 1-based)
+                n = number of shards (int)
+    """
+
+    m = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', str(shard))
+    if (m is None) or not (1 <= int(m.group(1)) <= int(m.group(2))):
+        print(f"\n\tShard must be given as i/N with 1 <= i <= N (got {shard})\n\tQuitting program\n")
+        sys.exit()
+
+    return int(m.group(1)), int(m.group(2))
+
+
+def stable_hash(prop_nb):
+
+    """
+    PURPOSE:    hash of a proposal number that is the same on every machine and run
+
+    INPUTS:     prop_nb = proposal number (str)
+
+    OUTPUTS:    h = hash (int)
+    """
+
+    return int(hashlib.md5(str(prop_nb).encode()).hexdigest()[:16], 16)
+
+
+def assign_shards(prop_nbs, pages, n_shards):
+
+    """
+    PURPOSE:    assign proposals to shards, balanced by page count
+                (largest first, each to the shard with the fewest pages so far)
+
+    INPUTS:     prop_nbs = proposal numbers
+                pages = page count of each proposal
+                n_shards = number of shards (int)
+
+    OUTPUTS:    shards = shard of each proposal (array of int; 1-based)
+    """
+
+    ### ORDER DOES NOT DEPEND ON HOW THE FILES WERE LISTED
+    order = sorted(range(len(prop_nbs)), key=lambda k: (-pages[k], stable_hash(prop_nbs[k]), prop_nbs[k]))
+
+    load, shards = np.zeros(n_shards), np.zeros(len(prop_nbs), dtype=int)
+    for k in order:
+        s = int(np.argmin(load))
+        shards[k] = s + 1
+        load[s] += max(pages[k], 1)
+
+    return shards
+
+
+def select_shard(pdf_files, prop_nbs, shard, n_shards):
+
+    """
+    PURPOSE:    keep only the PDFs of one shard (in their original order)
+
+    INPUTS:     pdf_files = paths to all PDFs of the solicitation
+                prop_nbs = proposal number of each PDF
+                shard = shard to keep (int; 1-based)
+                n_shards = number of shards (int)
+
+    OUTPUTS:    pdf_files = paths to the PDFs of this shard
+    """
+
+    ### PAGE COUNT ONLY NEEDS THE PDF TRAILER; UNREADABLE FILES COUNT AS EMPTY
+    pages = []
+    for pval in pdf_files:
+        try:
+            pages.append(fitz.open(str(pval)).page_count)
+        except RuntimeError:
+            pages.append(0)
+
+    shards = assign_shards(list(prop_nbs), pages, n_shards)
+
+    return [x for x, s in zip(pdf_files, shards) if s == shard]
+
+
+def get_shard_csv(csv_path, shard, n_shards):
+
+    """
+    PURPOSE:    name of a shard's results file (e.g., dapr_checks.csv -> dapr_checks_shard2of4.csv)
+
+    INPUTS:     csv_path = results file name of an unsharded run
+                shard = shard number (int; 1-based)
+                n_shards = number of shards (int)
+
+    OUTPUTS:    shard_path = results file name of the shard
+    """
+
+    root, ext = os.path.splitext(csv_path)
+
+    return f"{root}_shard{shard}of{n_shards}{ext}"
+
+
+def get_skipped_csv(shard_path):
+
+    """
+    PURPOSE:    name of the file listing a shard's skipped proposals
+                (e.g., dapr_checks_shard2of4.csv -> dapr_checks_skipped_shard2of4.csv)
+
+    INPUTS:     shard_path = shard results file name (output of get_shard_csv)
+
+    OUTPUTS:    skipped_path = skipped proposals file name
+    """
+
+    return os.path.join(os.path.dirname(shard_path), re.sub(r'_shard(\d+of\d+\.[^.]+)$', r'_skipped_shard\1', os.path.basename(shard_path)))
+
+
+def write_skipped(skipped, shard_path):
+
+    """
+    PURPOSE:    write the proposals a shard skipped (so the merge does not report them as missing)
+
+    INPUTS:     skipped = list of (proposal number, reason)
+                shard_path = shard results file name (output of get_shard_csv)
+    """
+
+    pd.DataFrame(skipped, columns=['Prop_Nb', 'Reason']).to_csv(get_skipped_csv(shard_path), index=False)
+
+
+def merge_shards(shard_paths, expected=None):
+
+    """
+    PURPOSE:    merge shard results files into one table in proposal number order
+
+    INPUTS:     shard_paths = paths to shard CSV files (all N shards of one run)
+                expected [optional] = proposal numbers that should be in the results
+                                      (or in the skipped proposals files next to them)
+
+    OUTPUTS:    df = merged results (DataFrame)
+                problems = list of problems found (empty if the merge is complete)
+                skipped = DataFrame of proposals the shards skipped (Prop_Nb, Reason)
+    """
+
+    problems = []
+
+    ### ALL SHARDS OF ONE RUN MUST BE THERE (SKIPPED PROPOSALS FILES ARE READ WITH THEIR SHARD)
+    found = {}
+    for path in shard_paths:
+        if '_skipped_shard' in os.path.basename(path):
+            continue
+        m = re.search(r'_shard(\d+)of(\d+)\.[^.]+$', os.path.basename(path))
+        if m is None:
+            problems.append(f"{path} is not a shard results file (no _shard<i>of<N> in name)")
+            continue
+        found[(int(m.group(1)), int(m.group(2)))] = path
+    n_shards = np.unique([x[1] for x in found])
+    if len(n_shards) > 1:
+        problems.append(f"shard files come from runs with different numbers of shards: {n_shards.tolist()}")
+    for n in n_shards:
+        missing = [i for i in range(1, n + 1) if (i, n) not in found]
+        if len(missing) > 0:
+            problems.append(f"missing shard(s) {missing} of {n}")
+
+    ### PROPOSALS SKIPPED BY EACH SHARD (E.G., INCOMPLETE OR WITHDRAWN)
+    skipped = [pd.read_csv(get_skipped_csv(found[x]), dtype={'Prop_Nb': str}) for x in sorted(found) if os.path.isfile(get_skipped_csv(found[x]))]
+    skipped = pd.concat(skipped, ignore_index=True) if len(skipped) > 0 else pd.DataFrame(columns=['Prop_Nb', 'Reason'])
+
+    ### READ AND MERGE (PROPOSAL NUMBERS STAY STRINGS)
+    dfs = [pd.read_csv(found[x], dtype={'Prop_Nb': str}) for x in sorted(found)]
+    if len(dfs) == 0:
+        return pd.DataFrame(), problems + ["no shard results files"], skipped
+    df = pd.concat(dfs, ignore_index=True).sort_values('Prop_Nb', kind='stable').reset_index(drop=True)
+
+    ### NO OVERLAP AND NOTHING MISSING
+    dupes = df['Prop_Nb'][df['Prop_Nb'].duplicated()].unique().tolist()
+    if len(dupes) > 0:
+        problems.append(f"proposal(s) in more than one shard: {dupes}")
+    if expected is not None:
+        missing = sorted(set(expected) - set(df['Prop_Nb']) - set(skipped['Prop_Nb']))
+        if len(missing) > 0:
+            problems.append(f"proposal(s) without results: {missing}")
+
+    return df, problems, skipped
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Merge per-shard dapr_checks CSV files and check that no proposal is missing")
+    parser.add_argument("Shard_Paths", type=str, nargs='+', help="shard results files (dapr_checks_shard<i>of<N>.csv)")
+    parser.add_argument("-o", "--output", type=str, help="merged results file. Default is dapr_checks.csv.", default='dapr_checks.csv')
+    parser.add_argument("--pdf_path", type=str, help="optional PDF folder of the run, to check that every proposal has results", default=None)
+    parser.add_argument("--pdf_suffix", type=str, help="suffix of the PDFs in pdf_path (e.g., _Redacted)", default='')
+    args = parser.parse_args()
+
+    ### IMPORTED HERE BECAUSE check_roses_compliance.py IMPORTS THIS MODULE
+    from check_roses_compliance import get_prop_nb
+
+    Expected = None
+    if args.pdf_path:
+        Expected = [get_prop_nb(str(x), args.pdf_suffix) for x in np.sort(glob.glob(os.path.join(args.pdf_path, '*' + args.pdf_suffix + '.pdf')))]
+
+    DF, Problems, Skipped = merge_shards(args.Shard_Paths, Expected)
+    if len(DF) > 0:
+        DF.to_csv(args.output, index=False)
+        print(f"\n\t{len(DF)} proposals merged into {args.output}")
+    if len(Skipped) > 0:
+        print(f"\t{len(Skipped)} proposals skipped by the shards: " + ", ".join([f"{x} ({y})" for x, y in zip(Skipped['Prop_Nb'], Skipped['Reason'])]))
+    if len(Problems) > 0:
+        print("\n\tMerge is incomplete:\n\t\t" + "\n\t\t".join(Problems) + "\n")
+        sys.exit(1)
+    print("\tAll shards present, no proposal missing\n")
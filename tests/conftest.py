@@ -0,0 +1,80 @@
+"""Shared fixtures: small synthetic NSPIRES-style proposals and Proposal Masters"""
+
+
+import os, sys
+import pytest
+
+import fitz
+fitz.TOOLS.mupdf_display_errors(False)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+LOREM = ("The observations will constrain the thermal structure of exoplanet atmospheres using spectra [12] "
+         "and new models of cloud formation in hot gas giants. ")
+
+PM_HEADER = ("Response Number,PI Last Name,Linked Org,PI Company Name,PI City,"
+             "Member 1 Name,Member 1 Organization,Member 2 Name,Member 2 Organization\n")
+
+
+def make_proposal(path, n_stm=15, team_word='Leavitt', n_cover=5, n_budget=3, n_ref=2, words=None):
+
+    """
+    PURPOSE:    write a synthetic full NSPIRES proposal: cover pages (project summary on
+                page 3), budget pages, STM pages, references, then DMP and budget narrative
+
+    INPUTS:     path = output PDF
+                n_stm, n_cover, n_budget, n_ref = number of pages of each section
+                team_word = word put on the fourth STM page (with "he/she")
+                words [optional] = list of STM page texts to use instead of LOREM
+    """
+
+    d = fitz.open()
+    for i in range(n_cover):
+        p = d.new_page()
+        p.insert_text((50, 72), "SECTION VII - Project Summary\nWe study planets." if i == 2 else f"Cover page {i}", fontsize=11)
+    for i in range(n_budget):
+        p = d.new_page()
+        p.insert_text((50, 72), "SECTION X - Budget\nline items", fontsize=11)
+    for i in range(n_stm):
+        p = d.new_page()
+        if words is not None:
+            txt = words[i]
+        else:
+            txt = "\n".join((LOREM[:90] + (f" {team_word} said he/she" if (i == 3) and (j == 4) else "")) for j in range(40))
+        p.insert_textbox(fitz.Rect(40, 40, 580, 780), txt, fontsize=12)
+    for i in range(n_ref):
+        p = d.new_page()
+        p.insert_text((50, 72), "References\n[1] Sagan, C. et al. 1990", fontsize=11)
+    p = d.new_page()
+    p.insert_text((50, 72), "Data Management Plan\nstuff", fontsize=11)
+    p = d.new_page()
+    p.insert_text((50, 72), "Budget Narrative\nmore", fontsize=11)
+    d.save(path)
+
+
+def make_proposal_master(path, rows):
+
+    """
+    PURPOSE:    write a Proposal Master CSV file
+
+    INPUTS:     path = output CSV file
+                rows = list of (proposal number, PI last name, organization, member name)
+    """
+
+    with open(path, 'w') as f:
+        f.write(PM_HEADER)
+        for prop_nb, pi, org, member in rows:
+            f.write(f'{prop_nb},"{pi}, Pat",{org},{org},"Tucson, AZ","{member}, Sam",{org},,\n')
+
+
+@pytest.fixture
+def proposal_dir(tmp_path):
+    """ folder with three proposals (_Redacted suffix) and their Proposal Master pm.csv """
+    make_proposal(str(tmp_path / '23-XRP23_2-0001_Redacted.pdf'), team_word='Leavitt')
+    make_proposal(str(tmp_path / '23-XRP23_2-0002_Redacted.pdf'), team_word='Sagan')
+    make_proposal(str(tmp_path / '23-XRP23_2-0003_Redacted.pdf'), n_stm=12, team_word='Hubble')
+    make_proposal_master(str(tmp_path / 'pm.csv'), [('23-XRP23_2-0001', 'Doe', 'Harvard College', 'Leavitt'),
+                                                    ('23-XRP23_2-0002', 'Roe', 'Cornell University', 'Sagan'),
+                                                    ('23-XRP23_2-0003', 'Poe', 'Mount Wilson', 'Hubble')])
+    return tmp_path
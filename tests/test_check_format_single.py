@@ -0,0 +1,19 @@
+import os, sys, subprocess
+
+import pandas as pd
+
+from conftest import make_proposal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_failed_proposal_keeps_the_count_columns_integer(tmp_path):
+    make_proposal(str(tmp_path / '23-XRP23_2-0001_Full.pdf'))
+    with open(tmp_path / '23-XRP23_2-0002_Full.pdf', 'wb') as f:
+        f.write(b'%PDF-1.7 truncated')
+    res = subprocess.run([sys.executable, os.path.join(ROOT, 'check_format_single.py'), '-n', '1', '.'],
+                         cwd=tmp_path, capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    df = pd.read_csv(tmp_path / 'format_checks.csv', dtype=str)
+    assert df[['Total Pages', 'N_LPI_Pages', 'N_CPI_Lines']].values.tolist() == [['27', '0', '0'], ['-99', '-99', '-99']]
+    assert df['Error'].notnull().tolist() == [False, True]
@@ -0,0 +1,71 @@
+import os, sys, subprocess
+
+import pandas as pd
+
+from conftest import make_proposal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_check(folder, *options):
+    """ run check_roses_compliance.py on a folder of _Redacted proposals with Proposal Master pm.csv """
+    return subprocess.run([sys.executable, os.path.join(ROOT, 'check_roses_compliance.py'), '-q', '-o', 'out.txt', *options, '.', '_Redacted', 'pm.csv'],
+                          cwd=folder, capture_output=True, text=True)
+
+
+def get_metric(path, name):
+    for line in open(path):
+        if line.startswith(f'roses_{name} '):
+            return float(line.split()[1])
+    return 0
+
+
+def test_skipped_and_failed_are_counted_apart(proposal_dir):
+    make_proposal(str(proposal_dir / '23-XRP23_2-0004_Redacted.pdf'), n_stm=0, n_ref=0)
+    with open(proposal_dir / '23-XRP23_2-0005_Redacted.pdf', 'wb') as f:
+        f.write(b'%PDF-1.7 truncated')
+
+    res = run_check(proposal_dir, '-m', 'metrics.prom')
+    assert res.returncode == 0, res.stderr
+    assert '23-XRP23_2-0005: check failed' in res.stderr
+    assert get_metric(proposal_dir / 'metrics.prom', 'proposals_total') == 3
+    assert get_metric(proposal_dir / 'metrics.prom', 'proposals_skipped_total') == 1
+    assert get_metric(proposal_dir / 'metrics.prom', 'proposals_failed_total') == 1
+    assert pd.read_csv(proposal_dir / 'dapr_checks.csv')['Prop_Nb'].tolist() == [f'23-XRP23_2-000{i}' for i in range(1, 4)]
+
+
+def test_history_only_with_option_and_not_with_page_store(proposal_dir):
+    assert run_check(proposal_dir).returncode == 0
+    assert not os.path.exists(proposal_dir / 'throughput_history.csv')
+
+    assert run_check(proposal_dir, '--history', 'history.csv', '-c', 'store.pkl').returncode == 0
+    assert not os.path.exists(proposal_dir / 'history.csv')
+
+    assert run_check(proposal_dir, '--history', 'history.csv').returncode == 0
+    dfh = pd.read_csv(proposal_dir / 'history.csv')
+    assert len(dfh) == 3 and set(dfh['Mode']) == {'dapr'}
+
+
+def test_failed_snapshot_write_leaves_no_temporary_file(tmp_path, monkeypatch):
+    import check_roses_compliance
+
+    def fail(src, dst):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(check_roses_compliance.os, 'replace', fail)
+    snap_file = str(tmp_path / 'pm.csv.snapshot.pkl')
+    check_roses_compliance.write_pm_snapshot(snap_file, (0, 0), 'sha1', pd.DataFrame(), {})
+    assert os.listdir(tmp_path) == []
+
+
+def test_unreadable_input_with_prefetch_fails_like_a_bad_pdf(proposal_dir):
+    os.rename(proposal_dir / '23-XRP23_2-0002_Redacted.pdf', proposal_dir / 'moved.pdf')
+    os.mkdir(proposal_dir / '23-XRP23_2-0002_Redacted.pdf')
+    with open(proposal_dir / '23-XRP23_2-0004_Redacted.pdf', 'wb') as f:
+        f.write(b'%PDF-1.7 truncated')
+
+    for options in [[], ['-k', '2']]:
+        res = run_check(proposal_dir, *options)
+        assert res.returncode == 0, res.stderr
+        assert '23-XRP23_2-0002: check failed' in res.stderr and '23-XRP23_2-0004: check failed' in res.stderr
+        assert pd.read_csv(proposal_dir / 'dapr_checks.csv')['Prop_Nb'].tolist() == ['23-XRP23_2-0001', '23-XRP23_2-0003']
@@ -0,0 +1,33 @@
+import fitz
+
+from check_roses_compliance import classify_pages, get_text_pages, get_page_cache
+from conftest import make_proposal
+
+
+def make_scanned(path):
+    """ proposal whose 10th page is replaced by an image of itself (a scanned page) """
+    make_proposal(path)
+    d = fitz.open(path)
+    pix = d[9].get_pixmap(dpi=50)
+    d.delete_page(9)
+    p = d.new_page(9)
+    p.insert_image(p.rect, pixmap=pix)
+    d.save(path + '.scan.pdf')
+    return fitz.open(path + '.scan.pdf')
+
+
+def test_only_requested_pages_are_classified(tmp_path):
+    make_proposal(str(tmp_path / 'p.pdf'))
+    d = fitz.open(str(tmp_path / 'p.pdf'))
+    assert get_text_pages(d, 8, 12) == [8, 9, 10, 11]
+    cache = get_page_cache(d)
+    assert sorted(k[1] for k in cache if k[0] == 'class') == [8, 9, 10, 11]
+    assert sorted(k[1] for k in cache if k[0] == 'text') == [8, 9, 10, 11]
+
+
+def test_image_and_blank_pages(tmp_path):
+    d = make_scanned(str(tmp_path / 'p.pdf'))
+    d.new_page()
+    assert classify_pages(d, 8, 11).tolist() == ['text', 'image', 'text']
+    assert classify_pages(d, d.page_count - 1).tolist() == ['blank']
+    assert get_text_pages(d, 8, 11) == [8, 10]
@@ -0,0 +1,42 @@
+import os, sys, subprocess
+
+import pandas as pd
+
+import cross_screen
+from cross_screen import build_team_matcher, match_tokens, screen_proposal, get_hit_table
+from check_roses_compliance import load_proposal_master
+from conftest import make_proposal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_match_tokens_finds_phrases_in_one_pass():
+    matcher = {'phrases': {('mount', 'wilson'): ('Mount Wilson', ['C']), ('sagan',): ('Sagan', ['B'])},
+               'prefixes': {('mount',), ('mount', 'wilson'), ('sagan',)}}
+    assert match_tokens(matcher, 'at mount wilson and mount palomar with sagan and sagan'.split()) == {('mount', 'wilson'): 1, ('sagan',): 2}
+
+
+def test_proposal_naming_another_team(proposal_dir):
+    ### PROPOSAL 1 NAMES PROPOSAL 2'S TEAM MEMBER (SAGAN) ON ITS FOURTH STM PAGE
+    make_proposal(str(proposal_dir / '23-XRP23_2-0001_Redacted.pdf'), team_word='Sagan')
+    dfp, colnames = load_proposal_master(str(proposal_dir / 'pm.csv'))
+    cross_screen._init_worker(build_team_matcher(dfp, colnames))
+
+    hits, error = screen_proposal(str(proposal_dir / '23-XRP23_2-0001_Redacted.pdf'), '23-XRP23_2-0001')
+    assert error is None and hits == [('23-XRP23_2-0001', '23-XRP23_2-0002', 'Sagan', 1, 11)]
+    assert screen_proposal(str(proposal_dir / '23-XRP23_2-0003_Redacted.pdf'), '23-XRP23_2-0003') == ([], None)
+
+    df = get_hit_table(hits)
+    assert df[['Prop_Nb', 'Named_Prop_Nb', 'N_Hits']].values.tolist() == [['23-XRP23_2-0001', '23-XRP23_2-0002', 1]]
+    assert df['Word_Pages'].tolist() == [[12]]
+
+
+def test_corrupt_pdf_does_not_stop_the_run(proposal_dir):
+    make_proposal(str(proposal_dir / '23-XRP23_2-0001_Redacted.pdf'), team_word='Sagan')
+    with open(proposal_dir / '23-XRP23_2-0004_Redacted.pdf', 'wb') as f:
+        f.write(b'%PDF-1.7 truncated')
+    res = subprocess.run([sys.executable, os.path.join(ROOT, 'cross_screen.py'), '-n', '1', '.', '_Redacted', 'pm.csv'],
+                         cwd=proposal_dir, capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    assert '23-XRP23_2-0004\tcould not screen' in res.stdout
+    assert pd.read_csv(proposal_dir / 'cross_screen.csv')['Named_Prop_Nb'].tolist() == ['23-XRP23_2-0002']
@@ -0,0 +1,31 @@
+import os, sys, subprocess
+
+import fitz
+
+from export_annotations import get_event_marks, get_cpi_marks
+from test_check_roses_compliance import run_check, ROOT
+
+LONG_LINE = "Dense text " * 12
+
+
+def add_dense_lines(path, pn):
+    """ add lines well over the CPI limit to one STM page """
+    d = fitz.open(path)
+    d[pn].insert_text((40, 600), '\n'.join([LONG_LINE] * 8), fontsize=6)
+    d.saveIncr()
+
+
+def test_batch_runner_cpi_boxes_are_annotated(proposal_dir):
+    add_dense_lines(str(proposal_dir / '23-XRP23_2-0002_Redacted.pdf'), 10)
+    assert run_check(proposal_dir, '-f', '-j', 'events.jsonl').returncode == 0
+
+    marks, key = get_cpi_marks(str(proposal_dir / 'dapr_checks.csv'))
+    events = get_event_marks(str(proposal_dir / 'events.jsonl'))
+    cpi = [x for x in events['23-XRP23_2-0002'] if x[3] == 'cpi']
+    assert key == 'Prop_Nb' and list(marks) == ['23-XRP23_2-0002']
+    assert len(cpi) > 0 and marks['23-XRP23_2-0002'] == cpi and all(x[0] == 10 for x in cpi)
+
+    subprocess.run([sys.executable, os.path.join(ROOT, 'export_annotations.py'), 'dapr_checks.csv', '.', '--pdf_suffix', '_Redacted',
+                    '-o', 'annotated', '-n', '1'], cwd=proposal_dir, check=True, capture_output=True)
+    d = fitz.open(str(proposal_dir / 'annotated' / '23-XRP23_2-0002_Redacted_annotated.pdf'))
+    assert len(list(d[10].annots())) == len(cpi)
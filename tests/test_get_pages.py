@@ -0,0 +1,46 @@
+import fitz
+import pytest
+
+from check_roses_compliance import get_pages
+from event_log import EventLog
+from conftest import make_proposal
+
+
+def guesses(path, stm_pl=15):
+    """ STM and references page guesses (1-based, as in the report), flag and pages read """
+    log = EventLog()
+    stm, ref, pn, flag = get_pages(fitz.open(path), stm_pl=stm_pl, output=log)
+    read = [x['pages_examined'] for x in log.events if x['event'] == 'section_search'][0]
+    return [int(x) + 1 for x in stm], [int(x) + 1 for x in ref], flag, read
+
+
+### GUESSES OF THE FULL PAGE-BY-PAGE SCAN (BEFORE ONLY THE PAGES AROUND THE SECTION CHANGES WERE READ)
+BASELINE = [
+    (dict(n_budget=3, n_stm=6, n_ref=2), False, ([9, 19], [15, 17], 'Yes')),
+    (dict(n_stm=15), False, ([9, 23], [24, 25], '')),
+    (dict(n_stm=15), True, ([9, 23], [24, 25], '')),
+    (dict(n_budget=0, n_stm=15), False, ([1, 20], [21, 22], '')),
+    (dict(n_stm=11, n_ref=0), False, ([9, 22], [23, 20], 'Yes')),
+    (dict(n_stm=11, n_ref=0), True, ([9, 22], [12, 20], 'Yes')),
+    (dict(n_budget=1, n_stm=10, n_ref=0), True, ([7, 19], [10, 17], 'Yes')),
+    (dict(n_stm=18, n_ref=4), True, ([9, 26], [27, 30], '')),
+    (dict(n_stm=2), False, ([9, 15], [11, 13], 'Yes')),
+    (dict(n_stm=40, n_ref=3), False, ([9, 48], [49, 51], '')),
+]
+
+
+@pytest.mark.parametrize("layout, early_heading, expected", BASELINE)
+def test_guesses_match_full_scan(tmp_path, layout, early_heading, expected):
+    words = None
+    if early_heading:
+        ### A REFERENCES HEADING ON THE FOURTH STM PAGE (TOO EARLY TO END THE STM SECTION)
+        words = [("Bibliography of earlier work\n" if i == 3 else "") + f"STM page {i}" for i in range(layout['n_stm'])]
+    make_proposal(str(tmp_path / 'p.pdf'), words=words, **layout)
+    assert guesses(str(tmp_path / 'p.pdf'))[:3] == expected
+
+
+def test_stm_pages_are_not_read(tmp_path):
+    make_proposal(str(tmp_path / 'p.pdf'), n_stm=15)
+    stm, ref, flag, read = guesses(str(tmp_path / 'p.pdf'))
+    assert (stm, ref) == ([9, 23], [24, 25])
+    assert read <= 27 - 10
@@ -0,0 +1,68 @@
+import numpy as np
+
+from near_duplicates import new_index, add_proposal, remove_proposal, get_all_pairs, get_shingles, MIN_SHINGLES
+
+VOCAB = [f"w{i}" for i in range(5000)]
+
+
+def random_text(rng, n=600):
+    return ' '.join(rng.choice(VOCAB, n))
+
+
+def edit_text(rng, text, frac):
+    """ replace a fraction of the words (each replaced word breaks the shingles it is in) """
+    words = text.split()
+    for i in rng.choice(len(words), int(frac * len(words)), replace=False):
+        words[i] = rng.choice(VOCAB)
+    return ' '.join(words)
+
+
+def jaccard(a, b):
+    a, b = set(get_shingles(a).tolist()), set(get_shingles(b).tolist())
+    return len(a & b) / len(a | b)
+
+
+def test_identical_and_unrelated_text():
+    rng = np.random.RandomState(1)
+    index, text = new_index(), random_text(rng)
+    assert add_proposal(index, '23-XRP23_2-0001', text) == []
+    assert add_proposal(index, '23-XRP23_2-0002', text) == [('23-XRP23_2-0001', 1.0)]
+    assert add_proposal(index, '23-XRP23_2-0003', random_text(rng)) == []
+
+
+def test_short_text_is_not_indexed():
+    index = new_index()
+    assert add_proposal(index, '23-XRP23_2-0001', ' '.join(VOCAB[:MIN_SHINGLES])) is None
+    assert '23-XRP23_2-0001' not in index['proposals']
+
+
+def test_adding_again_replaces_the_proposal():
+    rng = np.random.RandomState(2)
+    index, text = new_index(), random_text(rng)
+    add_proposal(index, '23-XRP23_2-0001', text)
+    assert add_proposal(index, '23-XRP23_2-0001', text) == []
+    remove_proposal(index, '23-XRP23_2-0001')
+    assert index['proposals'] == {} and all(len(x) == 0 for x in index['buckets'])
+
+
+def test_recall_of_near_duplicates():
+    ### 40 ORIGINALS AND A LIGHTLY EDITED COPY OF EACH (JACCARD SIMILARITY ABOUT 0.6-0.8), PLUS 40 UNRELATED TEXTS
+    rng, edits = np.random.RandomState(3), np.random.RandomState(4)
+    index, found, sims = new_index(), 0, []
+    originals = [random_text(rng) for i in range(40)]
+    for i, text in enumerate(originals):
+        add_proposal(index, f'23-XRP23_2-{i:04d}', text)
+    for i in range(40):
+        add_proposal(index, f'23-XRP23_2-{100 + i:04d}', random_text(rng))
+    for i, text in enumerate(originals):
+        copy = edit_text(edits, text, 0.05)
+        sims.append(jaccard(text, copy))
+        pairs = add_proposal(index, f'24-XRP24_2-{i:04d}', copy)
+        found += f'23-XRP23_2-{i:04d}' in [x[0] for x in pairs]
+    assert 0.6 < np.mean(sims) < 0.85
+    assert found >= 38
+
+    ### ALL PAIRS IN THE INDEX: ONLY THE EDITED COPIES, NO FALSE PAIRS BETWEEN UNRELATED TEXTS
+    df = get_all_pairs(index)
+    assert len(df) >= 38
+    assert all(x[-4:] == y[-4:] for x, y in zip(df['Prop_Nb'], df['Other_Prop_Nb']))
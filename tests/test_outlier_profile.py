@@ -0,0 +1,21 @@
+import os
+
+from outlier_profile import OutlierProfiler
+
+
+def check_proposal(n):
+    return sum(range(n))
+
+
+def test_profile_runs_the_check_once_and_writes_both_files(tmp_path):
+    calls = []
+    paths, seconds = OutlierProfiler(str(tmp_path)).profile('23-XRP23_2-0001', lambda n: calls.append(check_proposal(n)), 100000)
+    assert len(calls) == 1
+    assert [os.path.basename(x) for x in paths] == ['23-XRP23_2-0001.pstats', '23-XRP23_2-0001.collapsed']
+    assert all(os.path.isfile(x) for x in paths)
+    assert 'check_proposal' in open(paths[1]).read()
+
+
+def test_outliers_need_history(tmp_path):
+    prof = OutlierProfiler(str(tmp_path), pct=90, min_history=3)
+    assert [prof.is_outlier(x) for x in [1.0, 1.2, 1.1, 1.0, 9.0]] == [False, False, False, False, True]
@@ -0,0 +1,62 @@
+import fitz
+
+from page_store import new_store, page_hash, get_page_hashes, fill_page_cache, store_pages
+from check_roses_compliance import get_text, get_page_cache, get_hit_boxes
+
+
+def make_wrapped(texts):
+    """ PDF whose pages all have the content stream "q /fzFrm0 Do Q" (pages wrapped as Form XObjects) """
+    src = fitz.open()
+    for t in texts:
+        src.new_page().insert_text((72, 72), t, fontsize=11)
+    out = fitz.open()
+    for i in range(len(texts)):
+        p = out.new_page()
+        p.show_pdf_page(p.rect, src, i)
+    return fitz.open('pdf', out.tobytes())
+
+
+def test_wrapped_pages_hash_differently():
+    d = make_wrapped(["alpha page text", "beta page text"])
+    assert d[0].read_contents() == d[1].read_contents()
+    assert page_hash(d, 0) != page_hash(d, 1)
+
+
+def test_renumbered_pages_hash_the_same():
+    d = make_wrapped(["alpha page text", "beta page text"])
+    d2 = fitz.open()
+    d2.new_page().insert_text((72, 72), "new first page", fontsize=11)
+    d2.insert_pdf(d)
+    d2 = fitz.open('pdf', d2.tobytes(garbage=4))
+    assert d2[1].xref != d[0].xref
+    assert get_page_hashes(d, {}) == get_page_hashes(d2, {})[1:]
+
+
+def test_store_does_not_mix_wrapped_proposals():
+    store = new_store()
+    d1 = make_wrapped(["first proposal MemberAA", "second page of the first"])
+    for pn in range(d1.page_count):
+        get_text(d1, pn)
+    store_pages(store, d1, get_page_cache(d1))
+
+    d2 = make_wrapped(["other proposal MemberBB", "second page of the other"])
+    reused, changed = fill_page_cache(store, d2, get_page_cache(d2))
+    assert reused == [] and changed == [0, 1]
+    assert 'MemberBB' in get_text(d2, 0)
+
+    d3 = make_wrapped(["first proposal MemberAA", "second page of the first"])
+    reused, changed = fill_page_cache(store, d3, get_page_cache(d3))
+    assert reused == [0, 1] and changed == []
+
+
+def test_line_boxes_come_from_the_store():
+    store = new_store()
+    d1 = make_wrapped(["a page with MemberAA on it"])
+    boxes = get_hit_boxes(d1, 0, [[12, 20]])
+    store_pages(store, d1, get_page_cache(d1))
+
+    d2 = make_wrapped(["a page with MemberAA on it"])
+    cache = get_page_cache(d2)
+    assert fill_page_cache(store, d2, cache) == ([0], [])
+    assert get_hit_boxes(d2, 0, [[12, 20]]) == boxes
+    assert ('textpage', 0) not in cache and 'pages_reread' not in cache
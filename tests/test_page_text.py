@@ -0,0 +1,22 @@
+import fitz
+
+from check_roses_compliance import get_text, get_text_lines
+from check_format_single import get_lines
+
+
+def make_page(path):
+    d = fitz.open()
+    p = d.new_page()
+    p.insert_text((50, 72), "Visible text on page\twith tab", fontsize=11)
+    p.insert_text((50, 100), "the ﬁrst   spaced  words", fontsize=11)
+    d.save(path)
+
+
+def test_cached_text_matches_page_get_text(tmp_path):
+    make_page(str(tmp_path / 'p.pdf'))
+    d = fitz.open(str(tmp_path / 'p.pdf'))
+    expected = fitz.open(str(tmp_path / 'p.pdf'))[0].get_text()
+    assert '\t' in expected
+    assert get_text(d, 0) == expected
+    assert ''.join(''.join(x['text'] for x in l['spans']) + '\n' for l in get_text_lines(d, 0)) == expected
+    assert '\n'.join(get_lines(fitz.open(str(tmp_path / 'p.pdf')), 0)[0]) == expected
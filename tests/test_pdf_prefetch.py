@@ -0,0 +1,71 @@
+import threading
+
+from pdf_prefetch import prefetch_pdfs, ThrottledReader, open_pdf
+from conftest import make_proposal
+
+
+def run_with_timeout(f, timeout=10):
+    """ run f in a thread; fail instead of hanging the test run """
+    out = {}
+    def target():
+        try:
+            out['value'] = f()
+        except Exception as e:
+            out['error'] = e
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), "prefetch consumer hangs"
+    return out
+
+
+def test_files_come_in_order(tmp_path):
+    paths = []
+    for i in range(4):
+        paths.append(str(tmp_path / f'23-XRP23_2-000{i}.pdf'))
+        make_proposal(paths[-1], n_stm=i + 1)
+    stats = {}
+    got = [(p, open_pdf(p, data, err).page_count) for p, data, err in prefetch_pdfs(paths, n_ahead=2, read=ThrottledReader(latency=0.01), stats=stats)]
+    assert [x[0] for x in got] == paths
+    assert [x[1] for x in got] == [13, 14, 15, 16]
+    assert stats['bytes'] == 0
+
+
+def test_missing_file_is_raised_by_open_pdf_and_the_rest_still_come(tmp_path):
+    good = str(tmp_path / 'good.pdf')
+    make_proposal(good, n_stm=1)
+    paths = [good, str(tmp_path / 'missing.pdf'), good]
+
+    def consume():
+        done = []
+        for p, data, err in prefetch_pdfs(paths, n_ahead=1, read=ThrottledReader(latency=0.01)):
+            try:
+                done.append(open_pdf(p, data, err).page_count)
+            except FileNotFoundError:
+                done.append('missing')
+        return done
+
+    assert run_with_timeout(consume).get('value') == [13, 'missing', 13]
+
+
+def test_any_read_error_is_handed_to_the_consumer(tmp_path):
+    good = str(tmp_path / 'good.pdf')
+    make_proposal(good, n_stm=1)
+
+    def bad_read(path):
+        raise ValueError("not a PDF")
+
+    out = run_with_timeout(lambda: list(prefetch_pdfs([good, good], read=bad_read)))
+    assert [(x[1], type(x[2])) for x in out.get('value')] == [(None, ValueError)] * 2
+
+
+def test_consumer_can_stop_early(tmp_path):
+    good = str(tmp_path / 'good.pdf')
+    make_proposal(good, n_stm=1)
+
+    def consume():
+        for p, data, err in prefetch_pdfs([good] * 10, n_ahead=1, read=ThrottledReader(latency=0.01)):
+            break
+        return True
+
+    assert run_with_timeout(consume).get('value') is True
@@ -0,0 +1,60 @@
+import os, sys, glob, subprocess
+
+import pandas as pd
+
+from shards import assign_shards, get_shard_csv, get_skipped_csv, write_skipped, merge_shards
+from conftest import make_proposal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_shard(tmp_path, shard, n, prop_nbs, skipped=None):
+    path = get_shard_csv(str(tmp_path / 'dapr_checks.csv'), shard, n)
+    pd.DataFrame({'Prop_Nb': prop_nbs, 'Flagged': False}).to_csv(path, index=False)
+    if skipped is not None:
+        write_skipped([(x, 'incomplete') for x in skipped], path)
+    return path
+
+
+def test_assignment_is_balanced_and_stable():
+    prop_nbs = [f'23-XRP23_2-{i:04d}' for i in range(40)]
+    pages = [10 + (7 * i) % 30 for i in range(40)]
+    shards = assign_shards(prop_nbs, pages, 4)
+    assert (assign_shards(prop_nbs[::-1], pages[::-1], 4)[::-1] == shards).all()
+    load = [sum(p for p, s in zip(pages, shards) if s == k) for k in range(1, 5)]
+    assert max(load) - min(load) <= max(pages)
+
+
+def test_skipped_file_name():
+    assert get_skipped_csv('out/dapr_checks_shard2of4.csv') == os.path.join('out', 'dapr_checks_skipped_shard2of4.csv')
+
+
+def test_merge_is_complete(tmp_path):
+    paths = [write_shard(tmp_path, 1, 2, ['B', 'C']), write_shard(tmp_path, 2, 2, ['A'])]
+    df, problems, skipped = merge_shards(paths, expected=['A', 'B', 'C'])
+    assert problems == [] and df['Prop_Nb'].tolist() == ['A', 'B', 'C'] and len(skipped) == 0
+
+
+def test_merge_finds_missing_shards_and_proposals(tmp_path):
+    paths = [write_shard(tmp_path, 1, 3, ['B', 'B'])]
+    df, problems, skipped = merge_shards(paths, expected=['A', 'B'])
+    assert problems == ["missing shard(s) [2, 3] of 3", "proposal(s) in more than one shard: ['B']", "proposal(s) without results: ['A']"]
+
+
+def test_skipped_proposals_are_not_missing(tmp_path):
+    paths = [write_shard(tmp_path, 1, 2, ['A'], skipped=['C']), write_shard(tmp_path, 2, 2, ['B'], skipped=[])]
+    paths += sorted(glob.glob(str(tmp_path / '*_skipped_shard*')))
+    df, problems, skipped = merge_shards(paths, expected=['A', 'B', 'C'])
+    assert problems == [] and skipped['Prop_Nb'].tolist() == ['C'] and df['Prop_Nb'].tolist() == ['A', 'B']
+
+
+def test_sharded_run_with_incomplete_proposal(proposal_dir):
+    make_proposal(str(proposal_dir / '23-XRP23_2-0004_Redacted.pdf'), n_stm=0, n_ref=0)
+    for i in [1, 2]:
+        subprocess.run([sys.executable, os.path.join(ROOT, 'check_roses_compliance.py'), '-q', '-s', f'{i}/2', '-o', f'out{i}.txt',
+                        '.', '_Redacted', 'pm.csv'], cwd=proposal_dir, check=True, capture_output=True)
+    df, problems, skipped = merge_shards(sorted(glob.glob(str(proposal_dir / 'dapr_checks_shard*of2.csv'))),
+                                         expected=[f'23-XRP23_2-000{i}' for i in range(1, 5)])
+    assert problems == []
+    assert df['Prop_Nb'].tolist() == ['23-XRP23_2-0001', '23-XRP23_2-0002', '23-XRP23_2-0003']
+    assert skipped['Prop_Nb'].tolist() == ['23-XRP23_2-0004']
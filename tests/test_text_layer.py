@@ -0,0 +1,36 @@
+import numpy as np
+
+from text_layer import normalize_text, raw_span, find_word
+
+
+def raw_of(t, w):
+    """ raw text of every hit of a normalized word """
+    s, offsets = normalize_text(t)
+    return [t[slice(*raw_span(offsets, a, b))] for a, b in find_word(s, w)]
+
+
+def test_normalized_forms():
+    assert normalize_text("The  Leav-\nitt\tgroup")[0] == "the leavitt group"
+    assert normalize_text("NASA-\nGoddard")[0] == "nasa-goddard"
+    assert normalize_text("ﬁrst Straße co­operation")[0] == "first strasse cooperation"
+    assert normalize_text("ＪＰＬ")[0] == "jpl"
+
+
+def test_offsets_point_at_raw_characters():
+    for t in ["The  Leav-\nitt\tgroup", "ﬁrst Straße", "NASA-\nGoddard and ＪＰＬ", "plain ascii text\n"]:
+        s, offsets = normalize_text(t)
+        assert len(offsets) == len(s) and np.all(np.diff(offsets) >= 0)
+        assert all(0 <= x < len(t) for x in offsets)
+
+
+def test_hits_map_back_to_raw_text():
+    assert raw_of("Work with Leav-\nitt and LEAVITT.", "leavitt") == ["Leav-\nitt", "LEAVITT"]
+    assert raw_of("the ﬁrst paper", "first") == ["ﬁrst"]
+    assert raw_of("at NASA-\nGoddard", "nasa-goddard") == ["NASA-\nGoddard"]
+    assert raw_of("ＪＰＬ team", "jpl") == ["ＪＰＬ"]
+
+
+def test_empty_span():
+    s, offsets = normalize_text("abc")
+    assert raw_span(offsets, 1, 1) == [1, 1]
+    assert raw_span(offsets, 3, 3) == [0, 0]
@@ -0,0 +1,50 @@
+from check_roses_compliance import triage_proposal
+from event_log import EventLog
+from conftest import make_proposal
+
+import fitz
+
+
+def triage(proposal_dir, name):
+    return triage_proposal(fitz.open(str(proposal_dir / name)), name.split('_Redacted')[0], str(proposal_dir / 'pm.csv'), output=EventLog())
+
+
+def test_name_on_stm_page_is_flagged(proposal_dir):
+    record = triage(proposal_dir, '23-XRP23_2-0001_Redacted.pdf')
+    assert (record['Flagged'], record['Stage'], record['Page']) == (True, 'STM', 12)
+
+
+def test_cover_pages_after_page_5_are_not_stm(proposal_dir):
+    ### TEAM MEMBER NAME ONLY ON THE SEVENTH COVER PAGE (E.G., A PERSONNEL LIST), NOT IN THE STM
+    make_proposal(str(proposal_dir / '23-XRP23_2-0001_Redacted.pdf'), n_cover=8, words=[f"STM page {i}" for i in range(15)])
+    d = fitz.open(str(proposal_dir / '23-XRP23_2-0001_Redacted.pdf'))
+    d[6].insert_text((50, 200), "Co-Investigator Leavitt", fontsize=11)
+    d.save(str(proposal_dir / 'cover.pdf'))
+    record = triage_proposal(fitz.open(str(proposal_dir / 'cover.pdf')), '23-XRP23_2-0001', str(proposal_dir / 'pm.csv'), output=EventLog())
+    assert record['Flagged'] == False
+
+
+def test_anonymized_pdf_is_read_from_the_first_page(proposal_dir):
+    make_proposal(str(proposal_dir / '23-XRP23_2-0002_Redacted.pdf'), n_cover=0, n_budget=0, team_word='Sagan')
+    record = triage(proposal_dir, '23-XRP23_2-0002_Redacted.pdf')
+    assert (record['Flagged'], record['Stage'], record['Page']) == (True, 'STM', 4)
+    ### PAGES 1-5, THEN PAGES 6-16 LOOKING FOR AN NSPIRES BUDGET SECTION
+    assert record['Pages_Read'] == 16
+
+
+def test_reference_in_stm_text_does_not_end_the_stm(proposal_dir):
+    ### "REFERENCE" AT THE TOP OF THE SECOND STM PAGE, TEAM MEMBER NAME ON THE FIFTH
+    words = [f"STM page {i}" for i in range(15)]
+    words[1] = "In the inertial reference frame the orbit precesses."
+    words[4] = "As shown by Leavitt, the period grows with luminosity."
+    make_proposal(str(proposal_dir / '23-XRP23_2-0001_Redacted.pdf'), words=words)
+    record = triage(proposal_dir, '23-XRP23_2-0001_Redacted.pdf')
+    assert (record['Flagged'], record['Stage'], record['Page']) == (True, 'STM', 13)
+
+
+def test_stm_scan_stops_at_the_page_limit(proposal_dir):
+    ### NO REFERENCES SECTION; THE NAME IS ON THE FIRST PAGE AFTER THE 15 STM PAGES
+    make_proposal(str(proposal_dir / '23-XRP23_2-0001_Redacted.pdf'), n_stm=16, n_ref=0,
+                  words=[f"STM page {i}" for i in range(15)] + ["Leavitt"])
+    record = triage(proposal_dir, '23-XRP23_2-0001_Redacted.pdf')
+    assert record['Flagged'] == False and record['Pages_Read'] == 8 + 15
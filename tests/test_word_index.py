@@ -0,0 +1,30 @@
+import os, ast
+
+import pandas as pd
+
+from word_index import new_index, index_proposal, query_index, load_index, rescreen_index
+from text_layer import normalize_text, find_word
+from check_roses_compliance import norm_word
+from test_check_roses_compliance import run_check
+
+PAGES = ["Work with NASA-Goddard and the Leav-\nitt group.",
+         "NASA  Goddard\nSpace Flight Center; the ﬁrst Leavitt paper.",
+         "nasa_goddard, St. Louis and St Louis, LEAVITT's data."]
+
+
+def test_index_finds_words_on_the_pages_the_check_finds_them():
+    index = new_index()
+    index_proposal(index, '23-XRP23_2-0001', {i: normalize_text(t)[0] for i, t in enumerate(PAGES)})
+    for phrase in ['NASA Goddard', 'NASA-Goddard', 'nasa', 'Goddard Space Flight Center', 'Leavitt', 'first', 'St. Louis', 'St Louis']:
+        check = [i for i, t in enumerate(PAGES) if find_word(normalize_text(t)[0], norm_word(phrase))]
+        assert [x[1] for x in query_index(index, phrase)] == check, phrase
+
+
+def test_rescreen_matches_the_check(proposal_dir):
+    assert run_check(proposal_dir, '-i', 'index.pkl').returncode == 0
+    index = load_index(str(proposal_dir / 'index.pkl'))
+    df = pd.read_csv(proposal_dir / 'dapr_checks.csv')
+    dfr = rescreen_index(index, str(proposal_dir / 'pm.csv'), output=open(os.devnull, 'w'))
+    for (_, row), (_, rowr) in zip(df.iterrows(), dfr.iterrows()):
+        found = [(w, p) for w, p in zip(ast.literal_eval(row['DAPR_Words']), ast.literal_eval(row['DAPR_Word_Pages'])) if w not in ['he', 'she']]
+        assert len(found) > 0 and sorted(found) == sorted(zip(rowr['DAPR_Words'], rowr['DAPR_Word_Pages']))
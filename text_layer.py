@@ -0,0 +1,159 @@
+"""Normalized text layer with an offset map back to the raw page text
+
+All keyword and word matchers read page text in one canonical form:
+
+    NFKC          ligatures and compatibility forms (e.g., "ﬁ" -> "fi", full-width letters)
+    casefold      case-insensitive matching ("ß" -> "ss"; plain lower() for ASCII)
+    de-hyphenate  words split across lines ("Leav-\\nitt" -> "leavitt") and soft hyphens;
+                  a line-end hyphen before a capital letter is kept as a hyphen
+                  ("NASA-\\nGoddard" -> "nasa-goddard")
+    whitespace    every run of whitespace (including line breaks) -> one space
+
+Each page is normalized once (check_roses_compliance.get_norm_text caches it with
+the page). The offset map gives, for every normalized character, the position of
+the raw character it came from, so a hit found in the normalized text is reported
+at its raw text position (and turned into a box on the page).
+
+A word is a run of word characters of the normalized text. check_dapr_words
+(find_word) and the word index (get_words, get_word_grams) both use this
+definition, so the index finds a team word on the same pages as the check.
+
+"""
+
+
+import re, unicodedata
+import numpy as np
+
+
+### NON-ASCII CHARACTERS (NORMALIZED ONE BY ONE; ASCII RUNS ONLY NEED lower())
+_NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+### LINE-END HYPHEN BETWEEN LETTERS, SOFT HYPHENS, AND WHITESPACE RUNS
+_JOINS = re.compile(r'(?<=[^\W\d_])[-\u00ad][ \t]*\n\s*(?=[^\W\d_])|\u00ad|\s+')
+
+### NORMALIZED FORM OF EACH NON-ASCII CHARACTER SEEN (SHARED BY ALL PAGES)
+_char_cache = {}
+
+
+def _norm_char(c):
+    n = _char_cache.get(c)
+    if n is None:
+        n = _char_cache[c] = unicodedata.normalize('NFKC', c).casefold()
+    return n
+
+
+def normalize_text(t):
+
+    """
+    PURPOSE:    normalize page text (NFKC, casefold, de-hyphenate, collapse whitespace)
+
+    INPUTS:     t = raw page text
+
+    OUTPUTS:    s = normalized text
+                offsets = raw text position of each character of s (numpy int32 array)
+    """
+
+    ### 1. NFKC + CASEFOLD (CHARACTERS MAY EXPAND, E.G. LIGATURES; EACH PIECE POINTS TO ITS RAW CHARACTER)
+    if t.isascii():
+        s, offsets = t.lower(), np.arange(len(t), dtype=np.int32)
+    else:
+        pieces, offs, k = [], [], 0
+        for m in _NON_ASCII.finditer(t):
+            pieces.append(t[k:m.start()].lower())
+            offs.append(np.arange(k, m.start(), dtype=np.int32))
+            n = _norm_char(m.group(0))
+            pieces.append(n)
+            offs.append(np.full(len(n), m.start(), dtype=np.int32))
+            k = m.end()
+        pieces.append(t[k:].lower())
+        offs.append(np.arange(k, len(t), dtype=np.int32))
+        s, offsets = ''.join(pieces), np.concatenate(offs)
+
+    ### 2. DE-HYPHENATE AND COLLAPSE WHITESPACE (KEEP ONE SPACE PER RUN; KEEP HYPHEN BEFORE CAPITALS)
+    pieces, keep, k = [], [], 0
+    for m in _JOINS.finditer(s):
+        pieces.append(s[k:m.start()])
+        keep.append(np.arange(k, m.start()))
+        g = m.group(0)
+        if g[0].isspace():
+            pieces.append(' ')
+            keep.append([m.start()])
+        elif (g[0] == '-') and not t[offsets[m.end()]].islower():
+            pieces.append('-')
+            keep.append([m.start()])
+        k = m.end()
+    pieces.append(s[k:])
+    keep.append(np.arange(k, len(s)))
+
+    return ''.join(pieces), offsets[np.concatenate(keep).astype(int)]
+
+
+def raw_span(offsets, a, b):
+
+    """
+    PURPOSE:    raw text span of a span of the normalized text
+
+    INPUTS:     offsets = offset map from normalize_text
+                a, b = start and end of the span in the normalized text
+
+    OUTPUTS:    span = [start, end] in the raw text
+    """
+
+    if b <= a:
+        return [int(offsets[a]), int(offsets[a])] if a < len(offsets) else [0, 0]
+
+    return [int(offsets[a]), int(offsets[b - 1]) + 1]
+
+
+### WORDS OF THE NORMALIZED TEXT: THE RUNS OF WORD CHARACTERS THAT \b DELIMITS
+_WORD = re.compile(r'\w+')
+
+
+def find_word(s, w):
+
+    """
+    PURPOSE:    find a normalized word or phrase as whole words in normalized text
+
+    INPUTS:     s = normalized text (normalize_text)
+                w = normalized word or phrase
+
+    OUTPUTS:    spans = list of [start, end] in s
+    """
+
+    return [[m.start(), m.end()] for m in re.finditer(r'\b' + re.escape(w) + r'\b', s)]
+
+
+def get_words(s):
+
+    """
+    PURPOSE:    split normalized text into words
+
+    INPUTS:     s = normalized text (normalize_text)
+
+    OUTPUTS:    words = list of words
+    """
+
+    return _WORD.findall(s)
+
+
+def get_word_grams(s, ngram):
+
+    """
+    PURPOSE:    count the runs of 1 to ngram consecutive words in normalized text, each kept
+                with the text between its words (so a run is counted where find_word finds it)
+
+    INPUTS:     s = normalized text (normalize_text)
+                ngram = longest run of words
+
+    OUTPUTS:    counts = dictionary of run -> count
+    """
+
+    spans = [m.span() for m in _WORD.finditer(s)]
+
+    counts = {}
+    for n in range(1, ngram + 1):
+        for k in range(len(spans) - n + 1):
+            gram = s[spans[k][0]:spans[k+n-1][1]]
+            counts[gram] = counts.get(gram, 0) + 1
+
+    return counts
@@ -0,0 +1,257 @@
+"""Solicitation-wide inverted word index for re-screening proposals without re-extraction
+
+The batch runner (check_roses_compliance.py --index) adds every proposal's DAPR
+search pages (STM onward plus the project summary page, excluding references) to
+a persistent index of words and short runs of words of the normalized page text
+that check_dapr_words searches (see text_layer.py), so the index finds a team
+word on the same pages as the check. Re-screening against
+an updated Proposal Master, or a one-off query, is then an index lookup.
+
+Example:
+
+python word_index.py query word_index.pkl "goddard space flight"
+python word_index.py rescreen word_index.pkl proposals.csv -o dapr_rescreen.csv
+
+"""
+
+
+import sys, os, pickle
+import numpy as np
+import pandas as pd
+import argparse
+
+from text_layer import normalize_text, get_words, get_word_grams
+
+
+### LONGEST N-GRAM STORED IN THE INDEX
+### (LONGER PHRASES ARE MATCHED BY INTERSECTING THEIR N-GRAMS)
+INDEX_NGRAM = 3
+INDEX_VERSION = 2
+
+
+def get_tokens(t):
+
+    """
+    PURPOSE:    split text into the words of its normalized form (see text_layer.py)
+
+    INPUTS:     t = text
+
+    OUTPUTS:    tokens = list of tokens
+    """
+
+    return get_words(normalize_text(t)[0])
+
+
+def new_index(ngram=INDEX_NGRAM):
+
+    """
+    PURPOSE:    make an empty word index
+
+    INPUTS:     ngram = longest n-gram to store (int)
+
+    OUTPUTS:    index = word index (dictionary)
+    """
+
+    return {'version': INDEX_VERSION, 'ngram': ngram, 'proposals': {}, 'postings': {}}
+
+
+def load_index(index_path):
+
+    """
+    PURPOSE:    load word index from disk (or make a new one if it does not exist yet)
+
+    INPUTS:     index_path = path to word index
+
+    OUTPUTS:    index = word index (dictionary)
+    """
+
+    if not os.path.isfile(index_path):
+        return new_index()
+
+    with open(index_path, 'rb') as f:
+        index = pickle.load(f)
+
+    if index.get('version') != INDEX_VERSION:
+        print(f"\n\tWord index {index_path} has an unknown version, starting a new one")
+        return new_index()
+
+    return index
+
+
+def save_index(index, index_path):
+
+    """
+    PURPOSE:    write word index to disk
+
+    INPUTS:     index = word index (dictionary)
+                index_path = path to word index
+    """
+
+    ### WRITE TO TEMPORARY FILE FIRST SO AN INTERRUPTED RUN DOES NOT CORRUPT THE INDEX
+    with open(index_path + '.tmp', 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(index_path + '.tmp', index_path)
+
+
+def remove_proposal(index, prop_nb):
+
+    """
+    PURPOSE:    remove a proposal from the word index (e.g., before re-indexing it)
+
+    INPUTS:     index = word index (dictionary)
+                prop_nb = proposal number
+    """
+
+    if prop_nb not in index['proposals']:
+        return
+
+    postings = index['postings']
+    for gram in index['proposals'][prop_nb]['grams']:
+        postings[gram].pop(prop_nb, None)
+        if len(postings[gram]) == 0:
+            del postings[gram]
+    del index['proposals'][prop_nb]
+
+
+def index_proposal(index, prop_nb, page_texts, pjs_pages=()):
+
+    """
+    PURPOSE:    add the DAPR search pages of one proposal to the word index
+
+    INPUTS:     index = word index (dictionary)
+                prop_nb = proposal number
+                page_texts = dictionary of page number -> normalized page text (get_norm_text)
+                pjs_pages = pages with the NSPIRES project summary
+    """
+
+    remove_proposal(index, prop_nb)
+
+    ### COUNT N-GRAMS PER PAGE
+    postings, ngram = index['postings'], index['ngram']
+    grams_all = set()
+    for pg, t in page_texts.items():
+        counts = get_word_grams(t, ngram)
+        for gram, c in counts.items():
+            postings.setdefault(gram, {}).setdefault(prop_nb, {})[int(pg)] = c
+        grams_all.update(counts)
+
+    index['proposals'][prop_nb] = {'pages': sorted(int(x) for x in page_texts),
+                                   'pjs_pages': sorted(set(int(x) for x in pjs_pages)),
+                                   'grams': grams_all}
+
+
+def query_index(index, phrase, prop_nbs=None):
+
+    """
+    PURPOSE:    look up a word or phrase in the word index
+
+    INPUTS:     index = word index (dictionary)
+                phrase = word or phrase to look up
+                prop_nbs [optional] = only return hits for these proposals
+
+    OUTPUTS:    hits = list of (proposal number, page, count), sorted by proposal and page
+                       (for phrases longer than the stored n-grams, pages must contain every
+                       n-gram of the phrase and count is an upper bound)
+    """
+
+    ### NORMALIZE LIKE THE PAGE TEXT AND SPLIT INTO (OVERLAPPING) N-GRAMS THAT ARE STORED IN THE INDEX
+    ### (THE TEXT BETWEEN THE WORDS IS PART OF AN N-GRAM, SO "NASA-GODDARD" DOES NOT MATCH "NASA GODDARD")
+    s = normalize_text(str(phrase))[0]
+    n = min(len(get_words(s)), index['ngram'])
+    if n == 0:
+        return []
+    grams = [x for x in get_word_grams(s, n) if len(get_words(x)) == n]
+
+    ### INTERSECT POSTINGS OF ALL N-GRAMS
+    hits = None
+    for gram in grams:
+        post = index['postings'].get(gram, {})
+        if prop_nbs is not None:
+            post = {p: post[p] for p in prop_nbs if p in post}
+        found = {(p, pg): c for p, pgs in post.items() for pg, c in pgs.items()}
+        if hits is None:
+            hits = found
+        else:
+            hits = {k: min(c, found[k]) for k, c in hits.items() if k in found}
+        if len(hits) == 0:
+            return []
+
+    return sorted((p, pg, c) for (p, pg), c in hits.items())
+
+
+def rescreen_index(index, ps_file, output=None):
+
+    """
+    PURPOSE:    re-check DAPR team words (names, organizations, PI city) of every indexed
+                proposal against a (possibly updated) Proposal Master, using only the index
+                (gender pronouns are not re-checked since they do not depend on the team list)
+
+    INPUTS:     index = word index (dictionary)
+                ps_file = path to Proposal Master
+                output [optional] = if provided, print statements will be written to this file
+
+    OUTPUTS:    df = DataFrame with the DAPR words, counts and pages (1-indexed) per proposal
+    """
+
+    from check_roses_compliance import load_proposal_master, get_team_info
+
+    dfp, colnames = load_proposal_master(ps_file)
+
+    Prop_Nb_All, TMN_All, DW_All, DWC_All, DWP_All = [], [], [], [], []
+    for prop_nb in sorted(index['proposals']):
+
+        print(f'\n\t{prop_nb}', file=output)
+        pi_name, pi_orgs, pi_city = get_team_info(dfp, colnames, prop_nb)
+        dw = np.unique(pi_orgs + pi_name + pi_city).tolist()
+
+        pjs_pages = index['proposals'][prop_nb]['pjs_pages']
+        dww, dwc, dwp = [], [], []
+        for ival in dw:
+            for p, pg, c in query_index(index, ival, prop_nbs=[prop_nb]):
+                pjs = 'NSPIRES Project Summary on page' if pg in pjs_pages else ''
+                print(f'\t"{ival}" found {c} times {pjs} on page {pg+1}', file=output)
+                dww.append(ival)
+                dwc.append(c)
+                dwp.append(pg + 1)
+
+        Prop_Nb_All.append(prop_nb)
+        TMN_All.append(pi_name)
+        DW_All.append(dww)
+        DWC_All.append(dwc)
+        DWP_All.append(dwp)
+
+    d = {'Prop_Nb': Prop_Nb_All, 'Team Members': TMN_All,
+         'DAPR_Words': DW_All, 'DAPR_Word_Count': DWC_All, 'DAPR_Word_Pages': DWP_All}
+
+    return pd.DataFrame(data=d)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Query or re-screen a solicitation-wide DAPR word index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_q = subparsers.add_parser("query", help="list proposals and pages that mention a word or phrase")
+    parser_q.add_argument("Index_Path", type=str, help="path to word index written by check_roses_compliance.py --index")
+    parser_q.add_argument("Phrase", type=str, help="word or phrase to look up")
+
+    parser_r = subparsers.add_parser("rescreen", help="re-check team words of all indexed proposals against a Proposal Master")
+    parser_r.add_argument("Index_Path", type=str, help="path to word index written by check_roses_compliance.py --index")
+    parser_r.add_argument("PM_Path", type=str, help="path to Proposal Master report as Excel or .csv file")
+    parser_r.add_argument("-o", "--output", type=str, help="csv file to write results to", default='dapr_rescreen.csv')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.Index_Path):
+        print("\nNo word index found in path set by Index_Path\nQuitting program\n")
+        sys.exit()
+    Index = load_index(args.Index_Path)
+
+    if args.command == "query":
+        Hits = query_index(Index, args.Phrase)
+        print(f'\n\t"{args.Phrase}" found in {len(set(x[0] for x in Hits))} proposals\n')
+        for p, pg, c in Hits:
+            print(f'\t{p}\t{c} times on page {pg+1}')
+        print("")
+
+    if args.command == "rescreen":
+        rescreen_index(Index, args.PM_Path).to_csv(args.output, index=False)